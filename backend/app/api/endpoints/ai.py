@@ -1,24 +1,96 @@
 """
 AI 辅助功能 API 端点
 """
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, Field
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Query
+from pydantic import BaseModel, Field, root_validator
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 import asyncio
+import json
+import time
 
+from app.db.database import get_db
 from app.models.user import User
+from app.models.draft import Draft
+from app.models.ai_usage import AIUsage
 from app.core.deps import get_current_user
-from app.services.ai_service import stream_ai_response, call_ai
+from app.core.config import settings
+from app.core.metrics import AI_SSE_FIRST_FRAME_SECONDS, AI_CLIENT_DISCONNECTS_TOTAL
+from app.services.ai_service import (
+    stream_ai_response, stream_multi_action, stream_outline, call_ai, process_batch, upstream_router,
+    check_text_length
+)
+from app.services.ai_cache import ai_result_cache
+from app.services.ai_usage import prompt_cache_stats, usage_meter, usage_user
+from app.services.ai_limiter import ai_admission, AdmissionRejected, Permit
+from app.services.sse import (
+    coalesce_chunks, format_sse, encode_content, encode_error, CancellableStreamingResponse
+)
+from app.services.ai_stream_buffer import ai_stream_registry, BufferedStream, StreamExpired, StreamCapacityExceeded
+from app.services.outline_parser import outline_cache
 
 router = APIRouter()
 
 
 class AIRequest(BaseModel):
     """AI 请求模型"""
-    text: str = Field(..., description="要处理的文本", max_length=6000)
+    text: str = Field(..., description="要处理的文本（润色/翻译等操作超过 6000 字时自动分段并行处理，最多 AI_LONG_TEXT_MAX_CHARS 字；其余操作最多 6000 字）", max_length=settings.AI_LONG_TEXT_MAX_CHARS)
     action: str = Field(..., description="操作类型: polish/expand/condense/rewrite/continue/explain/translate_en/translate_zh/custom")
     custom_prompt: Optional[str] = Field(None, description="自定义 prompt（当 action 为 custom 时使用）")
+    draft_id: Optional[int] = Field(None, description="问答模式：text 为空时以该草稿全文为参考内容，并按草稿缓存检索索引")
+    coalesce_ms: Optional[int] = Field(None, ge=0, le=1000, description="流式输出时增量合并的最大等待毫秒数，0 表示不合并")
+    coalesce_bytes: Optional[int] = Field(None, ge=1, le=65536, description="流式输出时单帧最大字节数")
+    resumable: bool = Field(False, description="流式输出断开后是否继续生成 AI_STREAM_RESUME_GRACE 秒，等待客户端用 Last-Event-ID 续传；默认断开即取消上游")
+    
+    @root_validator(skip_on_failure=True)
+    def check_length(cls, values):
+        # 字段上的 max_length 是所有操作的上限，这里按操作检查，不支持分段的操作在准入前就返回 422
+        check_text_length(values["text"], values["action"])
+        return values
+
+
+class AIMultiRequest(BaseModel):
+    """多操作对比请求模型"""
+    text: str = Field(..., description="要处理的文本", max_length=settings.AI_LONG_TEXT_MAX_CHARS)
+    actions: List[str] = Field(..., min_items=1, max_items=settings.AI_MULTI_MAX_ACTIONS, description="要同时执行的操作类型")
+    custom_prompt: Optional[str] = Field(None, description="自定义 prompt（actions 包含 custom 时使用）")
+    coalesce_ms: Optional[int] = Field(None, ge=0, le=1000, description="增量合并的最大等待毫秒数，0 表示不合并")
+    coalesce_bytes: Optional[int] = Field(None, ge=1, le=65536, description="单帧最大字节数")
+    
+    @root_validator(skip_on_failure=True)
+    def check_length(cls, values):
+        for action in values["actions"]:
+            check_text_length(values["text"], action)
+        return values
+
+
+class AIOutlineRequest(BaseModel):
+    """结构化大纲生成请求模型"""
+    topic: str = Field(..., min_length=1, max_length=500, description="报告主题")
+    report_type: str = Field("通用报告", max_length=50, description="报告类型")
+    audience: str = Field("一般读者", max_length=50, description="目标受众")
+    additional_requirements: str = Field("", max_length=2000, description="其他要求")
+    refresh: bool = Field(False, description="忽略已缓存的大纲重新生成")
+
+
+class AIBatchItem(BaseModel):
+    """批量请求中的单项"""
+    id: str = Field(..., description="调用方指定的标识，结果中原样返回")
+    text: str = Field(..., description="要处理的文本", max_length=settings.AI_LONG_TEXT_MAX_CHARS)
+    action: str = Field(..., description="操作类型")
+    custom_prompt: Optional[str] = Field(None, description="自定义 prompt（当 action 为 custom 时使用）")
+    
+    @root_validator(skip_on_failure=True)
+    def check_length(cls, values):
+        check_text_length(values["text"], values["action"])
+        return values
+
+
+class AIBatchRequest(BaseModel):
+    """批量 AI 请求模型"""
+    items: List[AIBatchItem] = Field(..., min_items=1, max_items=settings.AI_BATCH_MAX_ITEMS)
 
 
 class AIResponse(BaseModel):
@@ -28,55 +100,430 @@ class AIResponse(BaseModel):
     action: str
 
 
+async def admit_ai_request(user_id: int) -> Permit:
+    """申请 AI 调用的并发槽位，未被准入时返回 429 和 Retry-After"""
+    try:
+        return await ai_admission.acquire(user_id)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+def resolve_ask_context(request: AIRequest, user: User, db: Session) -> Tuple[str, Optional[str]]:
+    """
+    确定问答模式的参考内容
+    未提供参考文本但指定了草稿时使用草稿全文，返回 (参考内容, 检索索引缓存键)
+    """
+    if request.action != "ask" or request.draft_id is None or request.text.strip():
+        return request.text, None
+    draft = db.query(Draft).filter(
+        Draft.id == request.draft_id,
+        Draft.user_id == user.id
+    ).first()
+    if not draft:
+        raise HTTPException(status_code=404, detail="草稿不存在")
+    return draft.content or "", f"draft:{draft.id}"
+
+
 @router.post("/process", response_model=AIResponse)
 async def process_text(
     request: AIRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """
     处理文本（非流式）
     适用于短文本的快速处理
     """
+    text, context_key = resolve_ask_context(request, current_user, db)
+    usage_user.set(current_user.id)
+    permit = await admit_ai_request(current_user.id)
+    async with permit:
+        try:
+            result = await call_ai(text, request.action, request.custom_prompt, context_key)
+            return AIResponse(success=True, result=result, action=request.action)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"AI 处理失败: {str(e)}")
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"
+}
+
+
+def stream_events_response(
+    stream: BufferedStream,
+    action: str,
+    after_seq: int = 0,
+    started: Optional[float] = None
+) -> CancellableStreamingResponse:
+    """
+    把可续传流输出为 SSE 响应
+    每帧带 id "<流ID>:<序号>"，客户端重连时作为 Last-Event-ID 传回即可续传
+    """
+    async def generate():
+        first_frame = started is not None
+        last_seq = after_seq
+        frames = ai_stream_registry.follow(stream, after_seq)
+        try:
+            async for seq, content in frames:
+                if first_frame:
+                    AI_SSE_FIRST_FRAME_SECONDS.labels(action).observe(time.perf_counter() - started)
+                    first_frame = False
+                last_seq = seq
+                # SSE 格式，内容编码为 JSON：{"content": "..."}
+                yield format_sse(encode_content(content), event_id=stream.event_id(seq))
+            yield format_sse("[DONE]", event_id=stream.event_id(last_seq))
+        except (ValueError, StreamExpired) as e:
+            yield format_sse(encode_error(str(e)))
+        except Exception as e:
+            yield format_sse(encode_error(f"AI 处理失败: {str(e)}"))
+        finally:
+            # 显式关闭生成器；最后一个读者断开后，不可续传的流立即取消上游调用，
+            # 可续传的流在等待期内没有重连才取消
+            await frames.aclose()
+    
+    return CancellableStreamingResponse(
+        generate(),
+        on_disconnect=lambda: AI_CLIENT_DISCONNECTS_TOTAL.labels("stream", action).inc(),
+        media_type="text/event-stream",
+        headers={**SSE_HEADERS, "X-Stream-Id": stream.id}
+    )
+
+
+def resolve_stream(last_event_id: str, user_id: int):
+    """解析 Last-Event-ID，流不存在或已过期时返回 410"""
     try:
-        result = await call_ai(request.text, request.action, request.custom_prompt)
-        return AIResponse(success=True, result=result, action=request.action)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"AI 处理失败: {str(e)}")
+        return ai_stream_registry.resolve(last_event_id, user_id)
+    except StreamExpired as e:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail=str(e))
 
 
 @router.post("/stream")
 async def stream_process_text(
     request: AIRequest,
-    current_user: User = Depends(get_current_user)
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """
     流式处理文本
-    返回 Server-Sent Events (SSE) 格式的流式响应
+    返回 Server-Sent Events (SSE) 格式的流式响应，
+    每帧为 JSON {"content": "..."}，相邻的小增量按时间窗口和字节数合并成一帧。
+    响应头 X-Stream-Id 为流 ID；携带 Last-Event-ID 请求时从断点续传，不会重新调用模型。
+    """
+    if last_event_id:
+        stream, after_seq = resolve_stream(last_event_id, current_user.id)
+        return stream_events_response(stream, request.action, after_seq)
+    
+    text, context_key = resolve_ask_context(request, current_user, db)
+    
+    # 在返回响应前完成准入，这样排队已满时能直接返回 429
+    usage_user.set(current_user.id)
+    permit = await admit_ai_request(current_user.id)
+    started = time.perf_counter()
+    
+    coalesce_ms = settings.AI_SSE_COALESCE_MS if request.coalesce_ms is None else request.coalesce_ms
+    coalesce_bytes = request.coalesce_bytes or settings.AI_SSE_COALESCE_BYTES
+    
+    # 生成在后台进行并写入缓冲区，并发槽位在生成结束时释放
+    try:
+        stream = ai_stream_registry.start(
+            current_user.id,
+            lambda: coalesce_chunks(
+                stream_ai_response(text, request.action, request.custom_prompt, context_key),
+                coalesce_ms / 1000,
+                coalesce_bytes
+            ),
+            on_finish=permit.release,
+            resumable=request.resumable
+        )
+    except StreamCapacityExceeded as e:
+        permit.release()
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    return stream_events_response(stream, request.action, started=started)
+
+
+@router.get("/stream/{stream_id}")
+async def resume_stream(
+    stream_id: str,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    after: Optional[int] = Query(None, ge=0, description="已收到的最后序号（无法设置请求头时使用）"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    续传或回放流
+    从 Last-Event-ID（或 after）之后继续输出；都不提供时从头回放。生成未结束时继续跟随实时输出。
+    """
+    if last_event_id and last_event_id.startswith(f"{stream_id}:"):
+        stream, after_seq = resolve_stream(last_event_id, current_user.id)
+    else:
+        stream, after_seq = resolve_stream(f"{stream_id}:{after or 0}", current_user.id)
+    return stream_events_response(stream, "resume", after_seq)
+
+
+@router.delete("/stream/{stream_id}")
+async def cancel_stream(
+    stream_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """主动结束流（如用户关闭 AI 面板），立即取消上游生成"""
+    stream = ai_stream_registry.get(stream_id, current_user.id)
+    if not stream:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="流不存在或已过期")
+    ai_stream_registry.cancel(stream)
+    return {"message": "已取消"}
+
+
+@router.post("/stream/multi")
+async def stream_multi_action_text(
+    request: AIMultiRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    多操作流式对比
+    对同一段文本并发执行多个操作，在一个 SSE 连接上交错返回：
+    event: chunk  data: {"action": "...", "content": "..."}
+    event: done   data: {"action": "..."}
+    event: error  data: {"action": "...", "message": "..."}
+    全部操作结束后返回 data: [DONE]。每个操作各占一个并发槽位。
+    """
+    actions = list(dict.fromkeys(request.actions))
+    usage_user.set(current_user.id)
+    # 先为第一个操作申请槽位，容量已满时直接返回 429；其余操作在各自开始前排队
+    permits = [await admit_ai_request(current_user.id)]
+    started = time.perf_counter()
+    
+    coalesce_ms = settings.AI_SSE_COALESCE_MS if request.coalesce_ms is None else request.coalesce_ms
+    coalesce_bytes = request.coalesce_bytes or settings.AI_SSE_COALESCE_BYTES
+    
+    async def admitted(action: str, chunks):
+        permit = permits.pop() if permits else await ai_admission.acquire(current_user.id)
+        coalesced = coalesce_chunks(chunks, coalesce_ms / 1000, coalesce_bytes)
+        try:
+            async for chunk in coalesced:
+                yield chunk
+        finally:
+            await coalesced.aclose()
+            permit.release()
+    
+    async def generate():
+        first_frame = True
+        events = stream_multi_action(request.text, actions, request.custom_prompt, wrap=admitted)
+        try:
+            async for action, kind, payload in events:
+                if first_frame:
+                    AI_SSE_FIRST_FRAME_SECONDS.labels("multi").observe(time.perf_counter() - started)
+                    first_frame = False
+                if kind == "chunk":
+                    data = {"action": action, "content": payload}
+                elif kind == "error":
+                    data = {"action": action, "message": payload}
+                else:
+                    data = {"action": action}
+                yield format_sse(json.dumps(data, ensure_ascii=False), event=kind)
+            yield format_sse("[DONE]")
+        finally:
+            await events.aclose()
+            for permit in permits:
+                permit.release()
+    
+    return CancellableStreamingResponse(
+        generate(),
+        on_disconnect=lambda: AI_CLIENT_DISCONNECTS_TOTAL.labels("stream_multi", "multi").inc(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+@router.post("/stream/outline")
+async def stream_outline_structured(
+    request: AIOutlineRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    结构化大纲流
+    模型输出的 Markdown 大纲在服务端按行解析，每读完一行就返回一个事件：
+    event: node  data: {"id": 1, "parent": 0, "level": 1, "title": "..."}
+    event: text  data: {"id": 1, "text": "..."}（节点的说明文字，id 为 0 表示第一个标题之前的内容）
+    出错时返回 event: error  data: {"message": "..."}，结束时返回 data: [DONE]。
+    同一用户相同参数的大纲会被缓存并直接回放（不同用户之间不共用），refresh 为 true 时重新生成。
     """
+    params = json.dumps({
+        "topic": request.topic,
+        "report_type": request.report_type,
+        "audience": request.audience,
+        "additional_requirements": request.additional_requirements
+    }, ensure_ascii=False)
+    usage_user.set(current_user.id)
+    permit = await admit_ai_request(current_user.id)
+    started = time.perf_counter()
+    
     async def generate():
+        first_frame = True
+        events = stream_outline(params, current_user.id, request.refresh)
         try:
-            async for chunk in stream_ai_response(request.text, request.action, request.custom_prompt):
-                # SSE 格式
-                yield f"data: {chunk}\n\n"
-            yield "data: [DONE]\n\n"
+            async for kind, data in events:
+                if first_frame:
+                    AI_SSE_FIRST_FRAME_SECONDS.labels("outline").observe(time.perf_counter() - started)
+                    first_frame = False
+                yield format_sse(json.dumps(data, ensure_ascii=False), event=kind)
+            yield format_sse("[DONE]")
         except ValueError as e:
-            yield f"data: [ERROR] {str(e)}\n\n"
+            yield format_sse(json.dumps({"message": str(e)}, ensure_ascii=False), event="error")
         except Exception as e:
-            yield f"data: [ERROR] AI 处理失败: {str(e)}\n\n"
+            yield format_sse(json.dumps({"message": f"AI 处理失败: {str(e)}"}, ensure_ascii=False), event="error")
+        finally:
+            await events.aclose()
+            permit.release()
     
-    return StreamingResponse(
+    return CancellableStreamingResponse(
         generate(),
+        on_disconnect=lambda: AI_CLIENT_DISCONNECTS_TOTAL.labels("stream_outline", "outline").inc(),
         media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+@router.post("/batch")
+async def batch_process_text(
+    request: AIBatchRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    批量处理文本
+    各项并发处理，每完成一项就以 NDJSON（每行一个 JSON 对象）返回一行结果，
+    单项失败只影响该项（success 为 false 并带 error）。
+    整批按一次请求限流；每个正在处理的项各占一个并发槽位，不超过单用户并发上限。
+    """
+    usage_user.set(current_user.id)
+    permit = await admit_ai_request(current_user.id)
+    
+    async def generate():
+        outcomes = process_batch([item.dict() for item in request.items], settings.AI_BATCH_PARALLELISM)
+        try:
+            async for outcome in outcomes:
+                yield json.dumps(outcome, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时取消尚未完成的项
+            await outcomes.aclose()
+            permit.release()
+    
+    return CancellableStreamingResponse(
+        generate(),
+        on_disconnect=lambda: AI_CLIENT_DISCONNECTS_TOTAL.labels("batch", "batch").inc(),
+        media_type="application/x-ndjson",
         headers={
             "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
             "X-Accel-Buffering": "no"
         }
     )
 
 
+@router.get("/usage")
+async def get_usage(
+    days: int = Query(30, ge=1, le=365, description="统计最近多少天"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    获取当前用户的 AI token 用量
+    按操作和按天汇总，包含尚未写入数据库的部分
+    """
+    since = datetime.now() - timedelta(days=days)
+    sums = (
+        func.sum(AIUsage.calls),
+        func.sum(AIUsage.prompt_tokens),
+        func.sum(AIUsage.completion_tokens),
+        func.sum(AIUsage.cache_hit_tokens)
+    )
+    base = db.query(AIUsage).filter(
+        AIUsage.user_id == current_user.id,
+        AIUsage.period_start >= since
+    )
+    by_action = {
+        row[0]: [int(v or 0) for v in row[1:]]
+        for row in base.with_entities(AIUsage.action, *sums).group_by(AIUsage.action).all()
+    }
+    day = func.date(AIUsage.period_start)
+    by_day = {
+        str(row[0]): [int(v or 0) for v in row[1:]]
+        for row in base.with_entities(day, *sums).group_by(day).order_by(day).all()
+    }
+    
+    # 合并内存中尚未写入的用量
+    today = datetime.now().date().isoformat()
+    for action, values in usage_meter.pending_for(current_user.id).items():
+        for target in (by_action.setdefault(action, [0, 0, 0, 0]), by_day.setdefault(today, [0, 0, 0, 0])):
+            for i, value in enumerate(values):
+                target[i] += value
+    
+    def to_dict(values: List[int]) -> dict:
+        calls, prompt_tokens, completion_tokens, cache_hit_tokens = values
+        return {
+            "calls": calls,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cache_hit_tokens": cache_hit_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    
+    total = [sum(v[i] for v in by_action.values()) for i in range(4)]
+    return {
+        "days": days,
+        "total": to_dict(total),
+        "actions": {action: to_dict(values) for action, values in sorted(by_action.items())},
+        "daily": [{"date": date, **to_dict(values)} for date, values in sorted(by_day.items())]
+    }
+
+
+@router.get("/cache/stats")
+async def get_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取 AI 结果缓存的命中/未命中统计"""
+    return ai_result_cache.stats()
+
+
+@router.get("/outline-cache/stats")
+async def get_outline_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取结构化大纲缓存的命中统计"""
+    return outline_cache.stats()
+
+
+@router.get("/limits/stats")
+async def get_admission_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取 AI 准入控制的队列深度和等待时间统计"""
+    return ai_admission.stats()
+
+
+@router.get("/upstreams/stats")
+async def get_upstream_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取各上游端点的首 token 延迟、错误率、熔断状态和对冲请求统计"""
+    return upstream_router.stats()
+
+
+@router.get("/prompt-cache/stats")
+async def get_prompt_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取上游前缀缓存的命中情况（按操作统计命中/未命中的 prompt token 数和命中率）"""
+    return prompt_cache_stats.stats()
+
+
 @router.get("/actions")
 async def get_available_actions(
     current_user: User = Depends(get_current_user)
@@ -1,15 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Response
-from fastapi.responses import FileResponse as FastAPIFileResponse, RedirectResponse
+from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Tuple
+import asyncio
 import os
+import tempfile
 from app.db.database import get_db
 from app.models.user import User
-from app.models.file import FileType, File as FileModel
+from app.models.file import FileType
 from app.schemas.file import FileResponse, FileStatistics
-from app.services.file_service import save_upload_file, get_user_files, get_file_by_id, delete_file, get_file_statistics
+from app.services.file_service import save_upload_file, save_oss_upload_file, get_user_files, get_file_by_id, delete_file, get_file_statistics
 from app.services.oss_service import oss_service
+from app.services.docx_text import extract_docx_text
+from app.services.preview_cache import PreviewEntry, preview_cache, preview_key
+from app.core.config import settings
 from app.core.deps import get_current_user
+from app.core.file_response import RangeFileResponse
 
 router = APIRouter()
 
@@ -20,37 +26,24 @@ async def upload_file(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """上传文件到本地存储"""
+    """上传文件到本地存储（相同内容只保存一份）"""
     return await save_upload_file(file, file_type, current_user.id, db)
 
 @router.post("/upload-oss", response_model=FileResponse, status_code=status.HTTP_201_CREATED)
 async def upload_file_to_oss(
     file: UploadFile = File(...),
     file_type: FileType = Query(...),
+    resume_key: Optional[str] = Query(None, max_length=128, description="同一文件的稳定标识，上传中断后用相同的值重试时服务端跳过已上传到 OSS 的分片（客户端仍需重新发送完整文件）"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """上传文件到阿里云OSS"""
-    # 上传到OSS
-    oss_result = await oss_service.upload_file(file, current_user.id, file_type.value)
+    """
+    上传文件到阿里云OSS（大文件分片并发上传；相同内容只保存一份）
     
-    # 创建数据库记录 - file_type 需要转换为字符串值
-    db_file = FileModel(
-        filename=oss_result["original_filename"],
-        file_path=oss_result["oss_path"],  # 存储OSS路径
-        file_type=file_type.value if hasattr(file_type, 'value') else str(file_type),
-        file_size=oss_result["file_size"],
-        mime_type=oss_result["mime_type"],
-        user_id=current_user.id,
-        is_oss=True,
-        oss_path=oss_result["oss_path"],
-        oss_url=oss_result["file_url"]
-    )
-    
-    db.add(db_file)
-    db.commit()
-    db.refresh(db_file)
-    return db_file
+    断点续传只作用于服务器到 OSS 的分片上传：中断后用相同的 resume_key 重试，
+    OSS 上已存在且内容一致的分片不再上传，但客户端仍需重新发送完整文件。
+    """
+    return await save_oss_upload_file(file, file_type, current_user.id, db, resume_key)
 
 @router.get("/", response_model=List[FileResponse])
 def get_files(
@@ -84,13 +77,13 @@ def get_file(
         )
     return file
 
-@router.get("/{file_id}/download")
+@router.api_route("/{file_id}/download", methods=["GET", "HEAD"])
 def download_file(
     file_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """下载文件"""
+    """下载文件（本地文件支持 ETag/Last-Modified 条件请求和 Range 断点续传）"""
     file = get_file_by_id(db, file_id, current_user.id)
     if not file:
         raise HTTPException(
@@ -99,66 +92,88 @@ def download_file(
         )
 
     # 如果为 OSS 文件，返回签名URL重定向（浏览器将直接下载 OSS 文件）
+    # 签名 URL 在一个时间窗口内保持不变，重定向本身也允许浏览器缓存到窗口结束
     if file.is_oss:
         try:
             signed_url = oss_service.get_file_url(file.oss_path)
-            return RedirectResponse(url=signed_url, status_code=status.HTTP_302_FOUND)
+            return RedirectResponse(
+                url=signed_url,
+                status_code=status.HTTP_302_FOUND,
+                headers={"Cache-Control": f"private, max-age={oss_service.signed_url_max_age()}"}
+            )
         except HTTPException:
             raise
 
     # 本地文件下载
-    if not os.path.exists(file.file_path):
+    try:
+        stat_result = os.stat(file.file_path)
+    except OSError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="文件不存在"
         )
 
-    return FastAPIFileResponse(
+    return RangeFileResponse(
         path=file.file_path,
         filename=file.filename,
-        media_type=file.mime_type or "application/octet-stream"
+        media_type=file.mime_type or "application/octet-stream",
+        content_hash=file.content_hash,
+        stat_result=stat_result
     )
 
-def extract_docx_text(file_path: str) -> str:
-    """从 Word 文档中提取文本"""
-    try:
-        from zipfile import ZipFile
-        from xml.etree import ElementTree
-        
-        with ZipFile(file_path) as docx:
-            # Word 文档的主要内容在 word/document.xml 中
-            xml_content = docx.read('word/document.xml')
-            tree = ElementTree.fromstring(xml_content)
-            
-            # 定义命名空间
-            namespaces = {
-                'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
-            }
-            
-            # 提取所有文本
-            paragraphs = []
-            for para in tree.iter('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}p'):
-                texts = []
-                for text in para.iter('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t'):
-                    if text.text:
-                        texts.append(text.text)
-                if texts:
-                    paragraphs.append(''.join(texts))
-            
-            return '\n\n'.join(paragraphs)
-    except Exception as e:
-        raise Exception(f"无法读取 Word 文档: {str(e)}")
+async def _extract_preview_text(file, is_docx: bool, max_lines: int) -> Tuple[str, bool]:
+    """
+    提取预览文本（只提取略多于 PREVIEW_MAX_CHARS 的字数，用于判断是否截断）
+    
+    Returns:
+        (文本, 是否只按行数读取了开头部分)
+    """
+    if file.is_oss:
+        if is_docx:
+            # Word 文档需要完整下载（目录在 zip 末尾），写入内存、超过 PREVIEW_SPOOL_SIZE 时转存临时文件
+            with tempfile.SpooledTemporaryFile(max_size=settings.PREVIEW_SPOOL_SIZE) as tmp:
+                await oss_service.download_to(file.oss_path, tmp)
+                return await asyncio.to_thread(_extract_spooled_docx, tmp), False
+        # 文本文件：按 Range 只读取显示 max_lines 行所需的开头部分
+        text, eof = await oss_service.read_text_prefix(file.oss_path, settings.PREVIEW_MAX_CHARS, max_lines)
+        return text, not eof
+    
+    # 本地文件：存在性检查和读取都在线程中进行
+    text = await asyncio.to_thread(_read_local_preview, file.file_path, is_docx)
+    if text is None:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return text, False
+
+
+def _extract_spooled_docx(tmp) -> str:
+    tmp.seek(0)
+    return extract_docx_text(tmp, max_chars=settings.PREVIEW_MAX_CHARS)
+
+
+def _read_local_preview(path: str, is_docx: bool) -> Optional[str]:
+    """读取本地文件的预览文本，文件不存在时返回 None"""
+    if not os.path.exists(path):
+        return None
+    if is_docx:
+        return extract_docx_text(path, max_chars=settings.PREVIEW_MAX_CHARS)
+    return _read_text_head(path, settings.PREVIEW_MAX_CHARS + 1)
+
+
+def _read_text_head(path: str, max_chars: int) -> str:
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read(max_chars)
 
 
 @router.get("/{file_id}/preview")
-def preview_file(
+async def preview_file(
     file_id: int,
     max_lines: int = Query(default=500, description="最大预览行数"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """预览文件内容（支持文本类文件和 Word 文档）"""
-    file = get_file_by_id(db, file_id, current_user.id)
+    # 同步的数据库查询放到线程中执行，避免阻塞事件循环
+    file = await asyncio.to_thread(get_file_by_id, db, file_id, current_user.id)
     if not file:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -186,50 +201,27 @@ def preview_file(
         }
     
     try:
-        content = ""
-        
-        if file.is_oss:
-            # OSS文件：下载到临时文件
-            import requests
-            import tempfile
-            
-            signed_url = oss_service.get_file_url(file.oss_path)
-            response = requests.get(signed_url, timeout=30)
-            
-            if is_docx:
-                # Word 文档需要保存到临时文件
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp:
-                    tmp.write(response.content)
-                    tmp_path = tmp.name
-                try:
-                    content = extract_docx_text(tmp_path)
-                finally:
-                    os.unlink(tmp_path)
-            else:
-                response.encoding = 'utf-8'
-                content = response.text
-        else:
-            # 本地文件
-            if not os.path.exists(file.file_path):
-                raise HTTPException(status_code=404, detail="文件不存在")
-            
-            if is_docx:
-                # Word 文档
-                content = extract_docx_text(file.file_path)
-            else:
-                # 文本文件
-                with open(file.file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    lines = []
-                    for i, line in enumerate(f):
-                        if i >= max_lines:
-                            lines.append(f"\n... (文件过长，仅显示前 {max_lines} 行)")
-                            break
-                        lines.append(line)
-                    content = ''.join(lines)
+        # 同一内容只提取一次（内容相同的记录共用），之后直接从缓存截取前 max_lines 行；
+        # 缓存的只是开头部分且行数不够时重新读取
+        kind = "docx" if is_docx else "text"
+        key = await asyncio.to_thread(preview_key, file, kind)
+        entry = await asyncio.to_thread(preview_cache.get, key)
+        if entry is None or not entry.covers(max_lines):
+            text, partial = await _extract_preview_text(file, is_docx, max_lines)
+            entry = PreviewEntry.from_text(
+                text,
+                settings.PREVIEW_MAX_CHARS,
+                meta={"kind": kind, "file_size": file.file_size},
+                partial=partial
+            )
+            await asyncio.to_thread(preview_cache.put, key, entry)
         
-        # 限制内容长度
-        if len(content) > 100000:
-            content = content[:100000] + "\n... (内容过长，已截断)"
+        content, has_more = (entry.content, False) if is_docx else entry.head(max_lines)
+        if has_more:
+            content += f"\n... (文件过长，仅显示前 {max_lines} 行)"
+        elif entry.truncated:
+            # 限制内容长度
+            content += "\n... (内容过长，已截断)"
         
         return {
             "file_id": file_id,
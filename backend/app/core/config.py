@@ -1,4 +1,4 @@
-from pydantic import BaseSettings
+from pydantic import BaseSettings, validator
 from typing import Optional
 import os
 from dotenv import load_dotenv
@@ -19,6 +19,18 @@ class Settings(BaseSettings):
     # 文件存储配置
     UPLOAD_FOLDER: str = os.getenv("UPLOAD_FOLDER", "./uploads")
     MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", "10485760"))  # 10MB
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", "1048576"))  # 上传时每次读写的块大小，1MB
+    UPLOAD_FORM_OVERHEAD: int = int(os.getenv("UPLOAD_FORM_OVERHEAD", "65536"))  # 请求体中表单边界和字段头的余量
+    DOWNLOAD_CHUNK_SIZE: int = int(os.getenv("DOWNLOAD_CHUNK_SIZE", "1048576"))  # 服务器不支持 sendfile 时下载每次读取的块大小，1MB
+    
+    # 文件预览配置
+    PREVIEW_MAX_CHARS: int = int(os.getenv("PREVIEW_MAX_CHARS", "100000"))  # 预览最多返回的字数
+    PREVIEW_CACHE_MAX_ENTRIES: int = int(os.getenv("PREVIEW_CACHE_MAX_ENTRIES", "256"))
+    PREVIEW_CACHE_MAX_BYTES: int = int(os.getenv("PREVIEW_CACHE_MAX_BYTES", "67108864"))  # 64MB
+    PREVIEW_CACHE_DISK_ENABLED: bool = os.getenv("PREVIEW_CACHE_DISK_ENABLED", "True").lower() == "true"  # 磁盘层放在 UPLOAD_FOLDER/.preview-cache
+    PREVIEW_CACHE_DISK_MAX_ENTRIES: int = int(os.getenv("PREVIEW_CACHE_DISK_MAX_ENTRIES", "2000"))
+    PREVIEW_RANGE_SIZE: int = int(os.getenv("PREVIEW_RANGE_SIZE", "65536"))  # OSS 文本文件首次按 Range 读取的字节数，行数不够时加倍续读
+    PREVIEW_SPOOL_SIZE: int = int(os.getenv("PREVIEW_SPOOL_SIZE", "8388608"))  # 下载 Word 文档时超过 8MB 转存临时文件
     
     # 阿里云OSS配置
     # ⚠️ 生产环境必须在 .env 文件中设置这些值！
@@ -27,12 +39,105 @@ class Settings(BaseSettings):
     OSS_BUCKET_NAME: str = os.getenv("OSS_BUCKET_NAME", "")
     OSS_ENDPOINT: str = os.getenv("OSS_ENDPOINT", "oss-cn-hangzhou.aliyuncs.com")
     OSS_URL_PREFIX: str = os.getenv("OSS_URL_PREFIX", "")
+    OSS_MULTIPART_THRESHOLD: int = int(os.getenv("OSS_MULTIPART_THRESHOLD", "8388608"))  # 超过 8MB 使用分片上传
+    OSS_PART_SIZE: int = int(os.getenv("OSS_PART_SIZE", "5242880"))  # 分片大小 5MB（OSS 要求不小于 100KB）
+    OSS_UPLOAD_THREADS: int = int(os.getenv("OSS_UPLOAD_THREADS", "4"))  # 执行 OSS 调用的线程数
+    OSS_RESUME_DIR: str = os.getenv("OSS_RESUME_DIR", "")  # 断点记录目录，为空时放在 UPLOAD_FOLDER/.oss-resume
+    OSS_RESUME_TTL: int = int(os.getenv("OSS_RESUME_TTL", "86400"))  # 断点记录有效期（秒），过期后放弃已上传的分片
+    OSS_HTTP_MAX_CONNECTIONS: int = int(os.getenv("OSS_HTTP_MAX_CONNECTIONS", "20"))  # 读取对象（预览）共享连接池大小
+    OSS_HTTP_TIMEOUT: float = float(os.getenv("OSS_HTTP_TIMEOUT", "30"))
+    OSS_URL_EXPIRES: int = int(os.getenv("OSS_URL_EXPIRES", "3600"))  # 下载/预览签名 URL 的最短有效期（秒）
+    OSS_URL_ALIGN: int = int(os.getenv("OSS_URL_ALIGN", "300"))  # 签名 URL 过期时间对齐的粒度（秒），窗口内 URL 不变
+    OSS_URL_CACHE_SIZE: int = int(os.getenv("OSS_URL_CACHE_SIZE", "4096"))  # 缓存签名 URL 的对象数
+    
+    # AI 上游（DeepSeek）HTTP 连接池配置
+    AI_HTTP2: bool = os.getenv("AI_HTTP2", "False").lower() == "true"
+    AI_MAX_CONNECTIONS: int = int(os.getenv("AI_MAX_CONNECTIONS", "100"))
+    AI_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("AI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    AI_KEEPALIVE_EXPIRY: float = float(os.getenv("AI_KEEPALIVE_EXPIRY", "60"))
+    AI_CONNECT_TIMEOUT: float = float(os.getenv("AI_CONNECT_TIMEOUT", "10"))
+    AI_READ_TIMEOUT: float = float(os.getenv("AI_READ_TIMEOUT", "60"))
+    AI_POOL_TIMEOUT: float = float(os.getenv("AI_POOL_TIMEOUT", "10"))
+    AI_WARMUP_CONNECTIONS: int = int(os.getenv("AI_WARMUP_CONNECTIONS", "0"))  # 启动时预热的连接数，0 表示不预热
+    
+    # AI 结果缓存配置
+    AI_CACHE_ENABLED: bool = os.getenv("AI_CACHE_ENABLED", "True").lower() == "true"
+    AI_CACHE_ACTIONS: str = os.getenv("AI_CACHE_ACTIONS", "polish,translate_en,translate_zh,explain")
+    AI_CACHE_MAX_ENTRIES: int = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000"))
+    AI_CACHE_MAX_BYTES: int = int(os.getenv("AI_CACHE_MAX_BYTES", "33554432"))  # 32MB
+    AI_CACHE_TTL: int = int(os.getenv("AI_CACHE_TTL", "86400"))  # 秒
+    AI_CACHE_DISK_DIR: str = os.getenv("AI_CACHE_DISK_DIR", "")  # 为空表示不启用磁盘层
+    AI_CACHE_DISK_MAX_ENTRIES: int = int(os.getenv("AI_CACHE_DISK_MAX_ENTRIES", "10000"))
+    AI_CACHE_REPLAY_CHUNK_SIZE: int = int(os.getenv("AI_CACHE_REPLAY_CHUNK_SIZE", "64"))
+    
+    # AI 接口准入控制配置
+    AI_MAX_CONCURRENT: int = int(os.getenv("AI_MAX_CONCURRENT", "32"))
+    AI_MAX_CONCURRENT_PER_USER: int = int(os.getenv("AI_MAX_CONCURRENT_PER_USER", "3"))
+    AI_MAX_QUEUE: int = int(os.getenv("AI_MAX_QUEUE", "64"))
+    AI_QUEUE_TIMEOUT: float = float(os.getenv("AI_QUEUE_TIMEOUT", "30"))  # 秒
+    AI_USER_RATE: float = float(os.getenv("AI_USER_RATE", "1"))  # 每个用户每秒补充的请求数
+    AI_USER_BURST: int = int(os.getenv("AI_USER_BURST", "10"))  # 每个用户允许的突发请求数
+    
+    # 长文本分段并行处理配置
+    AI_LONG_TEXT_THRESHOLD: int = int(os.getenv("AI_LONG_TEXT_THRESHOLD", "6000"))  # 超过该长度启用分段处理
+    AI_LONG_TEXT_MAX_CHARS: int = int(os.getenv("AI_LONG_TEXT_MAX_CHARS", "60000"))  # 长文本模式允许的最大长度
+    AI_LONG_TEXT_CHUNK_CHARS: int = int(os.getenv("AI_LONG_TEXT_CHUNK_CHARS", "2000"))
+    AI_LONG_TEXT_PARALLELISM: int = int(os.getenv("AI_LONG_TEXT_PARALLELISM", "4"))
+    
+    # 批量处理配置
+    AI_BATCH_MAX_ITEMS: int = int(os.getenv("AI_BATCH_MAX_ITEMS", "100"))
+    AI_BATCH_PARALLELISM: int = int(os.getenv("AI_BATCH_PARALLELISM", "4"))
+    AI_MULTI_MAX_ACTIONS: int = int(os.getenv("AI_MULTI_MAX_ACTIONS", "4"))  # 多操作对比一次最多的操作数
+    AI_OUTLINE_CACHE_SIZE: int = int(os.getenv("AI_OUTLINE_CACHE_SIZE", "256"))  # 缓存的解析后大纲数，0 表示不缓存
+    AI_OUTLINE_CACHE_TTL: int = int(os.getenv("AI_OUTLINE_CACHE_TTL", "3600"))  # 秒
+    
+    # SSE 帧合并配置（可被单个请求覆盖）
+    AI_SSE_COALESCE_MS: int = int(os.getenv("AI_SSE_COALESCE_MS", "50"))  # 0 表示不合并
+    AI_SSE_COALESCE_BYTES: int = int(os.getenv("AI_SSE_COALESCE_BYTES", "1024"))
+    
+    # 可续传流配置
+    AI_STREAM_BUFFER_MAX_STREAMS: int = int(os.getenv("AI_STREAM_BUFFER_MAX_STREAMS", "1000"))
+    AI_STREAM_BUFFER_MAX_FRAMES: int = int(os.getenv("AI_STREAM_BUFFER_MAX_FRAMES", "2000"))  # 每个流缓冲的最大帧数
+    AI_STREAM_BUFFER_TTL: int = int(os.getenv("AI_STREAM_BUFFER_TTL", "300"))  # 生成结束后保留的秒数
+    AI_STREAM_RESUME_GRACE: float = float(os.getenv("AI_STREAM_RESUME_GRACE", "15"))  # 断开后等待重连的秒数
+    AI_STREAM_ATTACH_TIMEOUT: float = float(os.getenv("AI_STREAM_ATTACH_TIMEOUT", "10"))  # 创建后等待第一个读者的秒数
+    
+    # 上游路由配置（为空时只使用 DEEPSEEK_API_BASE + DEEPSEEK_API_KEY）
+    AI_UPSTREAMS: str = os.getenv("AI_UPSTREAMS", "")  # JSON 数组：[{"name", "base_url", "api_key", "model"}]
+    AI_UPSTREAM_MAX_ATTEMPTS: int = int(os.getenv("AI_UPSTREAM_MAX_ATTEMPTS", "2"))  # 首 token 前失败时最多尝试的端点数
+    AI_ROUTER_EWMA_ALPHA: float = float(os.getenv("AI_ROUTER_EWMA_ALPHA", "0.2"))
+    AI_CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("AI_CIRCUIT_FAILURE_THRESHOLD", "5"))  # 连续失败多少次熔断
+    AI_CIRCUIT_OPEN_SECONDS: float = float(os.getenv("AI_CIRCUIT_OPEN_SECONDS", "30"))
+    AI_HEDGE_ENABLED: bool = os.getenv("AI_HEDGE_ENABLED", "True").lower() == "true"
+    AI_HEDGE_PERCENTILE: float = float(os.getenv("AI_HEDGE_PERCENTILE", "95"))
+    AI_HEDGE_MIN_SAMPLES: int = int(os.getenv("AI_HEDGE_MIN_SAMPLES", "20"))  # 样本不足时使用默认延迟
+    AI_HEDGE_DEFAULT_DELAY: float = float(os.getenv("AI_HEDGE_DEFAULT_DELAY", "3"))
+    AI_HEDGE_MIN_DELAY: float = float(os.getenv("AI_HEDGE_MIN_DELAY", "0.2"))
+    AI_HEDGE_MAX_DELAY: float = float(os.getenv("AI_HEDGE_MAX_DELAY", "10"))
+    
+    # 问答模式参考内容检索配置
+    AI_ASK_CONTEXT_TOKENS: int = int(os.getenv("AI_ASK_CONTEXT_TOKENS", "3000"))  # 参考内容的 token 预算
+    AI_ASK_TOP_K: int = int(os.getenv("AI_ASK_TOP_K", "8"))
+    AI_ASK_PASSAGE_CHARS: int = int(os.getenv("AI_ASK_PASSAGE_CHARS", "500"))
+    AI_ASK_INDEX_CACHE_SIZE: int = int(os.getenv("AI_ASK_INDEX_CACHE_SIZE", "128"))
+    
+    # AI 用量计量配置
+    AI_USAGE_ENABLED: bool = os.getenv("AI_USAGE_ENABLED", "True").lower() == "true"
+    AI_USAGE_FLUSH_INTERVAL: float = float(os.getenv("AI_USAGE_FLUSH_INTERVAL", "60"))  # 批量写入间隔（秒）
     
     # 服务器配置
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
     
+    @validator("AI_LONG_TEXT_CHUNK_CHARS")
+    def check_long_text_chunk(cls, value, values):
+        # 片段长度不小于阈值时，片段本身又会被判定为长文本
+        threshold = values.get("AI_LONG_TEXT_THRESHOLD")
+        if threshold is not None and value >= threshold:
+            raise ValueError("AI_LONG_TEXT_CHUNK_CHARS 必须小于 AI_LONG_TEXT_THRESHOLD")
+        return value
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -0,0 +1,278 @@
+"""
+本地文件下载响应
+在 Starlette FileResponse 的基础上增加：
+- 基于内容 SHA-256 的强 ETag 和 Last-Modified，If-None-Match / If-Modified-Since 命中时返回 304
+- Range 请求：单个范围返回 206，多个范围返回 multipart/byteranges；If-Range 不匹配时返回完整文件
+- 服务器支持 ASGI zerocopy / pathsend 扩展时交给服务器用 sendfile 发送，
+  否则在线程中按 DOWNLOAD_CHUNK_SIZE 大块读取，并在客户端断开时停止读取
+"""
+import os
+import asyncio
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from functools import partial
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+from app.core.config import settings
+
+# 合并后仍超过这个数量的多范围请求按完整文件返回（避免大量碎片范围放大开销）
+MAX_RANGES = 16
+
+ByteRange = Tuple[int, int]
+
+
+def parse_range_header(value: str, size: int) -> Optional[List[ByteRange]]:
+    """
+    解析 Range 头，返回按起点排序、合并了重叠和相邻部分的闭区间列表
+
+    格式无效或不是 bytes 单位时返回 None（忽略 Range，返回完整文件）；
+    所有范围都超出文件末尾时返回空列表（416）。
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip() or size == 0:
+        return None
+
+    ranges: List[ByteRange] = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = (piece.strip() for piece in part.partition("-"))
+        if not sep:
+            return None
+        if not first:
+            # 后缀范围：最后 N 个字节
+            if not last.isdigit():
+                return None
+            if int(last) > 0:
+                ranges.append((max(size - int(last), 0), size - 1))
+            continue
+        if not first.isdigit() or (last and not last.isdigit()):
+            return None
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < size:
+            ranges.append((start, min(int(last), size - 1) if last else size - 1))
+
+    ranges.sort()
+    merged: List[ByteRange] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def _strip_weak(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _read_at(f, offset: int, size: int) -> bytes:
+    """从指定位置读取（os.pread 在 Windows 上不可用；同一响应内的读取是串行的，seek 后 read 即可）"""
+    f.seek(offset)
+    return f.read(size)
+
+
+class RangeFileResponse(Response):
+    """支持条件请求和 Range 的本地文件响应"""
+
+    def __init__(
+        self,
+        path: str,
+        filename: str,
+        media_type: str = "application/octet-stream",
+        content_hash: Optional[str] = None,
+        stat_result: Optional[os.stat_result] = None
+    ):
+        self.path = path
+        self.status_code = 200
+        self.media_type = media_type
+        self.background = None
+        self.stat_result = stat_result or os.stat(path)
+        self.size = self.stat_result.st_size
+
+        # 有内容哈希时使用强 ETag；去重上线前的旧文件退回到基于修改时间和大小的弱 ETag
+        if content_hash:
+            self.etag = f'"{content_hash}"'
+        else:
+            self.etag = f'W/"{self.stat_result.st_mtime_ns:x}-{self.size:x}"'
+        self.last_modified = formatdate(self.stat_result.st_mtime, usegmt=True)
+
+        quoted = quote(filename)
+        if quoted != filename:
+            content_disposition = f"attachment; filename*=utf-8''{quoted}"
+        else:
+            content_disposition = f'attachment; filename="{filename}"'
+
+        # 与 FileResponse 一致，文本类型带上字符集
+        self.content_type = f"{media_type}; charset={self.charset}" if media_type.startswith("text/") else media_type
+
+        # 所有状态码共用的响应头；Content-Type/Content-Length/Content-Range 按响应类型在发送时补充
+        self.raw_headers = [
+            (name.encode("latin-1"), value.encode("latin-1"))
+            for name, value in (
+                ("accept-ranges", "bytes"),
+                ("etag", self.etag),
+                ("last-modified", self.last_modified),
+                ("cache-control", "private, no-cache"),
+                ("content-disposition", content_disposition)
+            )
+        ]
+
+    # ---------- 条件请求 ----------
+
+    def _not_modified(self, headers: Headers) -> bool:
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None:
+            # If-None-Match 使用弱比较，存在时忽略 If-Modified-Since
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or _strip_weak(self.etag) in (_strip_weak(tag) for tag in tags)
+
+        if_modified_since = headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(self.stat_result.st_mtime) <= since
+        return False
+
+    def _if_range_matches(self, value: str) -> bool:
+        """If-Range：ETag 使用强比较，日期必须与 Last-Modified 完全一致"""
+        value = value.strip()
+        if value.startswith('"'):
+            return not self.etag.startswith("W/") and value == self.etag
+        if value.startswith("W/"):
+            return False
+        return value == self.last_modified
+
+    def _requested_ranges(self, headers: Headers) -> Optional[List[ByteRange]]:
+        range_header = headers.get("range")
+        if range_header is None:
+            return None
+        if_range = headers.get("if-range")
+        if if_range is not None and not self._if_range_matches(if_range):
+            return None
+        return parse_range_header(range_header, self.size)
+
+    # ---------- 发送 ----------
+
+    async def __call__(self, scope, receive, send) -> None:
+        headers = Headers(scope=scope)
+        method = scope["method"]
+        send_body = method != "HEAD"
+
+        if method in ("GET", "HEAD") and self._not_modified(headers):
+            await self._start(send, 304, [])
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        ranges = self._requested_ranges(headers) if method in ("GET", "HEAD") else None
+
+        if ranges is not None and not ranges:
+            await self._start(send, 416, [
+                (b"content-range", f"bytes */{self.size}".encode("latin-1")),
+                (b"content-length", b"0")
+            ])
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if ranges is None or len(ranges) == 1:
+            start, end = ranges[0] if ranges else (0, self.size - 1)
+            length = end - start + 1 if self.size else 0
+            extra = [
+                (b"content-type", self.content_type.encode("latin-1")),
+                (b"content-length", str(length).encode("latin-1"))
+            ]
+            if ranges:
+                extra.append((b"content-range", f"bytes {start}-{end}/{self.size}".encode("latin-1")))
+            await self._start(send, 206 if ranges else 200, extra)
+            if not send_body:
+                await send({"type": "http.response.body", "body": b""})
+            elif not ranges and "http.response.pathsend" in scope.get("extensions", {}):
+                await send({"type": "http.response.pathsend", "path": self.path})
+            else:
+                await self._stream(scope, receive, send, [(b"", start, length)], b"")
+            return
+
+        # 多个范围：multipart/byteranges
+        boundary = secrets.token_hex(16)
+        parts = []
+        for start, end in ranges:
+            head = (
+                f"--{boundary}\r\n"
+                f"Content-Type: {self.content_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{self.size}\r\n\r\n"
+            ).encode("latin-1")
+            # 每个部分的数据后接 CRLF，放在下一部分的前缀里
+            parts.append((head if not parts else b"\r\n" + head, start, end - start + 1))
+        tail = f"\r\n--{boundary}--\r\n".encode("latin-1")
+        content_length = sum(len(head) + length for head, _, length in parts) + len(tail)
+
+        await self._start(send, 206, [
+            (b"content-type", f"multipart/byteranges; boundary={boundary}".encode("latin-1")),
+            (b"content-length", str(content_length).encode("latin-1"))
+        ])
+        if not send_body:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await self._stream(scope, receive, send, parts, tail)
+
+    async def _start(self, send, status_code: int, extra_headers: List[Tuple[bytes, bytes]]) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": self.raw_headers + extra_headers
+        })
+
+    async def _stream(self, scope, receive, send, parts: List[Tuple[bytes, int, int]], tail: bytes) -> None:
+        """按顺序发送 (前缀, 起点, 长度) 各部分和结尾，客户端断开时停止"""
+        async with anyio.create_task_group() as task_group:
+
+            async def wrap(func) -> None:
+                await func()
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(wrap, partial(self._send_parts, scope, send, parts, tail))
+            await wrap(partial(self._listen_for_disconnect, receive))
+
+    async def _send_parts(self, scope, send, parts: List[Tuple[bytes, int, int]], tail: bytes) -> None:
+        zerocopy = "http.response.zerocopy" in scope.get("extensions", {})
+        with open(self.path, "rb") as f:
+            for head, offset, length in parts:
+                if head:
+                    await send({"type": "http.response.body", "body": head, "more_body": True})
+                if zerocopy:
+                    await send({
+                        "type": "http.response.zerocopy",
+                        "file": f,
+                        "offset": offset,
+                        "count": length,
+                        "more_body": True
+                    })
+                    continue
+                end = offset + length
+                while offset < end:
+                    chunk = await asyncio.to_thread(_read_at, f, offset, min(settings.DOWNLOAD_CHUNK_SIZE, end - offset))
+                    if not chunk:
+                        # 文件在发送过程中被截短
+                        raise RuntimeError(f"文件读取不完整: {self.path}")
+                    offset += len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": tail, "more_body": False})
+
+    @staticmethod
+    async def _listen_for_disconnect(receive) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
@@ -0,0 +1,141 @@
+"""
+Prometheus 指标定义
+通过 /metrics 以 Prometheus 文本格式暴露，用于根据真实数据调整连接池和超时配置。
+
+注意：多 worker 部署时每个进程各自统计，需要按进程抓取或启用 prometheus_client 的多进程模式。
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+# 延迟类指标的分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 13, 21, 34, 60)
+
+# ---------- 上游流式调用 ----------
+
+AI_UPSTREAM_CONNECT_SECONDS = Histogram(
+    "ai_upstream_connect_seconds",
+    "建立上游连接（TCP + TLS）的耗时，复用 keep-alive 连接时为 0",
+    ["action"],
+    buckets=(0, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+AI_UPSTREAM_HEADERS_SECONDS = Histogram(
+    "ai_upstream_response_headers_seconds",
+    "从发起上游请求到收到响应头的耗时",
+    ["action"],
+    buckets=LATENCY_BUCKETS
+)
+
+AI_UPSTREAM_TTFT_SECONDS = Histogram(
+    "ai_upstream_ttft_seconds",
+    "从发起上游请求到收到第一个文本增量的耗时",
+    ["action"],
+    buckets=LATENCY_BUCKETS
+)
+
+AI_STREAM_DURATION_SECONDS = Histogram(
+    "ai_stream_duration_seconds",
+    "上游流式调用的总耗时",
+    ["action", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+
+AI_STREAM_CHUNKS = Histogram(
+    "ai_stream_chunks",
+    "每次上游流式调用收到的文本增量个数",
+    ["action"],
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2000, 4000)
+)
+
+AI_STREAM_CHARS_PER_SECOND = Histogram(
+    "ai_stream_chars_per_second",
+    "首个增量之后的输出速率（字符/秒）",
+    ["action"],
+    buckets=(5, 10, 25, 50, 75, 100, 150, 200, 300, 500, 1000)
+)
+
+AI_STREAMS_TOTAL = Counter(
+    "ai_streams_total",
+    "上游流式调用次数，outcome 为 success/error/cancelled",
+    ["action", "outcome"]
+)
+
+AI_ABANDONED_TOKENS_ESTIMATED_TOTAL = Counter(
+    "ai_abandoned_tokens_estimated_total",
+    "所有客户端都断开后取消上游生成而省下的 token 数估算值（max_tokens 减去已收到的增量数，为上限）；"
+    "对冲落败和重试关闭的请求不计入",
+    ["action"]
+)
+
+# ---------- 接口层 ----------
+
+AI_CLIENT_DISCONNECTS_TOTAL = Counter(
+    "ai_client_disconnects_total",
+    "流式输出过程中客户端断开的次数",
+    ["endpoint", "action"]
+)
+
+AI_SSE_FIRST_FRAME_SECONDS = Histogram(
+    "ai_sse_first_frame_seconds",
+    "/ai/stream 从开始生成响应到写出第一个 SSE 帧的耗时（含缓存、单飞和上游）",
+    ["action"],
+    buckets=LATENCY_BUCKETS
+)
+
+AI_CACHE_LOOKUPS_TOTAL = Counter(
+    "ai_cache_lookups_total",
+    "AI 结果缓存查询次数，result 为 memory_hit/disk_hit/miss",
+    ["result"]
+)
+
+AI_ADMISSION_WAIT_SECONDS = Histogram(
+    "ai_admission_wait_seconds",
+    "AI 请求在准入队列中的等待时间",
+    buckets=LATENCY_BUCKETS
+)
+
+AI_ADMISSION_REJECTED_TOTAL = Counter(
+    "ai_admission_rejected_total",
+    "被准入控制拒绝的 AI 请求数，reason 为 rate_limited/queue_full/timeout",
+    ["reason"]
+)
+
+AI_ADMISSION_ACTIVE = Gauge(
+    "ai_admission_active",
+    "正在执行的 AI 请求数"
+)
+
+AI_ADMISSION_QUEUE_DEPTH = Gauge(
+    "ai_admission_queue_depth",
+    "准入队列中等待的 AI 请求数"
+)
+
+AI_SINGLE_FLIGHT_INFLIGHT = Gauge(
+    "ai_single_flight_inflight",
+    "正在进行的（已合并的）上游调用数"
+)
+
+# ---------- 上游路由 ----------
+
+AI_UPSTREAM_ATTEMPTS_TOTAL = Counter(
+    "ai_upstream_attempts_total",
+    "按端点统计的上游请求次数，outcome 为 success/error/cancelled",
+    ["endpoint", "outcome"]
+)
+
+AI_HEDGES_TOTAL = Counter(
+    "ai_hedges_total",
+    "对冲请求次数，result 为 launched（已发出）/won（对冲请求先出首 token）/lost",
+    ["result"]
+)
+
+AI_CIRCUIT_OPEN = Gauge(
+    "ai_circuit_open",
+    "端点熔断状态，1 表示熔断中",
+    ["endpoint"]
+)
+
+AI_PROMPT_CACHE_TOKENS_TOTAL = Counter(
+    "ai_prompt_cache_tokens_total",
+    "上游报告的 prompt token 数，result 为 hit（命中前缀缓存）/miss",
+    ["action", "result"]
+)
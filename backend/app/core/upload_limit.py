@@ -0,0 +1,72 @@
+"""
+上传请求体大小限制
+FastAPI 在调用接口函数之前就会把 multipart 表单完整解析并落盘，接口内的大小检查为时已晚。
+这里在 ASGI 层拦截上传接口：Content-Length 超限时不读取请求体直接返回 413，
+分块传输（没有 Content-Length）的请求在累计字节数越过上限的那一刻中止并返回 413。
+"""
+import json
+from typing import Iterable
+
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+
+
+def _too_large_detail() -> str:
+    return f"文件大小超过限制 ({settings.MAX_FILE_SIZE} bytes)"
+
+
+class UploadSizeLimitMiddleware:
+    """对指定路径前缀的 POST 请求限制请求体大小"""
+
+    def __init__(self, app, paths: Iterable[str], max_body_size: int):
+        self.app = app
+        self.paths = tuple(paths)
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not scope["path"].startswith(self.paths)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > self.max_body_size:
+                    await self._reject(send)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    # 表单解析中抛出的 HTTPException 会原样传给异常处理器，返回 413 而不是 400
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=_too_large_detail()
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    async def _reject(send) -> None:
+        body = json.dumps({"detail": _too_large_detail()}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
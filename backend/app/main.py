@@ -1,7 +1,12 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.api import api_router
 from app.core.config import settings
+from app.core.upload_limit import UploadSizeLimitMiddleware
+from app.services.ai_service import init_http_client, close_http_client
+from app.services.ai_usage import usage_meter
+from app.services.oss_service import oss_service
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 import os
 
 # 创建上传目录
@@ -13,6 +18,13 @@ app = FastAPI(
     version="0.1.0",
 )
 
+# 上传接口的请求体大小限制（放在 CORS 内层，413 响应同样带跨域头）
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=["/api/files/upload"],
+    max_body_size=settings.MAX_FILE_SIZE + settings.UPLOAD_FORM_OVERHEAD,
+)
+
 # 配置CORS
 app.add_middleware(
     CORSMiddleware,
@@ -20,8 +32,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Stream-Id"],
 )
 
+# AI 上游连接池和用量定时写入的生命周期
+@app.on_event("startup")
+async def startup_event():
+    await init_http_client()
+    usage_meter.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await usage_meter.stop()
+    await close_http_client()
+    await oss_service.close_http_client()
+
 # 包含API路由
 app.include_router(api_router, prefix="/api")
 
@@ -32,3 +57,8 @@ def read_root():
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus 指标"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -2,4 +2,5 @@ from app.models.user import User
 from app.models.file import File, FileType
 from app.models.template import Template, TemplateStatus
 from app.models.report import Report, ReportStatus
-from app.models.draft import Draft, DraftVersion, DraftStatus
\ No newline at end of file
+from app.models.draft import Draft, DraftVersion, DraftStatus
+from app.models.ai_usage import AIUsage
@@ -0,0 +1,26 @@
+"""
+AI 用量数据模型
+"""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from app.db.database import Base
+
+
+class AIUsage(Base):
+    """AI 用量表：按用户、操作和统计周期汇总的 token 用量（定时批量写入）"""
+    __tablename__ = "ai_usage"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
+    action = Column(String(32), nullable=False)
+    calls = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cache_hit_tokens = Column(Integer, nullable=False, default=0)
+    period_start = Column(DateTime(timezone=True), nullable=False)
+    period_end = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_ai_usage_user_period", "user_id", "period_start"),
+    )
@@ -28,5 +28,8 @@ class File(Base):
     oss_path = Column(String(500), nullable=True)
     oss_url = Column(String(500), nullable=True)
     
+    # 内容 SHA-256：相同内容的文件共用一份存储，最后一个引用删除时才删除存储
+    content_hash = Column(String(64), nullable=True, index=True)
+    
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -22,6 +22,7 @@ class FileResponse(BaseModel):
     is_oss: bool = False
     oss_path: Optional[str] = None
     oss_url: Optional[str] = None
+    content_hash: Optional[str] = None
     created_at: datetime
     updated_at: datetime
     
@@ -0,0 +1,251 @@
+"""
+AI 结果缓存
+对确定性较强的 AI 操作（润色、翻译、解释等）缓存完整结果，
+内存层为 LRU + TTL，可选磁盘层在重启后继续命中。
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from typing import Iterator, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import AI_CACHE_LOOKUPS_TOTAL
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：统一 Unicode 形式和换行，合并行内空白，去掉首尾空白"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFC", text)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = re.sub(r"[ \t　]+", " ", text)
+    text = re.sub(r" *\n *", "\n", text)
+    return text.strip()
+
+
+def make_cache_key(
+    action: str,
+    text: str,
+    custom_prompt: Optional[str],
+    model: str,
+    temperature: float
+) -> str:
+    """由 (action, 规范化文本, custom_prompt, model, temperature) 生成缓存键"""
+    raw = json.dumps(
+        [action, normalize_text(text), custom_prompt or "", model, temperature],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def iter_replay_chunks(result: str, chunk_size: int) -> Iterator[str]:
+    """把缓存的完整结果切分成片段，用于按流式接口回放"""
+    for i in range(0, len(result), chunk_size):
+        yield result[i:i + chunk_size]
+
+
+class AIResultCache:
+    """内存 LRU/TTL 缓存 + 可选磁盘层"""
+
+    # 每写入多少次磁盘条目清理一次过期/超量文件
+    DISK_PRUNE_INTERVAL = 100
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        ttl: int,
+        disk_dir: Optional[str] = None,
+        disk_max_entries: int = 10000
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir or None
+        self.disk_max_entries = disk_max_entries
+
+        # key -> (过期时间, 结果, 字节数)
+        self._entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        self._bytes = 0
+        self._disk_writes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    # ---------- 内存层 ----------
+
+    def get(self, key: str) -> Optional[str]:
+        """只查询内存层，不更新计数"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at < time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: str, expires_at: Optional[float] = None) -> None:
+        """写入内存层，超出条目数或字节数上限时淘汰最久未使用的条目"""
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at or time.time() + self.ttl, value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    # ---------- 磁盘层 ----------
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def load_from_disk(self, key: str) -> Optional[Tuple[float, str]]:
+        """读取磁盘条目，过期或损坏的文件会被删除"""
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            self._unlink(path)
+            return None
+
+        if data.get("expires_at", 0) < time.time():
+            self._unlink(path)
+            return None
+        return data["expires_at"], data["result"]
+
+    def save_to_disk(self, key: str, value: str, expires_at: float) -> None:
+        """原子写入磁盘条目（先写临时文件再替换）"""
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": expires_at, "result": value}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"AI 缓存写入磁盘失败: {str(e)}")
+            self._unlink(tmp_path)
+
+    def prune_disk(self) -> None:
+        """删除过期文件，并在文件数超限时删除最旧的文件"""
+        now = time.time()
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                if mtime + self.ttl < now:
+                    self._unlink(path)
+                else:
+                    files.append((mtime, path))
+
+        if len(files) > self.disk_max_entries:
+            files.sort()
+            for _, path in files[:len(files) - self.disk_max_entries]:
+                self._unlink(path)
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # ---------- 异步接口（磁盘 I/O 放到线程池，不阻塞事件循环） ----------
+
+    async def lookup(self, key: str) -> Optional[str]:
+        """依次查询内存层和磁盘层，并更新命中/未命中计数"""
+        value = self.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            AI_CACHE_LOOKUPS_TOTAL.labels("memory_hit").inc()
+            return value
+
+        if self.disk_dir:
+            entry = await asyncio.to_thread(self.load_from_disk, key)
+            if entry is not None:
+                expires_at, value = entry
+                self.put(key, value, expires_at)
+                self.disk_hits += 1
+                AI_CACHE_LOOKUPS_TOTAL.labels("disk_hit").inc()
+                return value
+
+        self.misses += 1
+        AI_CACHE_LOOKUPS_TOTAL.labels("miss").inc()
+        return None
+
+    async def store(self, key: str, value: str) -> None:
+        """写入内存层，启用磁盘层时同时落盘"""
+        expires_at = time.time() + self.ttl
+        self.put(key, value, expires_at)
+        self.stores += 1
+
+        if self.disk_dir:
+            await asyncio.to_thread(self.save_to_disk, key, value, expires_at)
+            self._disk_writes += 1
+            if self._disk_writes % self.DISK_PRUNE_INTERVAL == 0:
+                await asyncio.to_thread(self.prune_disk)
+
+    def stats(self) -> dict:
+        """命中/未命中统计"""
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "disk_enabled": bool(self.disk_dir)
+        }
+
+
+# 可缓存的操作类型
+CACHEABLE_ACTIONS = {
+    a.strip() for a in settings.AI_CACHE_ACTIONS.split(",") if a.strip()
+}
+
+# 创建全局 AI 结果缓存实例
+ai_result_cache = AIResultCache(
+    max_entries=settings.AI_CACHE_MAX_ENTRIES,
+    max_bytes=settings.AI_CACHE_MAX_BYTES,
+    ttl=settings.AI_CACHE_TTL,
+    disk_dir=settings.AI_CACHE_DISK_DIR,
+    disk_max_entries=settings.AI_CACHE_DISK_MAX_ENTRIES
+)
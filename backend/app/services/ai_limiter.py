@@ -0,0 +1,290 @@
+"""
+AI 接口准入控制
+全局并发上限 + 单用户并发上限 + 有界等待队列 + 单用户令牌桶限流，
+超出容量时快速拒绝（HTTP 429），避免个别用户拖慢所有人。
+"""
+import math
+import time
+import asyncio
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import (
+    AI_ADMISSION_WAIT_SECONDS, AI_ADMISSION_REJECTED_TOTAL,
+    AI_ADMISSION_ACTIVE, AI_ADMISSION_QUEUE_DEPTH
+)
+
+
+class AdmissionRejected(Exception):
+    """请求未被准入，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，capacity 为桶容量（允许的突发量）"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self) -> Tuple[bool, float]:
+        """尝试取一个令牌，返回 (是否成功, 需要等待的秒数)"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class Permit:
+    """准入许可，release 可重复调用；也可作为 async 上下文管理器使用"""
+
+    def __init__(self, controller: "AdmissionController", user_id: int):
+        self._controller = controller
+        self._user_id = user_id
+        self._acquired_at = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(self._user_id, time.monotonic() - self._acquired_at)
+
+    async def __aenter__(self) -> "Permit":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+
+class SubtaskSlots:
+    """
+    已准入请求内部的并发子任务（长文本分段、批量处理的各项）使用的槽位
+
+    请求自身的许可同一时间只给一个子任务使用；其余子任务向准入控制器借用额外槽位，
+    借不到时等待请求自身的槽位。只占用并发额度，不消耗限流令牌，也不进入排队（不会超时）。
+    """
+
+    def __init__(self, controller: "AdmissionController", user_id: int):
+        self._controller = controller
+        self._user_id = user_id
+        self._own = asyncio.Semaphore(1)
+
+    async def acquire(self) -> Callable[[], None]:
+        """取得一个槽位，返回释放函数"""
+        permit = self._controller.try_acquire_extra(self._user_id)
+        if permit is not None:
+            return permit.release
+        await self._own.acquire()
+        return self._own.release
+
+
+class AdmissionController:
+    """按 FIFO 顺序分配并发槽位的准入控制器"""
+
+    # 令牌桶表超过该大小时清理已满（空闲）的桶
+    BUCKET_PRUNE_THRESHOLD = 10000
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_per_user: int,
+        max_queue: int,
+        queue_timeout: float,
+        user_rate: float,
+        user_burst: int
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+
+        self.active = 0
+        self._active_by_user: Dict[int, int] = {}
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+        self._buckets: Dict[int, TokenBucket] = {}
+
+        # 统计
+        self.admitted = 0
+        self.rejected_rate = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.max_queue_depth = 0
+        self._avg_hold = 5.0
+
+    def _can_run(self, user_id: int) -> bool:
+        return (
+            self.active < self.max_concurrent
+            and self._active_by_user.get(user_id, 0) < self.max_per_user
+        )
+
+    def _grant(self, user_id: int) -> None:
+        self.active += 1
+        self._active_by_user[user_id] = self._active_by_user.get(user_id, 0) + 1
+        self.admitted += 1
+
+    def _bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= self.BUCKET_PRUNE_THRESHOLD:
+                self._buckets = {uid: b for uid, b in self._buckets.items() if not b.is_full()}
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+            self._buckets[user_id] = bucket
+        return bucket
+
+    async def acquire(self, user_id: int) -> Permit:
+        """
+        申请一个并发槽位
+
+        Raises:
+            AdmissionRejected: 触发限流、等待队列已满或排队超时
+        """
+        ok, retry_after = self._bucket(user_id).try_acquire()
+        if not ok:
+            self.rejected_rate += 1
+            AI_ADMISSION_REJECTED_TOTAL.labels("rate_limited").inc()
+            raise AdmissionRejected("请求过于频繁，请稍后再试", retry_after)
+
+        # 没有排队者且有空闲槽位时直接准入，保证 FIFO
+        if not self._waiters and self._can_run(user_id):
+            self._grant(user_id)
+            return Permit(self, user_id)
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            AI_ADMISSION_REJECTED_TOTAL.labels("queue_full").inc()
+            raise AdmissionRejected("AI 服务繁忙，请稍后再试", self._avg_hold)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (user_id, future)
+        self._waiters.append(entry)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # 超时的同时刚好被分配了槽位，直接使用
+                self._record_wait(time.monotonic() - started)
+                return Permit(self, user_id)
+            self._remove_waiter(entry)
+            self.rejected_timeout += 1
+            AI_ADMISSION_REJECTED_TOTAL.labels("timeout").inc()
+            raise AdmissionRejected("AI 服务繁忙，排队超时", self._avg_hold)
+        except asyncio.CancelledError:
+            # 调用方被取消：若已分配槽位则归还，否则退出队列
+            if future.done() and not future.cancelled():
+                self._release(user_id, 0.0)
+            else:
+                self._remove_waiter(entry)
+            raise
+
+        self._record_wait(time.monotonic() - started)
+        return Permit(self, user_id)
+
+    def try_acquire_extra(self, user_id: int) -> Optional[Permit]:
+        """
+        为已准入请求内部的并发子任务（如长文本分段）借用额外槽位
+
+        不消耗限流令牌也不排队：有人排队或已达全局/单用户上限时返回 None，调用方继续使用请求自身的槽位。
+        """
+        if self._waiters or not self._can_run(user_id):
+            return None
+        self._grant(user_id)
+        return Permit(self, user_id)
+
+    def subtask_slots(self, user_id: int) -> SubtaskSlots:
+        """为已准入的请求创建子任务槽位（请求自身的许可由调用方持有到所有子任务结束）"""
+        return SubtaskSlots(self, user_id)
+
+    def _remove_waiter(self, entry: Tuple[int, asyncio.Future]) -> None:
+        try:
+            self._waiters.remove(entry)
+        except ValueError:
+            pass
+        if not entry[1].done():
+            entry[1].cancel()
+
+    def _record_wait(self, seconds: float) -> None:
+        self.wait_count += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+        AI_ADMISSION_WAIT_SECONDS.observe(seconds)
+
+    def _release(self, user_id: int, held_seconds: float) -> None:
+        self.active -= 1
+        remaining = self._active_by_user.get(user_id, 1) - 1
+        if remaining > 0:
+            self._active_by_user[user_id] = remaining
+        else:
+            self._active_by_user.pop(user_id, None)
+        if held_seconds > 0:
+            self._avg_hold = 0.9 * self._avg_hold + 0.1 * held_seconds
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        """按排队顺序唤醒可以运行的等待者（跳过已达单用户上限的用户）"""
+        for entry in list(self._waiters):
+            if self.active >= self.max_concurrent:
+                break
+            user_id, future = entry
+            if future.done():
+                self._waiters.remove(entry)
+                continue
+            if self._can_run(user_id):
+                self._waiters.remove(entry)
+                self._grant(user_id)
+                future.set_result(None)
+
+    def stats(self) -> dict:
+        """队列深度、等待时间和拒绝次数统计"""
+        return {
+            "active": self.active,
+            "active_users": len(self._active_by_user),
+            "queue_depth": len(self._waiters),
+            "max_queue_depth": self.max_queue_depth,
+            "max_concurrent": self.max_concurrent,
+            "max_per_user": self.max_per_user,
+            "admitted": self.admitted,
+            "rejected_rate_limited": self.rejected_rate,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_count": self.wait_count,
+            "wait_seconds_avg": round(self.wait_seconds_total / self.wait_count, 4) if self.wait_count else 0.0,
+            "wait_seconds_max": round(self.wait_seconds_max, 4)
+        }
+
+
+# 创建全局准入控制器实例
+ai_admission = AdmissionController(
+    max_concurrent=settings.AI_MAX_CONCURRENT,
+    max_per_user=settings.AI_MAX_CONCURRENT_PER_USER,
+    max_queue=settings.AI_MAX_QUEUE,
+    queue_timeout=settings.AI_QUEUE_TIMEOUT,
+    user_rate=settings.AI_USER_RATE,
+    user_burst=settings.AI_USER_BURST
+)
+AI_ADMISSION_ACTIVE.set_function(lambda: ai_admission.active)
+AI_ADMISSION_QUEUE_DEPTH.set_function(lambda: len(ai_admission._waiters))
@@ -0,0 +1,355 @@
+"""
+AI 上游路由
+在多个 OpenAI 兼容端点（或同一端点的多个 Key）之间选择：
+按首 token 延迟的 EWMA 和错误率挑选最快的健康端点，连续失败时熔断；
+首 token 超过 p95 延迟仍未到达时向另一个端点发送对冲请求，先出首 token 的胜出，另一个立即取消。
+"""
+import json
+import math
+import time
+import random
+import asyncio
+import httpx
+from collections import deque
+from contextlib import suppress
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional, Set
+
+from app.core.metrics import AI_UPSTREAM_ATTEMPTS_TOTAL, AI_HEDGES_TOTAL, AI_CIRCUIT_OPEN
+
+
+class UpstreamError(Exception):
+    """上游返回非 200 状态码"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def is_retryable(error: Optional[BaseException]) -> bool:
+    """连接/超时错误、429 和 5xx 视为端点故障，可以换端点重试；其余（如 400）直接返回给调用方"""
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, UpstreamError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def percentile(values, p: float) -> float:
+    """最近秩法计算百分位数"""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class UpstreamEndpoint:
+    """一个上游端点（base_url + api_key）及其延迟、错误率和熔断状态"""
+
+    # 保留的首 token 延迟样本数，用于计算对冲延迟
+    SAMPLE_WINDOW = 256
+
+    def __init__(self, name: str, base_url: str, api_key: str, model: str):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+
+        self.ewma_ttft: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples: deque = deque(maxlen=self.SAMPLE_WINDOW)
+        self.consecutive_failures = 0
+        # 熔断截止时间，0 表示未熔断；过了截止时间进入半开状态，只放行一个探测请求
+        self.open_until = 0.0
+        self.probing = False
+        self.inflight = 0
+        self.requests = 0
+        self.failures = 0
+
+    def available(self, now: float) -> bool:
+        if not self.open_until:
+            return True
+        return now >= self.open_until and not self.probing
+
+    def score(self) -> float:
+        """越小越好：首 token 延迟按成功率放大，没有样本的端点优先被探索"""
+        return (self.ewma_ttft or 0.0) / max(0.1, 1.0 - self.error_rate)
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "model": self.model,
+            "ewma_ttft_ms": round(self.ewma_ttft * 1000, 1) if self.ewma_ttft is not None else None,
+            "p95_ttft_ms": round(percentile(self.samples, 95) * 1000, 1) if self.samples else None,
+            "error_rate": round(self.error_rate, 4),
+            "circuit": "closed" if not self.open_until else ("open" if now < self.open_until else "half_open"),
+            "inflight": self.inflight,
+            "requests": self.requests,
+            "failures": self.failures
+        }
+
+
+class _Attempt:
+    """对某个端点的一次请求，next_chunk 为等待首个片段的任务"""
+
+    def __init__(self, endpoint: UpstreamEndpoint, stream: AsyncIterator[str]):
+        self.endpoint = endpoint
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.next_chunk = asyncio.ensure_future(stream.__anext__())
+
+
+class UpstreamRouter:
+    """端点选择、熔断和对冲请求"""
+
+    # 以一定概率随机选择其他可用端点，使较慢端点的延迟估计保持更新
+    EXPLORE_RATIO = 0.05
+
+    def __init__(
+        self,
+        endpoints: List[UpstreamEndpoint],
+        max_attempts: int = 2,
+        ewma_alpha: float = 0.2,
+        failure_threshold: int = 5,
+        open_seconds: float = 30,
+        hedge_enabled: bool = True,
+        hedge_percentile: float = 95,
+        hedge_min_samples: int = 20,
+        hedge_default_delay: float = 3,
+        hedge_min_delay: float = 0.2,
+        hedge_max_delay: float = 10
+    ):
+        if not endpoints:
+            raise ValueError("至少需要配置一个上游端点")
+        self.endpoints = endpoints
+        self.max_attempts = max(1, max_attempts)
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    # ---------- 端点选择与健康度 ----------
+
+    def pick(self, exclude: Set[str], fallback: bool = False) -> Optional[UpstreamEndpoint]:
+        """
+        选择一个端点
+
+        Args:
+            exclude: 本次请求已经尝试过的端点名
+            fallback: 所有端点都在熔断中时，是否仍选择最早恢复的端点（首个请求使用，避免全部失败）
+        """
+        now = time.time()
+        candidates = [e for e in self.endpoints if e.name not in exclude]
+        available = [e for e in candidates if e.available(now)]
+        if not available:
+            if not fallback or not candidates:
+                return None
+            endpoint = min(candidates, key=lambda e: e.open_until)
+        elif len(available) > 1 and random.random() < self.EXPLORE_RATIO:
+            endpoint = random.choice(available)
+        else:
+            endpoint = min(available, key=lambda e: (e.score(), e.inflight))
+
+        if endpoint.open_until and now >= endpoint.open_until:
+            endpoint.probing = True
+        return endpoint
+
+    def hedge_delay(self, endpoint: UpstreamEndpoint) -> float:
+        """对冲等待时间：该端点首 token 延迟的 p95，样本不足时使用默认值"""
+        if len(endpoint.samples) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        delay = percentile(endpoint.samples, self.hedge_percentile)
+        return min(self.hedge_max_delay, max(self.hedge_min_delay, delay))
+
+    def _record_ttft(self, endpoint: UpstreamEndpoint, seconds: float) -> None:
+        endpoint.samples.append(seconds)
+        if endpoint.ewma_ttft is None:
+            endpoint.ewma_ttft = seconds
+        else:
+            endpoint.ewma_ttft += self.ewma_alpha * (seconds - endpoint.ewma_ttft)
+
+    def _record_outcome(self, endpoint: UpstreamEndpoint, outcome: str, error: Optional[BaseException] = None) -> None:
+        """记录一次请求的结果并更新错误率和熔断状态；取消和非端点原因的错误不计入健康度"""
+        endpoint.inflight -= 1
+        AI_UPSTREAM_ATTEMPTS_TOTAL.labels(endpoint.name, outcome).inc()
+
+        if outcome == "success":
+            endpoint.error_rate -= self.ewma_alpha * endpoint.error_rate
+            endpoint.consecutive_failures = 0
+            if endpoint.open_until:
+                endpoint.open_until = 0.0
+                AI_CIRCUIT_OPEN.labels(endpoint.name).set(0)
+        elif outcome == "error" and is_retryable(error):
+            endpoint.failures += 1
+            endpoint.error_rate += self.ewma_alpha * (1.0 - endpoint.error_rate)
+            endpoint.consecutive_failures += 1
+            if endpoint.probing or endpoint.consecutive_failures >= self.failure_threshold:
+                endpoint.open_until = time.time() + self.open_seconds
+                AI_CIRCUIT_OPEN.labels(endpoint.name).set(1)
+                print(f"AI 上游 {endpoint.name} 熔断 {self.open_seconds} 秒: {str(error)}")
+        endpoint.probing = False
+
+    # ---------- 请求 ----------
+
+    def _launch(
+        self,
+        open_stream: Callable[[UpstreamEndpoint], AsyncIterator[str]],
+        attempts: Dict[asyncio.Future, _Attempt],
+        tried: Set[str],
+        fallback: bool = False
+    ) -> Optional[_Attempt]:
+        if len(tried) >= self.max_attempts:
+            return None
+        endpoint = self.pick(tried, fallback)
+        if endpoint is None:
+            return None
+        tried.add(endpoint.name)
+        endpoint.inflight += 1
+        endpoint.requests += 1
+        attempt = _Attempt(endpoint, open_stream(endpoint))
+        attempts[attempt.next_chunk] = attempt
+        return attempt
+
+    async def _abandon(self, attempt: _Attempt) -> None:
+        """取消未胜出的请求并关闭其流"""
+        if not attempt.next_chunk.done():
+            attempt.next_chunk.cancel()
+        with suppress(asyncio.CancelledError, StopAsyncIteration, Exception):
+            await attempt.next_chunk
+        with suppress(RuntimeError):
+            await attempt.stream.aclose()
+        self._record_outcome(attempt.endpoint, "cancelled")
+
+    async def stream(
+        self,
+        open_stream: Callable[[UpstreamEndpoint], AsyncIterator[str]]
+    ) -> AsyncGenerator[str, None]:
+        """
+        路由一次流式请求，逐个产出文本增量
+
+        首 token 到达之前：请求失败且可重试时换端点重试，超过对冲延迟时向另一个端点发送对冲请求；
+        首 token 到达之后固定使用胜出的端点，中途出错直接抛出（已输出的内容无法撤回）。
+
+        Args:
+            open_stream: 对指定端点发起流式请求的函数
+        """
+        attempts: Dict[asyncio.Future, _Attempt] = {}
+        tried: Set[str] = set()
+        primary = self._launch(open_stream, attempts, tried, fallback=True)
+        deadline = primary.started + self.hedge_delay(primary.endpoint) if self.hedge_enabled else None
+        hedged = False
+        winner: Optional[_Attempt] = None
+        first: Optional[str] = None
+        last_error: Optional[BaseException] = None
+        outcome = "cancelled"
+        error: Optional[BaseException] = None
+
+        try:
+            try:
+                # 等待首 token
+                while winner is None:
+                    timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+                    done, _ = await asyncio.wait(
+                        list(attempts), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if not done:
+                        deadline = None
+                        if self._launch(open_stream, attempts, tried):
+                            hedged = True
+                            self.hedges += 1
+                            AI_HEDGES_TOTAL.labels("launched").inc()
+                        continue
+
+                    for future in done:
+                        attempt = attempts.pop(future)
+                        try:
+                            first = future.result()
+                        except StopAsyncIteration:
+                            winner = attempt
+                            break
+                        except Exception as e:
+                            last_error = e
+                            with suppress(RuntimeError):
+                                await attempt.stream.aclose()
+                            self._record_outcome(attempt.endpoint, "error", e)
+                            continue
+                        winner = attempt
+                        break
+
+                    if winner is None and not attempts:
+                        # 全部失败：可重试的错误换一个端点，并重新计算对冲时间
+                        retry = self._launch(open_stream, attempts, tried) if is_retryable(last_error) else None
+                        if retry is None:
+                            raise last_error
+                        if deadline is not None:
+                            deadline = retry.started + self.hedge_delay(retry.endpoint)
+            finally:
+                for attempt in list(attempts.values()):
+                    await self._abandon(attempt)
+                if winner is not None and hedged:
+                    if winner is primary:
+                        AI_HEDGES_TOTAL.labels("lost").inc()
+                    else:
+                        self.hedge_wins += 1
+                        AI_HEDGES_TOTAL.labels("won").inc()
+
+            # 首 token 之后固定使用胜出的端点
+            outcome = "error"
+            if first is not None:
+                self._record_ttft(winner.endpoint, time.perf_counter() - winner.started)
+                yield first
+                async for chunk in winner.stream:
+                    yield chunk
+            outcome = "success"
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if winner is not None:
+                with suppress(RuntimeError):
+                    await winner.stream.aclose()
+                self._record_outcome(winner.endpoint, outcome, error)
+
+    def stats(self) -> dict:
+        return {
+            "hedge_enabled": self.hedge_enabled,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "endpoints": [e.stats() for e in self.endpoints]
+        }
+
+
+def load_endpoints(raw: str, default_base: str, default_key: str, default_model: str) -> List[UpstreamEndpoint]:
+    """
+    解析 AI_UPSTREAMS 配置（JSON 数组），为空时只使用默认端点
+
+    每项支持 name、base_url、api_key、model，缺省字段使用默认值；
+    同一个 base_url 配置多个 api_key 即为多 Key 轮换。
+    """
+    if not raw or not raw.strip():
+        return [UpstreamEndpoint("default", default_base, default_key, default_model)]
+    try:
+        items = json.loads(raw)
+    except ValueError:
+        raise ValueError("AI_UPSTREAMS 格式错误，应为 JSON 数组")
+
+    endpoints = []
+    for index, item in enumerate(items):
+        endpoints.append(UpstreamEndpoint(
+            item.get("name") or f"upstream-{index + 1}",
+            item.get("base_url") or default_base,
+            item.get("api_key") or default_key,
+            item.get("model") or default_model
+        ))
+    return endpoints
@@ -4,121 +4,206 @@ AI 服务 - DeepSeek API 集成
 """
 import os
 import json
+import time
+import asyncio
 import httpx
-from typing import AsyncGenerator, Optional
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import (
+    AI_UPSTREAM_CONNECT_SECONDS, AI_UPSTREAM_HEADERS_SECONDS, AI_UPSTREAM_TTFT_SECONDS,
+    AI_STREAM_DURATION_SECONDS, AI_STREAM_CHUNKS, AI_STREAM_CHARS_PER_SECOND,
+    AI_STREAMS_TOTAL, AI_SINGLE_FLIGHT_INFLIGHT, AI_ABANDONED_TOKENS_ESTIMATED_TOTAL
+)
+from app.services.ai_cache import (
+    ai_result_cache, make_cache_key, iter_replay_chunks, CACHEABLE_ACTIONS
+)
+from app.services.text_chunker import split_text
+from app.services.context_retriever import select_context
+from app.services.ai_usage import record_usage, record_shared_usage, usage_collector, usage_user
+from app.services.ai_limiter import AdmissionRejected, SubtaskSlots, ai_admission
+from app.services.outline_parser import OutlineParser, OutlineEvent, outline_cache
+from app.services.ai_router import UpstreamRouter, UpstreamEndpoint, UpstreamError, load_endpoints
 
 # DeepSeek API 配置
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 if not DEEPSEEK_API_KEY:
     DEEPSEEK_API_KEY = "sk-c1991f56e6684c288ce54ee5034f4c04"
-DEEPSEEK_API_BASE = "https://api.deepseek.com/v1"
+DEEPSEEK_API_BASE = os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com/v1")
+DEEPSEEK_MODEL = "deepseek-chat"
+DEFAULT_TEMPERATURE = 0.7
+DEFAULT_MAX_TOKENS = 2000
 
+# 普通模式允许的最大输入长度
+MAX_TEXT_LENGTH = 6000
 
-# AI 操作类型对应的 prompt 模板
-PROMPTS = {
-    "polish": """请润色以下文本，使其更加专业、流畅、易读。保持原意不变，只优化语言表达。
-直接输出润色后的文本，不要添加任何解释或前缀。
+# 可以按段落独立处理、支持长文本分段模式的操作
+LONG_TEXT_ACTIONS = {"polish", "expand", "condense", "rewrite", "translate_en", "translate_zh", "custom"}
 
-原文：
-{text}""",
+# 上游端点路由（AI_UPSTREAMS 为空时只有 DEEPSEEK_API_BASE 一个端点，行为与单端点一致）
+upstream_router = UpstreamRouter(
+    load_endpoints(settings.AI_UPSTREAMS, DEEPSEEK_API_BASE, DEEPSEEK_API_KEY, DEEPSEEK_MODEL),
+    max_attempts=settings.AI_UPSTREAM_MAX_ATTEMPTS,
+    ewma_alpha=settings.AI_ROUTER_EWMA_ALPHA,
+    failure_threshold=settings.AI_CIRCUIT_FAILURE_THRESHOLD,
+    open_seconds=settings.AI_CIRCUIT_OPEN_SECONDS,
+    hedge_enabled=settings.AI_HEDGE_ENABLED,
+    hedge_percentile=settings.AI_HEDGE_PERCENTILE,
+    hedge_min_samples=settings.AI_HEDGE_MIN_SAMPLES,
+    hedge_default_delay=settings.AI_HEDGE_DEFAULT_DELAY,
+    hedge_min_delay=settings.AI_HEDGE_MIN_DELAY,
+    hedge_max_delay=settings.AI_HEDGE_MAX_DELAY
+)
 
-    "expand": """请扩写以下文本，增加更多细节和内容，使其更加丰富完整。保持原有风格和主题。
-直接输出扩写后的文本，不要添加任何解释或前缀。
+# 应用级共享的上游 HTTP 客户端（在 FastAPI startup/shutdown 中创建和关闭）
+_http_client: Optional[httpx.AsyncClient] = None
 
-原文：
-{text}""",
 
-    "condense": """请精简以下文本，保留核心内容，去除冗余表达，使其更加简洁有力。
-直接输出精简后的文本，不要添加任何解释或前缀。
+def _build_http_client() -> httpx.AsyncClient:
+    """按配置创建带连接池和 keep-alive 的 AsyncClient"""
+    return httpx.AsyncClient(
+        http2=settings.AI_HTTP2,
+        limits=httpx.Limits(
+            max_connections=settings.AI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.AI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.AI_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(
+            settings.AI_READ_TIMEOUT,
+            connect=settings.AI_CONNECT_TIMEOUT,
+            pool=settings.AI_POOL_TIMEOUT
+        )
+    )
 
-原文：
-{text}""",
 
-    "rewrite": """请用不同的表达方式改写以下文本，保持原意但换一种说法。
-直接输出改写后的文本，不要添加任何解释或前缀。
+def get_http_client() -> httpx.AsyncClient:
+    """
+    获取共享的上游 HTTP 客户端
+    
+    正常情况下客户端在应用启动时创建；脚本等未经过 startup 的场景下按需懒加载。
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _build_http_client()
+    return _http_client
 
-原文：
-{text}""",
 
-    "continue": """请根据以下文本的上下文，续写后续内容。保持风格一致，内容连贯。
-直接输出续写的内容，不要添加任何解释或前缀。
+async def init_http_client() -> None:
+    """应用启动时创建上游客户端，并按配置预热连接"""
+    get_http_client()
+    if settings.AI_WARMUP_CONNECTIONS > 0:
+        await warmup_http_client(settings.AI_WARMUP_CONNECTIONS)
 
-已有内容：
-{text}""",
 
-    "explain": """请解释以下文本中的专业术语或概念，用通俗易懂的语言说明。
+async def close_http_client() -> None:
+    """应用关闭时释放连接池"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
 
-文本：
-{text}""",
 
-    "translate_en": """请将以下文本翻译成英文，保持专业性和准确性。
-直接输出翻译结果，不要添加任何解释。
+async def warmup_http_client(connections: int = 1) -> None:
+    """
+    预热上游连接：对每个端点并发发起轻量请求，提前完成 DNS、TCP 和 TLS 握手，
+    使连接进入 keep-alive 池。预热失败不影响启动。
+    """
+    client = get_http_client()
+    
+    async def _touch(endpoint: UpstreamEndpoint):
+        try:
+            await client.get(
+                f"{endpoint.base_url}/models",
+                headers={"Authorization": f"Bearer {endpoint.api_key}"}
+            )
+        except httpx.HTTPError as e:
+            print(f"AI 上游连接预热失败 ({endpoint.name}): {str(e)}")
+    
+    await asyncio.gather(*[
+        _touch(endpoint) for endpoint in upstream_router.endpoints for _ in range(connections)
+    ])
 
-原文：
-{text}""",
 
-    "translate_zh": """请将以下文本翻译成中文，保持专业性和准确性。
-直接输出翻译结果，不要添加任何解释。
+# 所有操作共用的系统提示
+SYSTEM_PROMPT = "你是一个专业的写作助手，帮助用户优化和改进文本内容。"
 
-原文：
-{text}""",
+# AI 操作类型对应的固定指令
+# 消息按"稳定前缀在前、可变内容在后"组织：system（系统提示 + 操作指令）→ 参考内容 → 本次的文本或问题，
+# 同一操作的请求共享尽可能长的前缀，从而命中上游的前缀缓存（更低的首 token 延迟和 prompt 费用）
+PROMPTS = {
+    "polish": """请润色用户提供的文本，使其更加专业、流畅、易读。保持原意不变，只优化语言表达。
+直接输出润色后的文本，不要添加任何解释或前缀。""",
 
-    "custom": """{prompt}
+    "expand": """请扩写用户提供的文本，增加更多细节和内容，使其更加丰富完整。保持原有风格和主题。
+直接输出扩写后的文本，不要添加任何解释或前缀。""",
 
-文本：
-{text}""",
+    "condense": """请精简用户提供的文本，保留核心内容，去除冗余表达，使其更加简洁有力。
+直接输出精简后的文本，不要添加任何解释或前缀。""",
 
-    "ask": """{prompt}""",
+    "rewrite": """请用不同的表达方式改写用户提供的文本，保持原意但换一种说法。
+直接输出改写后的文本，不要添加任何解释或前缀。""",
 
-    "outline": """请根据以下信息生成一份详细的报告大纲。
+    "continue": """请根据用户提供的已有内容的上下文，续写后续内容。保持风格一致，内容连贯。
+直接输出续写的内容，不要添加任何解释或前缀。""",
 
-报告主题：{topic}
-报告类型：{report_type}
-目标受众：{audience}
-{additional_info}
+    "explain": """请解释用户提供的文本中的专业术语或概念，用通俗易懂的语言说明。""",
+
+    "translate_en": """请将用户提供的文本翻译成英文，保持专业性和准确性。
+直接输出翻译结果，不要添加任何解释。""",
+
+    "translate_zh": """请将用户提供的文本翻译成中文，保持专业性和准确性。
+直接输出翻译结果，不要添加任何解释。""",
+
+    "ask": """请根据用户提供的参考内容回答用户的问题；没有参考内容时直接回答。""",
+
+    "outline": """请根据用户给出的报告主题、报告类型和目标受众生成一份详细的报告大纲。
 
 要求：
 1. 生成清晰的多级标题结构（使用 Markdown 格式）
 2. 每个章节包含简要说明
 3. 结构合理，逻辑清晰
-4. 适合 {report_type} 类型的报告
+4. 符合给定报告类型的写作规范
 
 请直接输出 Markdown 格式的大纲，不要添加任何解释。"""
 }
 
+# 用户消息中文本的标题
+TEXT_LABELS = {
+    "continue": "已有内容",
+    "explain": "文本",
+    "custom": "文本"
+}
 
-async def stream_ai_response(
+
+def build_messages(
     text: str,
     action: str,
-    custom_prompt: Optional[str] = None
-) -> AsyncGenerator[str, None]:
+    custom_prompt: Optional[str] = None,
+    context_key: Optional[str] = None
+) -> List[Dict[str, str]]:
     """
-    流式调用 DeepSeek API
+    根据操作类型构建发送给模型的消息列表
     
-    Args:
-        text: 要处理的文本
-        action: 操作类型 (polish/expand/condense/rewrite/continue/explain/custom)
-        custom_prompt: 自定义 prompt（当 action 为 custom 时使用）
+    固定的系统提示和操作指令放在 system 消息中，参考内容在前、选中文本和问题在最后。
+    问答模式下参考内容过长时只保留与问题相关的片段，context_key 为检索索引的缓存键。
     
-    Yields:
-        AI 生成的文本片段
+    Raises:
+        ValueError: 操作类型不支持、参数格式错误或文本过长
     """
-    # 构建 prompt
     if action == "ask":
         # 问答模式：custom_prompt 是用户的问题，text 是可选的上下文
+        instruction = PROMPTS["ask"]
         if text and text.strip():
-            prompt = f"""请根据以下参考内容回答用户的问题。
-
-参考内容：
-{text}
+            context = select_context(custom_prompt or "", text, context_key)
+            content = f"""参考内容：
+{context}
 
 用户问题：
 {custom_prompt}"""
         else:
-            prompt = custom_prompt or ""
+            content = custom_prompt or ""
     elif action == "outline":
         # 大纲生成模式：custom_prompt 包含 JSON 格式的参数
-        import json
         try:
             params = json.loads(custom_prompt) if custom_prompt else {}
             topic = params.get('topic', '')
@@ -126,53 +211,130 @@ async def stream_ai_response(
             audience = params.get('audience', '一般读者')
             additional_requirements = params.get('additional_requirements', '')
             
-            additional_info = f"其他要求：{additional_requirements}" if additional_requirements else ""
+            additional_info = f"\n其他要求：{additional_requirements}" if additional_requirements else ""
             
-            prompt = PROMPTS["outline"].format(
-                topic=topic,
-                report_type=report_type,
-                audience=audience,
-                additional_info=additional_info
-            )
+            instruction = PROMPTS["outline"]
+            content = f"""报告主题：{topic}
+报告类型：{report_type}
+目标受众：{audience}{additional_info}"""
         except:
             raise ValueError("大纲生成参数格式错误")
-    elif action == "custom" and custom_prompt:
-        prompt = PROMPTS["custom"].format(prompt=custom_prompt, text=text)
+    elif action == "custom":
+        if not custom_prompt:
+            raise ValueError("自定义操作需要提供 prompt")
+        instruction = custom_prompt
+        content = f"{TEXT_LABELS['custom']}：\n{text}"
     elif action in PROMPTS:
-        prompt = PROMPTS[action].format(text=text)
+        instruction = PROMPTS[action]
+        content = f"{TEXT_LABELS.get(action, '原文')}：\n{text}"
     else:
         raise ValueError(f"不支持的操作类型: {action}")
     
-    # 限制输入长度（约 2000 字），问答模式可以没有文本
-    if action != "ask" and len(text) > 6000:
+    check_text_length(text, action)
+    
+    return [
+        {"role": "system", "content": f"{SYSTEM_PROMPT}\n\n{instruction}"},
+        {"role": "user", "content": content}
+    ]
+
+
+def check_text_length(text: str, action: str) -> None:
+    """
+    按操作检查输入长度，接口在准入之前调用，过长时直接返回 422
+
+    问答模式不限制（参考内容会先检索出相关片段）；支持分段的操作放宽到长文本上限；其余操作最多 MAX_TEXT_LENGTH 字。
+
+    Raises:
+        ValueError: 文本过长
+    """
+    if action in LONG_TEXT_ACTIONS:
+        if len(text) > settings.AI_LONG_TEXT_MAX_CHARS:
+            raise ValueError(f"文本过长，最多支持 {settings.AI_LONG_TEXT_MAX_CHARS} 字")
+    elif action != "ask" and len(text) > MAX_TEXT_LENGTH:
         raise ValueError("文本过长，请选择较短的内容（建议 2000 字以内）")
+
+
+def get_cache_key(
+    text: str,
+    action: str,
+    custom_prompt: Optional[str] = None
+) -> Optional[str]:
+    """返回结果缓存键；该操作不可缓存或缓存未启用时返回 None"""
+    if not settings.AI_CACHE_ENABLED or action not in CACHEABLE_ACTIONS:
+        return None
+    return make_cache_key(action, text, custom_prompt, DEEPSEEK_MODEL, DEFAULT_TEMPERATURE)
+
+
+class _ConnectTimer:
+    """httpcore trace 回调：累计本次请求建立 TCP 和 TLS 连接的耗时"""
+    
+    def __init__(self):
+        self.seconds = 0.0
+        self._started: Dict[str, float] = {}
     
+    async def __call__(self, event: str, info: dict) -> None:
+        if not event.startswith(("connection.connect_tcp.", "connection.start_tls.")):
+            return
+        step, _, phase = event.rpartition(".")
+        if phase == "started":
+            self._started[step] = time.perf_counter()
+        elif step in self._started:
+            self.seconds += time.perf_counter() - self._started.pop(step)
+
+
+def _stream_upstream(messages: List[Dict[str, str]], action: str) -> AsyncGenerator[str, None]:
+    """经路由层选择端点（失败重试、对冲请求）流式请求上游，逐个产出文本增量"""
+    return upstream_router.stream(lambda endpoint: _stream_endpoint(endpoint, messages, action))
+
+
+async def _stream_endpoint(
+    endpoint: UpstreamEndpoint,
+    messages: List[Dict[str, str]],
+    action: str
+) -> AsyncGenerator[str, None]:
+    """
+    通过共享客户端向指定端点发起流式请求，逐个产出文本增量
+    
+    同时记录连接耗时、首 token 时间、增量个数、输出速率、总耗时和结束状态（按 action 区分），
+    以及最后一帧 usage 中的前缀缓存命中情况。
+    """
     headers = {
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
+        "Authorization": f"Bearer {endpoint.api_key}",
         "Content-Type": "application/json"
     }
     
     payload = {
-        "model": "deepseek-chat",
-        "messages": [
-            {"role": "system", "content": "你是一个专业的写作助手，帮助用户优化和改进文本内容。"},
-            {"role": "user", "content": prompt}
-        ],
+        "model": endpoint.model,
+        "messages": messages,
         "stream": True,
-        "temperature": 0.7,
-        "max_tokens": 2000
+        "stream_options": {"include_usage": True},
+        "temperature": DEFAULT_TEMPERATURE,
+        "max_tokens": DEFAULT_MAX_TOKENS
     }
     
-    async with httpx.AsyncClient(timeout=60.0) as client:
+    client = get_http_client()
+    connect_timer = _ConnectTimer()
+    started = time.perf_counter()
+    first_chunk_at = None
+    chunk_count = 0
+    char_count = 0
+    outcome = "error"
+    try:
         async with client.stream(
             "POST",
-            f"{DEEPSEEK_API_BASE}/chat/completions",
+            f"{endpoint.base_url}/chat/completions",
             headers=headers,
-            json=payload
+            json=payload,
+            extensions={"trace": connect_timer}
         ) as response:
+            AI_UPSTREAM_CONNECT_SECONDS.labels(action).observe(connect_timer.seconds)
+            AI_UPSTREAM_HEADERS_SECONDS.labels(action).observe(time.perf_counter() - started)
             if response.status_code != 200:
                 error_text = await response.aread()
-                raise Exception(f"API 调用失败: {response.status_code} - {error_text.decode()}")
+                raise UpstreamError(
+                    f"API 调用失败: {response.status_code} - {error_text.decode()}",
+                    response.status_code
+                )
             
             async for line in response.aiter_lines():
                 if line.startswith("data: "):
@@ -182,23 +344,450 @@ async def stream_ai_response(
                     try:
                         chunk = json.loads(data)
                         if chunk.get("choices") and chunk["choices"][0].get("delta", {}).get("content"):
-                            yield chunk["choices"][0]["delta"]["content"]
+                            content = chunk["choices"][0]["delta"]["content"]
+                            if first_chunk_at is None:
+                                first_chunk_at = time.perf_counter()
+                                AI_UPSTREAM_TTFT_SECONDS.labels(action).observe(first_chunk_at - started)
+                            chunk_count += 1
+                            char_count += len(content)
+                            yield content
+                        if chunk.get("usage"):
+                            # include_usage 时最后一帧带有本次调用的 token 用量
+                            record_usage(action, chunk["usage"])
                     except json.JSONDecodeError:
                         continue
+        outcome = "success"
+    except (asyncio.CancelledError, GeneratorExit):
+        # 取消时退出 async with 会立即关闭上游响应和连接，不再继续生成
+        outcome = "cancelled"
+        raise
+    finally:
+        finished = time.perf_counter()
+        AI_STREAMS_TOTAL.labels(action, outcome).inc()
+        AI_STREAM_DURATION_SECONDS.labels(action, outcome).observe(finished - started)
+        if outcome == "success":
+            AI_STREAM_CHUNKS.labels(action).observe(chunk_count)
+            if first_chunk_at is not None and finished > first_chunk_at:
+                AI_STREAM_CHARS_PER_SECOND.labels(action).observe(char_count / (finished - first_chunk_at))
+
+
+class _InflightCall:
+    """一次正在进行的上游调用：缓冲已产出的片段，供所有订阅者读取"""
+    
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.changed = asyncio.Event()
+        # 上游调用上报的 usage
+        self.usages: List[dict] = []
+    
+    def notify(self) -> None:
+        """唤醒所有等待新片段的订阅者"""
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    """
+    合并并发的相同请求：同一个 key 同时只有一个上游调用，
+    所有订阅者都能收到完整的片段序列，后加入者先收到已缓冲的前缀。
+    最后一个订阅者离开时取消上游调用，并以已产出的片段数回调 on_abandon；
+    后加入者完整收到结果后以上游调用的 usage 回调 on_joined（在后加入者自己的上下文中执行）。
+    """
+    
+    def __init__(self):
+        self._calls: Dict[str, _InflightCall] = {}
+        self.leaders = 0
+        self.joiners = 0
+    
+    async def stream(
+        self,
+        key: str,
+        factory: Callable[[], AsyncGenerator[str, None]],
+        on_abandon: Optional[Callable[[int], None]] = None,
+        on_joined: Optional[Callable[[List[dict]], None]] = None
+    ) -> AsyncGenerator[str, None]:
+        call = self._calls.get(key)
+        joined = call is not None
+        if call is None:
+            call = _InflightCall()
+            self._calls[key] = call
+            call.task = asyncio.create_task(self._run(key, call, factory))
+            self.leaders += 1
+        else:
+            self.joiners += 1
+        
+        call.subscribers += 1
+        index = 0
+        try:
+            while True:
+                if index < len(call.chunks):
+                    chunk = call.chunks[index]
+                    index += 1
+                    yield chunk
+                    continue
+                if call.done:
+                    if call.error is not None:
+                        raise call.error
+                    if joined and on_joined is not None:
+                        on_joined(call.usages)
+                    return
+                await call.changed.wait()
+        finally:
+            call.subscribers -= 1
+            if call.subscribers == 0 and not call.done:
+                # 没有订阅者了，停止上游生成；之后的相同请求重新发起
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+                if on_abandon is not None:
+                    on_abandon(len(call.chunks))
+    
+    async def _run(
+        self,
+        key: str,
+        call: _InflightCall,
+        factory: Callable[[], AsyncGenerator[str, None]]
+    ) -> None:
+        # 任务有独立的上下文副本，这里设置只影响本次上游调用
+        usage_collector.set(call.usages)
+        try:
+            async for chunk in factory():
+                call.chunks.append(chunk)
+                call.notify()
+        except asyncio.CancelledError:
+            call.error = Exception("AI 生成已取消")
+            raise
+        except Exception as e:
+            call.error = e
+        finally:
+            call.done = True
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            call.notify()
+    
+    def inflight(self) -> int:
+        return len(self._calls)
+
+
+# 全局单飞实例
+_single_flight = SingleFlight()
+AI_SINGLE_FLIGHT_INFLIGHT.set_function(_single_flight.inflight)
+
+
+async def _generate(
+    messages: List[Dict[str, str]],
+    action: str,
+    cache_key: Optional[str]
+) -> AsyncGenerator[str, None]:
+    """请求上游并在完整生成后写入结果缓存（中途取消不会写入）"""
+    parts = []
+    async for chunk in _stream_upstream(messages, action):
+        parts.append(chunk)
+        yield chunk
+    
+    if cache_key and parts:
+        await ai_result_cache.store(cache_key, "".join(parts))
+
+
+def _shared_generate(
+    text: str,
+    action: str,
+    custom_prompt: Optional[str],
+    messages: List[Dict[str, str]],
+    cache_key: Optional[str]
+) -> AsyncGenerator[str, None]:
+    """经单飞层请求上游，并发的相同请求共享同一个上游调用"""
+    flight_key = cache_key or make_cache_key(
+        action, text, custom_prompt, DEEPSEEK_MODEL, DEFAULT_TEMPERATURE
+    )
+    
+    def on_abandon(produced: int) -> None:
+        # 上游的增量大致每个对应一个 token；取消时拿不到 usage，只能按 max_tokens 估算上限
+        AI_ABANDONED_TOKENS_ESTIMATED_TOTAL.labels(action).inc(max(0, DEFAULT_MAX_TOKENS - produced))
+    
+    def on_joined(usages: List[dict]) -> None:
+        # 合并到他人调用的请求同样按完整用量计入当前用户
+        record_shared_usage(action, usages)
+    
+    return _single_flight.stream(flight_key, lambda: _generate(messages, action, cache_key), on_abandon, on_joined)
+
+
+def _subtask_slots() -> Optional[SubtaskSlots]:
+    """当前请求的子任务槽位；未经准入控制的调用（如脚本）返回 None，只受调用方的并发数限制"""
+    user_id = usage_user.get()
+    return ai_admission.subtask_slots(user_id) if user_id is not None else None
+
+
+def is_long_text(text: str, action: str) -> bool:
+    """是否使用长文本分段模式"""
+    return action in LONG_TEXT_ACTIONS and len(text) > settings.AI_LONG_TEXT_THRESHOLD
+
+
+async def _stream_long_text(
+    text: str,
+    action: str,
+    custom_prompt: Optional[str]
+) -> AsyncGenerator[str, None]:
+    """
+    长文本分段模式：按标题和段落切分后并发处理各片段（并发数有上限），
+    按原文顺序输出——排在最前面的未完成片段实时输出，后面的片段先缓冲，
+    前缀全部完成后立即输出。总耗时接近最慢的片段而不是所有片段之和。
+    
+    并发的片段计入用户的并发额度：请求自身的准入槽位同一时间只给一个片段使用，
+    其余片段向准入控制器借用额外槽位，借不到时等待请求自身的槽位。
+    """
+    chunks = split_text(text, settings.AI_LONG_TEXT_CHUNK_CHARS)
+    semaphore = asyncio.Semaphore(settings.AI_LONG_TEXT_PARALLELISM)
+    queues: List[asyncio.Queue] = [asyncio.Queue() for _ in chunks]
+    slots = _subtask_slots()
+    
+    async def worker(index: int, chunk: str) -> None:
+        queue = queues[index]
+        try:
+            async with semaphore:
+                release = await slots.acquire() if slots is not None else None
+                try:
+                    # 每个片段都经过结果缓存和单飞层，修改一段后只有该段需要重新请求
+                    messages = build_messages(chunk, action, custom_prompt)
+                    async for piece in _stream_single(chunk, action, custom_prompt, messages):
+                        queue.put_nowait(piece)
+                finally:
+                    if release is not None:
+                        release()
+            queue.put_nowait(None)
+        except Exception as e:
+            queue.put_nowait(e)
+    
+    tasks = [asyncio.create_task(worker(i, chunk)) for i, (chunk, _) in enumerate(chunks)]
+    try:
+        for (_, separator), queue in zip(chunks, queues):
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+            if separator:
+                yield separator
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def _stream_single(
+    text: str,
+    action: str,
+    custom_prompt: Optional[str],
+    messages: List[Dict[str, str]]
+) -> AsyncGenerator[str, None]:
+    """单次请求：命中结果缓存时切片回放，否则经单飞层请求上游"""
+    cache_key = get_cache_key(text, action, custom_prompt)
+    if cache_key:
+        cached = await ai_result_cache.lookup(cache_key)
+        if cached is not None:
+            for piece in iter_replay_chunks(cached, settings.AI_CACHE_REPLAY_CHUNK_SIZE):
+                yield piece
+            return
+    
+    async for chunk in _shared_generate(text, action, custom_prompt, messages, cache_key):
+        yield chunk
+
+
+async def stream_ai_response(
+    text: str,
+    action: str,
+    custom_prompt: Optional[str] = None,
+    context_key: Optional[str] = None
+) -> AsyncGenerator[str, None]:
+    """
+    流式调用 DeepSeek API
+    
+    可缓存的操作命中结果缓存时，直接把缓存结果切片回放，不请求上游。
+    
+    Args:
+        text: 要处理的文本
+        action: 操作类型 (polish/expand/condense/rewrite/continue/explain/custom)
+        custom_prompt: 自定义 prompt（当 action 为 custom 时使用）
+        context_key: 问答模式参考内容的检索索引缓存键（如 "draft:12"）
+    
+    Yields:
+        AI 生成的文本片段
+    """
+    messages = build_messages(text, action, custom_prompt, context_key)
+    
+    if is_long_text(text, action):
+        async for chunk in _stream_long_text(text, action, custom_prompt):
+            yield chunk
+        return
+    
+    async for chunk in _stream_single(text, action, custom_prompt, messages):
+        yield chunk
 
 
 async def call_ai(
     text: str,
     action: str,
-    custom_prompt: Optional[str] = None
+    custom_prompt: Optional[str] = None,
+    context_key: Optional[str] = None
 ) -> str:
     """
     非流式调用 DeepSeek API（用于简单场景）
     
+    命中结果缓存时直接返回缓存结果。
+    
     Returns:
         完整的 AI 响应文本
     """
+    messages = build_messages(text, action, custom_prompt, context_key)
+    
+    if is_long_text(text, action):
+        return "".join([chunk async for chunk in _stream_long_text(text, action, custom_prompt)])
+    
+    cache_key = get_cache_key(text, action, custom_prompt)
+    if cache_key:
+        cached = await ai_result_cache.lookup(cache_key)
+        if cached is not None:
+            return cached
+    
     result = []
-    async for chunk in stream_ai_response(text, action, custom_prompt):
+    async for chunk in _shared_generate(text, action, custom_prompt, messages, cache_key):
         result.append(chunk)
     return "".join(result)
+
+
+async def process_batch(
+    items: List[dict],
+    parallelism: int
+) -> AsyncGenerator[dict, None]:
+    """
+    并发处理一批文本，按完成顺序逐条产出结果
+    
+    每一项独立处理，单项失败不影响其他项。整批只在准入时消耗一次限流令牌，
+    正在处理的每一项各占一个并发槽位（见 SubtaskSlots），实际并发不超过单用户上限。
+    
+    Args:
+        items: 每项包含 id/text/action/custom_prompt
+        parallelism: 最大并发数
+    
+    Yields:
+        {"id", "action", "success", "result"} 或 {"id", "action", "success", "error"}
+    """
+    semaphore = asyncio.Semaphore(parallelism)
+    results: asyncio.Queue = asyncio.Queue()
+    slots = _subtask_slots()
+    
+    async def worker(item: dict) -> None:
+        outcome = {"id": item["id"], "action": item["action"]}
+        try:
+            async with semaphore:
+                release = await slots.acquire() if slots is not None else None
+                try:
+                    result = await call_ai(item["text"], item["action"], item.get("custom_prompt"))
+                finally:
+                    if release is not None:
+                        release()
+            outcome.update(success=True, result=result)
+        except ValueError as e:
+            outcome.update(success=False, error=str(e))
+        except Exception as e:
+            outcome.update(success=False, error=f"AI 处理失败: {str(e)}")
+        results.put_nowait(outcome)
+    
+    tasks = [asyncio.create_task(worker(item)) for item in items]
+    try:
+        for _ in range(len(tasks)):
+            yield await results.get()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def stream_multi_action(
+    text: str,
+    actions: List[str],
+    custom_prompt: Optional[str] = None,
+    wrap: Optional[Callable[[str, AsyncGenerator[str, None]], AsyncIterator[str]]] = None
+) -> AsyncGenerator[Tuple[str, str, str], None]:
+    """
+    对同一段文本并发执行多个操作，按到达顺序交错产出带操作标记的事件
+    
+    每个操作独立经过结果缓存、单飞和上游路由，单个操作失败不影响其他操作。
+    
+    Args:
+        text: 要处理的文本
+        actions: 操作类型列表
+        custom_prompt: 自定义 prompt（当 action 为 custom 时使用）
+        wrap: 包装每个操作的片段流（如准入控制、增量合并），参数为 (操作, 片段流)
+    
+    Yields:
+        (操作, "chunk", 文本片段)、(操作, "done", "") 或 (操作, "error", 错误信息)
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    
+    async def worker(action: str) -> None:
+        chunks = stream_ai_response(text, action, custom_prompt)
+        source = wrap(action, chunks) if wrap is not None else chunks
+        try:
+            async for chunk in source:
+                events.put_nowait((action, "chunk", chunk))
+            events.put_nowait((action, "done", ""))
+        except (ValueError, AdmissionRejected) as e:
+            events.put_nowait((action, "error", str(e)))
+        except Exception as e:
+            events.put_nowait((action, "error", f"AI 处理失败: {str(e)}"))
+        finally:
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+    
+    tasks = [asyncio.create_task(worker(action)) for action in actions]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await events.get()
+            if event[1] != "chunk":
+                remaining -= 1
+            yield event
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def stream_outline(params: str, user_id: int, refresh: bool = False) -> AsyncGenerator[OutlineEvent, None]:
+    """
+    流式生成大纲并增量解析为结构化事件
+    
+    每读完一行标题产出一个节点事件，普通行产出说明文字追加事件。完整生成的大纲解析结果按用户和参数缓存，
+    同一用户再次请求时直接回放节点事件，不请求上游；不同用户之间不共用生成结果。
+    
+    Args:
+        params: JSON 格式的大纲参数（topic/report_type/audience/additional_requirements）
+        user_id: 请求的用户，缓存按用户隔离
+        refresh: 为 True 时忽略缓存重新生成（“重新生成”）
+    
+    Yields:
+        ("node", {id, parent, level, title}) 或 ("text", {id, text})
+    """
+    key = make_cache_key("outline", f"user:{user_id}", params, DEEPSEEK_MODEL, DEFAULT_TEMPERATURE)
+    if not refresh:
+        cached = outline_cache.get(key)
+        if cached is not None:
+            for event in cached.events():
+                yield event
+            return
+    
+    parser = OutlineParser()
+    async for chunk in stream_ai_response("", "outline", params):
+        for event in parser.feed(chunk):
+            yield event
+    for event in parser.close():
+        yield event
+    outline_cache.put(key, parser.result())
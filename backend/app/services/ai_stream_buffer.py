@@ -0,0 +1,275 @@
+"""
+可续传的 AI 流
+每个 /ai/stream 响应对应一个流 ID，第一个读者连接后在后台任务中开始生成，输出的帧按序号缓存在内存中。
+客户端断线重连时携带 Last-Event-ID（格式 "<流ID>:<序号>"），从缓冲区续传而不必重新请求上游；
+生成已结束的流在 TTL 内可以完整回放。创建后一直没有读者连接的流在 attach_timeout 秒后作废。
+"""
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import AsyncGenerator, AsyncIterator, Callable, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+class StreamExpired(Exception):
+    """请求续传的位置已不在缓冲区内（流不存在、已过期或已被截断）"""
+
+
+class StreamCapacityExceeded(Exception):
+    """进行中的流已达上限，无法创建新流"""
+
+
+class BufferedStream:
+    """一个可续传流：后台生成任务 + 有界帧缓冲"""
+
+    def __init__(self, stream_id: str, user_id: int, max_frames: int, resume_grace: float):
+        self.id = stream_id
+        self.user_id = user_id
+        self.max_frames = max_frames
+        self.resume_grace = resume_grace
+        # frames[i] 的序号为 base_seq + i，序号从 1 开始
+        self.frames: List[str] = []
+        self.base_seq = 1
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.finished_at: Optional[float] = None
+        self.changed = asyncio.Event()
+        self._cancel_handle: Optional[asyncio.TimerHandle] = None
+        # 尚未开始生成时保存的工厂函数和结束回调
+        self._factory: Optional[Callable[[], AsyncIterator[str]]] = None
+        self._on_finish: Optional[Callable[[], None]] = None
+
+    @property
+    def last_seq(self) -> int:
+        return self.base_seq + len(self.frames) - 1
+
+    def append(self, content: str) -> None:
+        self.frames.append(content)
+        if len(self.frames) > self.max_frames:
+            # 环形缓冲：丢弃最旧的帧，过旧的续传位置将无法恢复
+            drop = len(self.frames) - self.max_frames
+            del self.frames[:drop]
+            self.base_seq += drop
+        self.notify()
+
+    def notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.id}:{seq}"
+
+
+class StreamRegistry:
+    """
+    可续传流的注册表，完成后的流保留 ttl 秒
+
+    数量达到上限时依次淘汰已完成的流、没有读者（等待重连）的流，仍然超出时拒绝创建新流。
+    """
+
+    def __init__(self, max_streams: int, max_frames: int, ttl: float, resume_grace: float, attach_timeout: float):
+        self.max_streams = max_streams
+        self.max_frames = max_frames
+        self.ttl = ttl
+        self.resume_grace = resume_grace
+        self.attach_timeout = attach_timeout
+        self._streams: "OrderedDict[str, BufferedStream]" = OrderedDict()
+
+    def start(
+        self,
+        user_id: int,
+        factory: Callable[[], AsyncIterator[str]],
+        on_finish: Optional[Callable[[], None]] = None,
+        resumable: bool = False
+    ) -> BufferedStream:
+        """
+        创建流，第一个读者连接（follow）时才在后台任务中开始生成
+
+        客户端在读取响应前就断开时不会调用上游；attach_timeout 秒内没有读者连接的流直接作废并调用 on_finish。
+
+        Args:
+            user_id: 流的所有者，只有所有者可以续传
+            factory: 返回文本帧异步迭代器的工厂函数
+            on_finish: 生成结束（含取消、出错、未开始即作废）时调用
+            resumable: 为 False 时最后一个读者断开立即取消生成，不等待重连
+
+        Raises:
+            StreamCapacityExceeded: 进行中的流已达上限
+        """
+        self._evict()
+        if len(self._streams) >= self.max_streams:
+            raise StreamCapacityExceeded("AI 服务繁忙，请稍后再试")
+        grace = self.resume_grace if resumable else 0
+        stream = BufferedStream(uuid.uuid4().hex, user_id, self.max_frames, grace)
+        stream._factory = factory
+        stream._on_finish = on_finish
+        self._streams[stream.id] = stream
+        loop = asyncio.get_running_loop()
+        stream._cancel_handle = loop.call_later(self.attach_timeout, self._cancel_if_abandoned, stream)
+        return stream
+
+    def _ensure_started(self, stream: BufferedStream) -> None:
+        if stream.task is None and not stream.done:
+            factory, on_finish = stream._factory, stream._on_finish
+            stream._factory = stream._on_finish = None
+            stream.task = asyncio.create_task(self._produce(stream, factory, on_finish))
+
+    @staticmethod
+    def _discard_unstarted(stream: BufferedStream) -> None:
+        """作废尚未开始生成的流"""
+        on_finish = stream._on_finish
+        stream._factory = stream._on_finish = None
+        stream.error = StreamExpired("AI 生成已取消")
+        stream.done = True
+        stream.finished_at = time.time()
+        stream.notify()
+        if on_finish is not None:
+            on_finish()
+
+    async def _produce(
+        self,
+        stream: BufferedStream,
+        factory: Callable[[], AsyncIterator[str]],
+        on_finish: Optional[Callable[[], None]]
+    ) -> None:
+        source = factory()
+        try:
+            async for content in source:
+                stream.append(content)
+        except asyncio.CancelledError:
+            stream.error = StreamExpired("AI 生成已取消")
+            raise
+        except Exception as e:
+            stream.error = e
+        finally:
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            stream.done = True
+            stream.finished_at = time.time()
+            stream.notify()
+            if on_finish is not None:
+                on_finish()
+
+    def get(self, stream_id: str, user_id: int) -> Optional[BufferedStream]:
+        stream = self._streams.get(stream_id)
+        if stream is None or stream.user_id != user_id or self._expired(stream):
+            return None
+        return stream
+
+    def resolve(self, last_event_id: str, user_id: int) -> Tuple[BufferedStream, int]:
+        """
+        解析 Last-Event-ID，返回 (流, 已收到的最后序号)
+
+        Raises:
+            StreamExpired: ID 格式错误、流不存在或已过期
+        """
+        stream_id, _, seq = last_event_id.partition(":")
+        stream = self.get(stream_id, user_id)
+        if stream is None or (seq and not seq.isdigit()):
+            raise StreamExpired("流不存在或已过期，请重新发起请求")
+        after_seq = int(seq or 0)
+        if after_seq + 1 < stream.base_seq:
+            raise StreamExpired("续传位置已超出缓冲范围，请重新发起请求")
+        return stream, after_seq
+
+    async def follow(self, stream: BufferedStream, after_seq: int = 0) -> AsyncGenerator[Tuple[int, str], None]:
+        """
+        从 after_seq 之后开始读取流的帧，先回放缓冲内容再跟随实时输出
+
+        最后一个读者离开而生成尚未结束时，等待流的 resume_grace 秒；期间没有读者重新连接就取消生成。
+
+        Raises:
+            StreamExpired: 续传位置已被环形缓冲丢弃
+            Exception: 生成过程中的错误
+        """
+        if after_seq + 1 < stream.base_seq:
+            raise StreamExpired("续传位置已超出缓冲范围，请重新发起请求")
+
+        stream.subscribers += 1
+        if stream._cancel_handle is not None:
+            stream._cancel_handle.cancel()
+            stream._cancel_handle = None
+        self._ensure_started(stream)
+
+        seq = after_seq + 1
+        try:
+            while True:
+                if seq < stream.base_seq:
+                    raise StreamExpired("读取过慢，续传位置已超出缓冲范围")
+                if seq <= stream.last_seq:
+                    content = stream.frames[seq - stream.base_seq]
+                    yield seq, content
+                    seq += 1
+                    continue
+                if stream.done:
+                    if stream.error is not None:
+                        raise stream.error
+                    return
+                await stream.changed.wait()
+        finally:
+            stream.subscribers -= 1
+            if stream.subscribers == 0 and not stream.done:
+                self._schedule_cancel(stream)
+
+    def _schedule_cancel(self, stream: BufferedStream) -> None:
+        if stream.resume_grace <= 0:
+            self.cancel(stream)
+            return
+        loop = asyncio.get_running_loop()
+        stream._cancel_handle = loop.call_later(stream.resume_grace, self._cancel_if_abandoned, stream)
+
+    def _cancel_if_abandoned(self, stream: BufferedStream) -> None:
+        stream._cancel_handle = None
+        if stream.subscribers == 0:
+            self.cancel(stream)
+
+    def cancel(self, stream: BufferedStream) -> None:
+        """客户端主动结束流（如关闭面板），立即取消生成"""
+        if stream._cancel_handle is not None:
+            stream._cancel_handle.cancel()
+            stream._cancel_handle = None
+        if stream.done:
+            return
+        if stream.task is None:
+            self._discard_unstarted(stream)
+        else:
+            stream.task.cancel()
+
+    def _expired(self, stream: BufferedStream) -> bool:
+        return stream.done and stream.finished_at is not None and stream.finished_at + self.ttl < time.time()
+
+    def _evict(self) -> None:
+        """
+        清理过期流；达到上限时按创建顺序先淘汰已完成的流，
+        再取消并淘汰已开始生成但没有读者（等待重连）的流
+        """
+        for stream_id in [sid for sid, s in self._streams.items() if self._expired(s)]:
+            del self._streams[stream_id]
+        for evictable in (
+            lambda s: s.done,
+            lambda s: s.task is not None and s.subscribers == 0
+        ):
+            if len(self._streams) < self.max_streams:
+                return
+            for stream_id in [sid for sid, s in self._streams.items() if evictable(s)]:
+                self.cancel(self._streams.pop(stream_id))
+                if len(self._streams) < self.max_streams:
+                    return
+
+    def active(self) -> int:
+        return sum(1 for s in self._streams.values() if not s.done)
+
+
+# 创建全局可续传流注册表
+ai_stream_registry = StreamRegistry(
+    max_streams=settings.AI_STREAM_BUFFER_MAX_STREAMS,
+    max_frames=settings.AI_STREAM_BUFFER_MAX_FRAMES,
+    ttl=settings.AI_STREAM_BUFFER_TTL,
+    resume_grace=settings.AI_STREAM_RESUME_GRACE,
+    attach_timeout=settings.AI_STREAM_ATTACH_TIMEOUT
+)
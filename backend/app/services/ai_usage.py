@@ -0,0 +1,207 @@
+"""
+AI 用量统计
+解析上游流式响应最后一帧的 usage：按操作统计前缀缓存命中的 prompt token 数，
+并按用户和操作在内存中累计 token 用量，定时批量写入 ai_usage 表（请求路径上没有数据库操作）。
+"""
+import asyncio
+from contextlib import suppress
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.core.metrics import AI_PROMPT_CACHE_TOKENS_TOTAL
+from app.db.database import SessionLocal
+from app.models.ai_usage import AIUsage
+
+# 当前请求的用户 ID；在接口中设置，后台任务（单飞、分段、可续传流）创建时会继承
+usage_user: ContextVar[Optional[int]] = ContextVar("ai_usage_user", default=None)
+
+# 单飞上游调用收集本次调用的 usage，供合并进来的其他请求按各自用户计量
+usage_collector: ContextVar[Optional[List[dict]]] = ContextVar("ai_usage_collector", default=None)
+
+
+def parse_cache_usage(usage: dict) -> Optional[Tuple[int, int]]:
+    """
+    从 usage 中取出 (命中缓存的 prompt token 数, 未命中的 prompt token 数)
+
+    DeepSeek 返回 prompt_cache_hit_tokens / prompt_cache_miss_tokens，
+    其他 OpenAI 兼容服务返回 prompt_tokens_details.cached_tokens；都没有时返回 None。
+    """
+    if "prompt_cache_hit_tokens" in usage or "prompt_cache_miss_tokens" in usage:
+        return int(usage.get("prompt_cache_hit_tokens") or 0), int(usage.get("prompt_cache_miss_tokens") or 0)
+    details = usage.get("prompt_tokens_details") or {}
+    if "cached_tokens" in details:
+        hit = int(details.get("cached_tokens") or 0)
+        return hit, max(0, int(usage.get("prompt_tokens") or 0) - hit)
+    return None
+
+
+class PromptCacheStats:
+    """按操作累计前缀缓存命中/未命中的 prompt token 数"""
+
+    def __init__(self):
+        # action -> [调用次数, 命中 token 数, 未命中 token 数]
+        self._actions: Dict[str, List[int]] = {}
+
+    def record(self, action: str, usage: dict) -> None:
+        parsed = parse_cache_usage(usage)
+        if parsed is None:
+            return
+        hit, miss = parsed
+        entry = self._actions.setdefault(action, [0, 0, 0])
+        entry[0] += 1
+        entry[1] += hit
+        entry[2] += miss
+        AI_PROMPT_CACHE_TOKENS_TOTAL.labels(action, "hit").inc(hit)
+        AI_PROMPT_CACHE_TOKENS_TOTAL.labels(action, "miss").inc(miss)
+
+    def stats(self) -> dict:
+        """每个操作的命中率，以及总体命中率"""
+        actions = {}
+        total_hit = total_miss = 0
+        for action, (calls, hit, miss) in sorted(self._actions.items()):
+            actions[action] = {
+                "calls": calls,
+                "hit_tokens": hit,
+                "miss_tokens": miss,
+                "hit_ratio": round(hit / (hit + miss), 4) if hit + miss else 0.0
+            }
+            total_hit += hit
+            total_miss += miss
+        return {
+            "hit_tokens": total_hit,
+            "miss_tokens": total_miss,
+            "hit_ratio": round(total_hit / (total_hit + total_miss), 4) if total_hit + total_miss else 0.0,
+            "actions": actions
+        }
+
+
+class UsageMeter:
+    """
+    按 (用户, 操作) 在内存中累计 token 用量，每隔 flush_interval 秒批量插入一次
+
+    单飞合并的请求在收到完整结果后按发起调用的那次 usage 计入各自用户（中途断开的不计入），
+    命中结果缓存的请求不产生用量。写入失败时用量合并回内存，下次重试。
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        # (user_id, action) -> [调用次数, prompt token, completion token, 命中缓存的 prompt token]
+        self._pending: Dict[Tuple[Optional[int], str], List[int]] = {}
+        self._period_start = datetime.now()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+
+    def record(self, user_id: Optional[int], action: str, usage: dict) -> None:
+        entry = self._pending.setdefault((user_id, action), [0, 0, 0, 0])
+        entry[0] += 1
+        entry[1] += int(usage.get("prompt_tokens") or 0)
+        entry[2] += int(usage.get("completion_tokens") or 0)
+        cache = parse_cache_usage(usage)
+        if cache is not None:
+            entry[3] += cache[0]
+
+    def pending_for(self, user_id: int) -> Dict[str, List[int]]:
+        """某个用户尚未写入数据库的用量，按操作返回"""
+        return {action: list(v) for (uid, action), v in self._pending.items() if uid == user_id}
+
+    async def flush(self) -> int:
+        """把累计的用量作为一个统计周期批量写入，返回写入的行数"""
+        now = datetime.now()
+        if not self._pending:
+            self._period_start = now
+            return 0
+
+        pending, self._pending = self._pending, {}
+        period_start, self._period_start = self._period_start, now
+        rows = [
+            {
+                "user_id": user_id,
+                "action": action,
+                "calls": calls,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "cache_hit_tokens": cache_hit_tokens,
+                "period_start": period_start,
+                "period_end": now
+            }
+            for (user_id, action), (calls, prompt_tokens, completion_tokens, cache_hit_tokens) in pending.items()
+        ]
+        try:
+            await asyncio.to_thread(self._write, rows)
+        except Exception as e:
+            print(f"AI 用量写入失败，下次重试: {str(e)}")
+            self.failures += 1
+            for key, values in pending.items():
+                entry = self._pending.setdefault(key, [0, 0, 0, 0])
+                for i, value in enumerate(values):
+                    entry[i] += value
+            self._period_start = period_start
+            return 0
+
+        self.flushes += 1
+        self.rows_written += len(rows)
+        return len(rows)
+
+    @staticmethod
+    def _write(rows: List[dict]) -> None:
+        db = SessionLocal()
+        try:
+            db.execute(insert(AIUsage), rows)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        """启动定时写入（应用启动时调用）"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止定时写入并写入剩余用量（应用关闭时调用）"""
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_keys": len(self._pending),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "failures": self.failures
+        }
+
+
+# 创建全局前缀缓存统计和用量计量实例
+prompt_cache_stats = PromptCacheStats()
+usage_meter = UsageMeter(flush_interval=settings.AI_USAGE_FLUSH_INTERVAL)
+
+
+def record_usage(action: str, usage: dict) -> None:
+    """记录一次上游调用的 usage（前缀缓存统计 + 当前用户的用量累计）"""
+    prompt_cache_stats.record(action, usage)
+    collector = usage_collector.get()
+    if collector is not None:
+        collector.append(usage)
+    if settings.AI_USAGE_ENABLED:
+        usage_meter.record(usage_user.get(), action, usage)
+
+
+def record_shared_usage(action: str, usages: List[dict]) -> None:
+    """合并到他人上游调用的请求收到完整结果后，把该调用的 usage 计入当前用户（不重复计入前缀缓存统计）"""
+    if settings.AI_USAGE_ENABLED:
+        for usage in usages:
+            usage_meter.record(usage_user.get(), action, usage)
@@ -0,0 +1,209 @@
+"""
+问答模式的参考内容检索
+参考内容较长时不再整体放进 prompt，而是按段落切分后用 BM25 检索与问题最相关的片段，
+在 token 预算内发送给模型。分词使用中文字符二元组 + 英文单词，不依赖分词库。
+每份草稿的索引会被缓存，内容变化时只对新增或修改的段落重新分词。
+"""
+import re
+import math
+import hashlib
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.text_chunker import split_text
+
+# 中日韩文字
+CJK_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]+")
+# 英文单词和数字
+WORD_RE = re.compile(r"[a-z0-9]+(?:['._-][a-z0-9]+)*")
+
+# 被省略的片段之间的分隔
+OMITTED_SEP = "\n\n……\n\n"
+
+
+def tokenize(text: str) -> List[str]:
+    """分词：连续汉字切成二元组（单字成词），其余部分取小写英文单词和数字"""
+    text = text.lower()
+    tokens: List[str] = []
+    for run in CJK_RE.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(WORD_RE.findall(CJK_RE.sub(" ", text)))
+    return tokens
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：汉字约 0.6 个 token，其余字符约 0.3 个"""
+    cjk = sum(len(run) for run in CJK_RE.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+
+class _Passage:
+    """一个检索片段及其词频"""
+
+    __slots__ = ("text", "terms", "length", "tokens")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.terms = Counter(tokenize(text))
+        self.length = sum(self.terms.values())
+        self.tokens = estimate_tokens(text)
+
+
+class BM25Index:
+    """片段级 BM25 索引"""
+
+    def __init__(self, passage_chars: int, k1: float = 1.5, b: float = 0.75):
+        self.passage_chars = passage_chars
+        self.k1 = k1
+        self.b = b
+        self.passages: List[_Passage] = []
+        self.doc_freq: Counter = Counter()
+        self.avg_length = 0.0
+
+    def build(self, text: str) -> int:
+        """
+        （重新）建立索引，内容未变的片段复用已有的分词结果
+
+        Returns:
+            本次重新分词的片段数
+        """
+        reusable: Dict[str, _Passage] = {p.text: p for p in self.passages}
+        passages = []
+        tokenized = 0
+        for chunk, _ in split_text(text, self.passage_chars):
+            passage = reusable.get(chunk)
+            if passage is None:
+                passage = _Passage(chunk)
+                tokenized += 1
+            passages.append(passage)
+
+        doc_freq: Counter = Counter()
+        for passage in passages:
+            doc_freq.update(passage.terms.keys())
+        self.passages = passages
+        self.doc_freq = doc_freq
+        self.avg_length = sum(p.length for p in passages) / len(passages) if passages else 0.0
+        return tokenized
+
+    def scores(self, query: str) -> List[float]:
+        """问题与每个片段的 BM25 得分"""
+        n = len(self.passages)
+        terms = set(tokenize(query))
+        idf = {
+            t: math.log(1 + (n - self.doc_freq[t] + 0.5) / (self.doc_freq[t] + 0.5))
+            for t in terms if self.doc_freq.get(t)
+        }
+        result = []
+        for passage in self.passages:
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * passage.length / (self.avg_length or 1))
+            for term, weight in idf.items():
+                tf = passage.terms.get(term)
+                if tf:
+                    score += weight * tf * (self.k1 + 1) / (tf + norm)
+            result.append(score)
+        return result
+
+    def search(self, query: str, top_k: int, token_budget: int) -> List[str]:
+        """
+        选出得分最高的至多 top_k 个片段，总 token 数不超过预算，按原文顺序返回
+        """
+        scores = self.scores(query)
+        ranked = sorted(
+            (i for i, score in enumerate(scores) if score > 0),
+            key=lambda i: scores[i],
+            reverse=True
+        )
+        chosen = []
+        used = 0
+        for i in ranked:
+            if len(chosen) >= top_k:
+                break
+            if used + self.passages[i].tokens > token_budget:
+                continue
+            chosen.append(i)
+            used += self.passages[i].tokens
+        return [self.passages[i].text for i in sorted(chosen)]
+
+
+class ContextIndexCache:
+    """按草稿（或内容摘要）缓存 BM25 索引，LRU 淘汰"""
+
+    def __init__(self, max_entries: int, passage_chars: int):
+        self.max_entries = max_entries
+        self.passage_chars = passage_chars
+        # key -> (内容摘要, 索引)
+        self._entries: "OrderedDict[str, Tuple[str, BM25Index]]" = OrderedDict()
+        self.hits = 0
+        self.rebuilds = 0
+        self.builds = 0
+
+    def get_index(self, key: str, text: str) -> BM25Index:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            cached_digest, index = entry
+            if cached_digest == digest:
+                self.hits += 1
+                return index
+            # 草稿内容变化：增量重建
+            index.build(text)
+            self.rebuilds += 1
+        else:
+            index = BM25Index(self.passage_chars)
+            index.build(text)
+            self.builds += 1
+            while len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+        self._entries[key] = (digest, index)
+        return index
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "builds": self.builds,
+            "rebuilds": self.rebuilds
+        }
+
+
+# 创建全局索引缓存
+context_index_cache = ContextIndexCache(
+    max_entries=settings.AI_ASK_INDEX_CACHE_SIZE,
+    passage_chars=settings.AI_ASK_PASSAGE_CHARS
+)
+
+
+def select_context(question: str, text: str, context_key: Optional[str] = None) -> str:
+    """
+    选择发送给模型的参考内容
+
+    参考内容在 token 预算内时原样返回；否则返回与问题最相关的片段（按原文顺序，省略处用省略号分隔）。
+    没有相关片段时返回原文开头预算内的部分。
+
+    Args:
+        question: 用户问题
+        text: 完整参考内容
+        context_key: 索引缓存键（如 "draft:12"），为空时按内容摘要缓存
+    """
+    budget = settings.AI_ASK_CONTEXT_TOKENS
+    if estimate_tokens(text) <= budget:
+        return text
+
+    key = context_key or "text:" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+    index = context_index_cache.get_index(key, text)
+    passages = index.search(question, settings.AI_ASK_TOP_K, budget)
+    if not passages:
+        passages = []
+        used = 0
+        for passage in index.passages:
+            if used + passage.tokens > budget:
+                break
+            passages.append(passage.text)
+            used += passage.tokens
+    return OMITTED_SEP.join(passages)
@@ -0,0 +1,196 @@
+"""
+Word 文档文本提取
+直接从 zip 中流式读取 word/document.xml，用 iterparse 逐段产出文本，处理完的元素立即清除，
+内存占用与文档大小无关；达到调用方给出的字数或行数上限后立即停止解析。
+可选输出结构：标题转为 Markdown 标题，列表项加 "- " 前缀，表格按行输出为 Markdown 表格。
+"""
+import re
+from typing import Dict, Iterator, List, Optional
+from xml.etree import ElementTree
+from zipfile import ZipFile
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+P = W_NS + "p"
+T = W_NS + "t"
+TBL = W_NS + "tbl"
+TR = W_NS + "tr"
+TC = W_NS + "tc"
+BODY = W_NS + "body"
+PPR = W_NS + "pPr"
+PSTYLE = W_NS + "pStyle"
+NUMPR = W_NS + "numPr"
+ILVL = W_NS + "ilvl"
+OUTLINE_LVL = W_NS + "outlineLvl"
+STYLE = W_NS + "style"
+NAME = W_NS + "name"
+VAL = W_NS + "val"
+STYLE_ID = W_NS + "styleId"
+
+# 内置标题样式名（样式 ID 随语言变化，如中文 Word 中为 "1"、"2"，名称固定为 "heading 1"）
+HEADING_NAME_RE = re.compile(r"^heading\s*([1-9])$", re.IGNORECASE)
+
+# 段落之间的分隔
+SEPARATOR = "\n\n"
+
+
+def _heading_styles(docx: ZipFile) -> Dict[str, int]:
+    """读取 styles.xml，返回 样式 ID -> 标题级别"""
+    try:
+        xml = docx.read("word/styles.xml")
+    except KeyError:
+        return {}
+    levels = {}
+    for style in ElementTree.fromstring(xml).iter(STYLE):
+        style_id = style.get(STYLE_ID)
+        name = style.find(NAME)
+        match = HEADING_NAME_RE.match(name.get(VAL, "")) if name is not None else None
+        if match:
+            levels[style_id] = int(match.group(1))
+            continue
+        if style.get(W_NS + "type") == "paragraph" and name is not None and name.get(VAL, "").lower() == "title":
+            levels[style_id] = 1
+            continue
+        outline = style.find(f"{PPR}/{OUTLINE_LVL}")
+        if outline is not None and outline.get(VAL, "").isdigit() and int(outline.get(VAL)) < 9:
+            levels[style_id] = int(outline.get(VAL)) + 1
+    return levels
+
+
+def _paragraph_text(para) -> str:
+    return "".join(t.text for t in para.iter(T) if t.text)
+
+
+def _format_paragraph(para, text: str, heading_styles: Dict[str, int]) -> str:
+    """按段落属性加上标题或列表前缀"""
+    ppr = para.find(PPR)
+    if ppr is None:
+        return text
+
+    level = None
+    outline = ppr.find(OUTLINE_LVL)
+    if outline is not None and outline.get(VAL, "").isdigit() and int(outline.get(VAL)) < 9:
+        level = int(outline.get(VAL)) + 1
+    else:
+        style = ppr.find(PSTYLE)
+        if style is not None:
+            level = heading_styles.get(style.get(VAL))
+    if level:
+        return f"{'#' * min(level, 6)} {text}"
+
+    numpr = ppr.find(NUMPR)
+    if numpr is not None:
+        ilvl = numpr.find(ILVL)
+        depth = int(ilvl.get(VAL)) if ilvl is not None and ilvl.get(VAL, "").isdigit() else 0
+        return f"{'  ' * depth}- {text}"
+    return text
+
+
+def _format_table(rows: List[List[str]]) -> str:
+    width = max(len(row) for row in rows)
+    lines = []
+    for index, row in enumerate(rows):
+        cells = [cell.replace("|", "\\|") for cell in row] + [""] * (width - len(row))
+        lines.append("| " + " | ".join(cells) + " |")
+        if index == 0:
+            lines.append("|" + " --- |" * width)
+    return "\n".join(lines)
+
+
+def iter_docx_blocks(source, structure: bool = False) -> Iterator[str]:
+    """
+    按文档顺序逐块产出文本（空段落跳过）
+
+    Args:
+        source: 文件路径或可 seek 的二进制文件对象
+        structure: 为 True 时输出标题、列表和表格结构；否则每个非空段落一块（表格中的段落也逐段输出）
+    """
+    with ZipFile(source) as docx:
+        heading_styles = _heading_styles(docx) if structure else {}
+        with docx.open("word/document.xml") as xml:
+            body = None
+            # 元素嵌套深度：document 为 1，body 为 2，body 的直接子元素为 3
+            depth = 0
+            table_depth = 0
+            rows: List[List[str]] = []
+            cell: List[str] = []
+
+            for event, elem in ElementTree.iterparse(xml, events=("start", "end")):
+                tag = elem.tag
+                if event == "start":
+                    depth += 1
+                    if tag == BODY:
+                        body = elem
+                    elif tag == TBL:
+                        table_depth += 1
+                        if table_depth == 1:
+                            rows = []
+                    elif tag == TR and table_depth == 1:
+                        rows.append([])
+                    elif tag == TC and table_depth == 1:
+                        cell = []
+                    continue
+
+                depth -= 1
+                if tag == P:
+                    text = _paragraph_text(elem)
+                    if text:
+                        if structure and table_depth:
+                            # 表格（含嵌套表格）中的段落并入顶层单元格
+                            cell.append(text)
+                        elif structure:
+                            yield _format_paragraph(elem, text, heading_styles)
+                        else:
+                            yield text
+                    # 清除已处理的段落；文本框中的段落先于外层段落结束，清除后不会被重复提取
+                    elem.clear()
+                elif tag == TC and table_depth == 1 and structure:
+                    rows[-1].append(" ".join(cell))
+                elif tag == TR:
+                    elem.clear()
+                elif tag == TBL:
+                    table_depth -= 1
+                    if table_depth == 0 and structure:
+                        rows = [row for row in rows if any(row)]
+                        if rows:
+                            yield _format_table(rows)
+                        rows = []
+                    elem.clear()
+
+                # 从 body 上摘掉处理完的直接子元素，已解析的部分不会在内存中累积
+                if depth == 2 and body is not None and len(body) and body[0] is elem:
+                    elem.clear()
+                    del body[0]
+
+
+def extract_docx_text(
+    source,
+    max_chars: Optional[int] = None,
+    max_lines: Optional[int] = None,
+    structure: bool = False
+) -> str:
+    """
+    从 Word 文档中提取文本，段落之间以空行分隔
+
+    超过 max_chars 字或 max_lines 行后停止解析；返回的文本会略超出上限，调用方据此判断是否被截断。
+    """
+    parts: List[str] = []
+    chars = 0
+    lines = 0
+    blocks = iter_docx_blocks(source, structure)
+    try:
+        for block in blocks:
+            if parts:
+                chars += len(SEPARATOR)
+                lines += SEPARATOR.count("\n")
+            else:
+                lines = 1
+            parts.append(block)
+            chars += len(block)
+            lines += block.count("\n")
+            if (max_chars is not None and chars > max_chars) or (max_lines is not None and lines > max_lines):
+                break
+    except Exception as e:
+        raise Exception(f"无法读取 Word 文档: {str(e)}")
+    finally:
+        blocks.close()
+    return SEPARATOR.join(parts)
@@ -1,4 +1,5 @@
 import os
+import hashlib
 import aiofiles
 from fastapi import UploadFile, HTTPException, status
 from sqlalchemy.orm import Session
@@ -6,51 +7,247 @@ from app.models.file import File, FileType
 from app.schemas.file import FileCreate, FileStatistics
 from app.core.config import settings
 from app.services.oss_service import oss_service
+from app.services.preview_cache import preview_cache, preview_key
 from typing import List
 import uuid
 
-async def save_upload_file(upload_file: UploadFile, file_type: FileType, user_id: int, db: Session):
-    # 确保上传目录存在
-    os.makedirs(settings.UPLOAD_FOLDER, exist_ok=True)
-    user_folder = os.path.join(settings.UPLOAD_FOLDER, str(user_id))
-    os.makedirs(user_folder, exist_ok=True)
-    
-    # 生成唯一文件名
-    file_extension = os.path.splitext(upload_file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(user_folder, unique_filename)
-    
-    # 异步保存文件
+class UploadResult:
+    """流式写入的结果：临时文件路径、字节数和 SHA-256"""
+
+    __slots__ = ("path", "size", "sha256")
+
+    def __init__(self, path: str, size: int, sha256: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+
+async def stream_upload_to_temp(upload_file: UploadFile, directory: str) -> UploadResult:
+    """
+    按固定大小的块把上传内容写入目录下的临时文件，边写边计算大小和 SHA-256
+
+    内存占用只有一个块，与文件大小和并发数无关；累计大小一旦超过 MAX_FILE_SIZE 立即中止并返回 413。
+    临时文件与目标文件在同一目录，之后可以用 os.replace 原子地移动到位。
+
+    Raises:
+        HTTPException: 413 文件过大；500 写入失败（两种情况都会删除临时文件）
+    """
+    tmp_path = os.path.join(directory, f".{uuid.uuid4().hex}.part")
+    hasher = hashlib.sha256()
+    size = 0
     try:
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            content = await upload_file.read()
-            if len(content) > settings.MAX_FILE_SIZE:
-                raise HTTPException(
-                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                    detail=f"文件大小超过限制 ({settings.MAX_FILE_SIZE} bytes)"
-                )
-            await out_file.write(content)
+        async with aiofiles.open(tmp_path, 'wb') as out_file:
+            while True:
+                chunk = await upload_file.read(settings.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > settings.MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"文件大小超过限制 ({settings.MAX_FILE_SIZE} bytes)"
+                    )
+                hasher.update(chunk)
+                await out_file.write(chunk)
+    except HTTPException:
+        _remove_quietly(tmp_path)
+        raise
     except Exception as e:
-        # 如果保存失败，删除可能部分写入的文件
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        _remove_quietly(tmp_path)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"文件保存失败: {str(e)}"
         )
+    return UploadResult(tmp_path, size, hasher.hexdigest())
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def blob_path(content_hash: str) -> str:
+    """本地内容寻址存储中某个 SHA-256 对应的文件路径"""
+    return os.path.join(settings.UPLOAD_FOLDER, "blobs", content_hash[:2], content_hash)
+
+
+def find_shared_file(db: Session, content_hash: str, is_oss: bool, exclude_id: int = None, lock: bool = False):
+    """
+    查找引用同一份存储（相同内容哈希、相同存储位置）的其他文件记录
+
+    lock 为 True 时加行锁（MySQL 下同时锁住该哈希的索引间隙），
+    删除最后一个引用期间并发的同内容上传会等待删除提交后再写入记录。
+    """
+    query = db.query(File).filter(File.content_hash == content_hash, File.is_oss == is_oss)
+    if exclude_id is not None:
+        query = query.filter(File.id != exclude_id)
+    if lock:
+        query = query.with_for_update()
+    return query.first()
+
+
+async def save_upload_file(upload_file: UploadFile, file_type: FileType, user_id: int, db: Session):
+    # 内容寻址存储：文件按 SHA-256 存放在 blobs 目录下，相同内容只保存一份
+    blob_root = os.path.join(settings.UPLOAD_FOLDER, "blobs")
+    os.makedirs(blob_root, exist_ok=True)
+    
+    # 流式写入临时文件，边写边计算哈希
+    upload = await stream_upload_to_temp(upload_file, blob_root)
+    file_path = blob_path(upload.sha256)
     
     # 创建文件记录 - file_type 需要转换为字符串值
     db_file = File(
         filename=upload_file.filename,
         file_path=file_path,
         file_type=file_type.value if hasattr(file_type, 'value') else str(file_type),
-        file_size=len(content),
+        file_size=upload.size,
         mime_type=upload_file.content_type,
-        user_id=user_id
+        user_id=user_id,
+        is_oss=False,
+        content_hash=upload.sha256
     )
     
     db.add(db_file)
-    db.commit()
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        _remove_quietly(upload.path)
+        raise
+    
+    # 记录提交之后再放置文件：如果并发的删除刚好移除了最后一个引用的存储，这里会重新放回
+    try:
+        if os.path.exists(file_path):
+            # 相同内容已经存在，丢弃本次写入的临时文件
+            _remove_quietly(upload.path)
+        else:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            os.replace(upload.path, file_path)
+    except OSError as e:
+        _remove_quietly(upload.path)
+        db.delete(db_file)
+        db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"文件保存失败: {str(e)}"
+        )
+    
+    db.refresh(db_file)
+    return db_file
+
+
+async def hash_upload_file(upload_file: UploadFile):
+    """
+    按块读取上传内容计算 SHA-256 和大小，读完后回到开头
+
+    上传内容在进入接口前已由框架缓存在本地（内存或临时文件），这里只是本地读取一遍。
+
+    Raises:
+        HTTPException: 413 文件过大
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = await upload_file.read(settings.UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > settings.MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"文件大小超过限制 ({settings.MAX_FILE_SIZE} bytes)"
+            )
+        hasher.update(chunk)
+    await upload_file.seek(0)
+    return hasher.hexdigest(), size
+
+
+def _oss_file_record(
+    filename: str,
+    file_type: FileType,
+    file_size: int,
+    mime_type: str,
+    user_id: int,
+    oss_path: str,
+    oss_url: str,
+    content_hash: str
+) -> File:
+    # file_type 需要转换为字符串值
+    return File(
+        filename=filename,
+        file_path=oss_path,  # 存储OSS路径
+        file_type=file_type.value if hasattr(file_type, 'value') else str(file_type),
+        file_size=file_size,
+        mime_type=mime_type,
+        user_id=user_id,
+        is_oss=True,
+        oss_path=oss_path,
+        oss_url=oss_url,
+        content_hash=content_hash
+    )
+
+
+async def save_oss_upload_file(
+    upload_file: UploadFile,
+    file_type: FileType,
+    user_id: int,
+    db: Session,
+    resume_key: str = None
+):
+    """
+    上传文件到 OSS 并创建记录
+
+    先在本地计算内容哈希：OSS 上已有相同内容的对象时，新记录直接引用已有对象，不再上传。
+    相同内容并发上传时各自上传完成后再检查一次，后提交的记录引用已有对象并删除本次上传的副本。
+    """
+    content_hash, file_size = await hash_upload_file(upload_file)
+    
+    existing = find_shared_file(db, content_hash, True)
+    if existing:
+        db_file = _oss_file_record(
+            upload_file.filename, file_type, file_size, upload_file.content_type,
+            user_id, existing.oss_path, existing.oss_url, content_hash
+        )
+        db.add(db_file)
+        db.commit()
+        # 记录提交后已有对象不会再被删除；提交前就被最后一个引用删除时改为正常上传
+        if await oss_service.object_exists(existing.oss_path):
+            db.refresh(db_file)
+            return db_file
+        db.delete(db_file)
+        db.commit()
+    
+    oss_result = await oss_service.upload_file(upload_file, user_id, file_type.value, resume_key)
+    uploaded_path = oss_result["oss_path"]
+    
+    existing = find_shared_file(db, oss_result["sha256"], True)
+    oss_path = existing.oss_path if existing else uploaded_path
+    oss_url = existing.oss_url if existing else oss_result["file_url"]
+    
+    db_file = _oss_file_record(
+        oss_result["original_filename"], file_type, oss_result["file_size"], oss_result["mime_type"],
+        user_id, oss_path, oss_url, oss_result["sha256"]
+    )
+    
+    db.add(db_file)
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        await oss_service.delete_file_async(uploaded_path)
+        raise
+    
+    if existing:
+        if await oss_service.object_exists(oss_path):
+            await oss_service.delete_file_async(uploaded_path)
+        else:
+            # 已有对象在本记录提交前被最后一个引用删除了，改用本次上传的对象
+            db_file.file_path = db_file.oss_path = uploaded_path
+            db_file.oss_url = oss_result["file_url"]
+            db.commit()
+    
     db.refresh(db_file)
     return db_file
 
@@ -73,29 +270,44 @@ def delete_file(db: Session, file_id: int, user_id: int):
             detail="文件不存在或无权访问"
         )
     
-    # 删除物理文件
+    is_oss = bool(file.is_oss)
+    storage_path = file.oss_path if is_oss else file.file_path
+    content_hash = file.content_hash
+    # 旧文件的缓存键依赖本地文件状态，删除前计算
+    cache_keys = [preview_key(file, kind) for kind in ("text", "docx")]
+    
+    # 先删除记录，再检查是否还有其他记录引用同一份存储；提交前持有锁，避免与同内容的上传交错
+    db.delete(file)
     try:
-        if file.is_oss:
-            if file.oss_path:
-                ok = oss_service.delete_file(file.oss_path)
-                if not ok:
+        db.flush()
+        shared = bool(content_hash) and find_shared_file(db, content_hash, is_oss, lock=True) is not None
+        
+        # 最后一个引用才删除物理文件
+        if not shared:
+            if is_oss:
+                if storage_path and not oss_service.delete_file(storage_path):
                     raise HTTPException(
                         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                         detail="OSS文件删除失败"
                     )
-        else:
-            # 如果是本地文件，从本地删除
-            if os.path.exists(file.file_path):
-                os.remove(file.file_path)
+            elif os.path.exists(storage_path):
+                # 如果是本地文件，从本地删除
+                os.remove(storage_path)
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"删除文件失败: {str(e)}"
         )
     
-    # 删除数据库记录
-    db.delete(file)
     db.commit()
+    # 内容仍被其他记录引用时保留共用的预览缓存
+    if not shared:
+        for key in cache_keys:
+            preview_cache.invalidate(key)
     return {"message": "文件删除成功"}
 
 def get_file_statistics(db: Session, user_id: int) -> FileStatistics:
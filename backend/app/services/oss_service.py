@@ -1,10 +1,84 @@
 import oss2
+from oss2.models import PartInfo
+from oss2.resumable import ResumableStore
 from fastapi import UploadFile, HTTPException, status
 from app.core.config import settings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Optional, Tuple
+import asyncio
+import codecs
+import functools
+import httpx
+import hashlib
+import threading
+import time
 import uuid
 import os
 from datetime import datetime
 
+class SignedUrlCache:
+    """
+    签名 URL 缓存（按 oss_path，LRU）
+
+    过期时间对齐到 align 秒的整数倍：同一时间窗口内对同一对象签出的 URL 完全相同（多个进程之间也一致），
+    浏览器和 CDN 可以按 URL 命中缓存；窗口切换前一直复用已签好的 URL，不再重复计算签名。
+    """
+
+    def __init__(self, max_entries: int, expires: int, align: int):
+        self.max_entries = max_entries
+        self.expires = expires
+        self.align = max(align, 1)
+        # oss_path -> (过期时间戳, URL)
+        self._entries: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+        # 同步接口在线程池中执行，需要加锁
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def expires_at(self, now: Optional[int] = None) -> int:
+        """当前时间窗口对应的过期时间戳，剩余有效期在 [expires, expires + align) 之间"""
+        now = int(time.time()) if now is None else now
+        return -(-(now + self.expires) // self.align) * self.align
+
+    def max_age(self, now: Optional[int] = None) -> int:
+        """当前 URL 还会被复用的秒数（之后切换到下一个时间窗口）"""
+        now = int(time.time()) if now is None else now
+        return max(self.expires_at(now) - self.expires - now, 0)
+
+    def get(self, oss_path: str, expires_at: int) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(oss_path)
+            if entry is None or entry[0] != expires_at:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(oss_path)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, oss_path: str, expires_at: int, url: str) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries.pop(oss_path, None)
+            self._entries[oss_path] = (expires_at, url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, oss_path: str) -> None:
+        with self._lock:
+            self._entries.pop(oss_path, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
 class OSSService:
     """阿里云OSS服务类"""
     
@@ -19,25 +93,75 @@ class OSSService:
             settings.OSS_ENDPOINT,
             settings.OSS_BUCKET_NAME
         )
+        # oss2 是同步客户端，所有网络调用都放到这个有界线程池里执行，不阻塞事件循环
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.OSS_UPLOAD_THREADS,
+            thread_name_prefix="oss-upload"
+        )
+        # 所有上传共享的在途分片数上限，内存占用不超过 分片大小 × 上限
+        self._part_slots = asyncio.Semaphore(settings.OSS_UPLOAD_THREADS * 2)
+        # 分片上传的断点记录（object key、upload_id），用于中断后续传
+        self._resume_store = ResumableStore(
+            root=settings.OSS_RESUME_DIR or settings.UPLOAD_FOLDER,
+            dir=".oss-resume"
+        )
+        # 下载和预览用的签名 URL 缓存
+        self._url_cache = SignedUrlCache(
+            max_entries=settings.OSS_URL_CACHE_SIZE,
+            expires=settings.OSS_URL_EXPIRES,
+            align=settings.OSS_URL_ALIGN
+        )
+        # 读取对象用的共享异步客户端（签名 URL + 连接池），按需创建，应用关闭时释放
+        self._http_client: Optional[httpx.AsyncClient] = None
+    
+    def _get_http_client(self) -> httpx.AsyncClient:
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.OSS_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OSS_HTTP_MAX_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(settings.OSS_HTTP_TIMEOUT)
+            )
+        return self._http_client
+    
+    async def close_http_client(self) -> None:
+        """应用关闭时释放读取对象的连接池"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+    
+    async def _run(self, func, *args, **kwargs):
+        """在上传线程池中执行 oss2 的阻塞调用"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
     
-    async def upload_file(self, upload_file: UploadFile, user_id: int, file_type: str) -> dict:
+    async def upload_file(
+        self,
+        upload_file: UploadFile,
+        user_id: int,
+        file_type: str,
+        resume_key: Optional[str] = None
+    ) -> dict:
         """
         上传文件到OSS
         
+        不超过 OSS_MULTIPART_THRESHOLD 的文件一次性 put_object；更大的文件按 OSS_PART_SIZE 分片，
+        边读边在线程池中并发上传。提供 resume_key 时，中断的分片上传会保留下来，
+        同一用户用相同的 resume_key 重新上传时跳过 OSS 上已存在且内容一致的分片。
+        续传仍然读取完整的上传内容（计算哈希、校验分片），只省去已有分片到 OSS 的传输。
+        
         Args:
             upload_file: 上传的文件
             user_id: 用户ID
             file_type: 文件类型
+            resume_key: 客户端为同一个文件生成的稳定标识（如 文件名:大小:修改时间），用于断点续传
             
         Returns:
-            dict: 包含文件URL和OSS路径的字典
+            dict: 包含文件URL、OSS路径、大小和 SHA-256 的字典
         """
         try:
-            # 读取文件内容
-            content = await upload_file.read()
-            
-            # 检查文件大小
-            if len(content) > settings.MAX_FILE_SIZE:
+            if upload_file.size is not None and upload_file.size > settings.MAX_FILE_SIZE:
                 raise HTTPException(
                     status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                     detail=f"文件大小超过限制 ({settings.MAX_FILE_SIZE} bytes)"
@@ -49,13 +173,20 @@ class OSSService:
             unique_filename = f"{uuid.uuid4()}{file_extension}"
             oss_path = f"uploads/{user_id}/{file_type}/{timestamp}/{unique_filename}"
             
-            # 上传到OSS
-            result = self.bucket.put_object(oss_path, content)
-            
-            if result.status != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="OSS上传失败"
+            # 先读入不超过阈值的部分，能读完的就是小文件
+            head = await upload_file.read(settings.OSS_MULTIPART_THRESHOLD + 1)
+            if len(head) <= settings.OSS_MULTIPART_THRESHOLD:
+                result = await self._run(self.bucket.put_object, oss_path, head)
+                if result.status != 200:
+                    raise HTTPException(
+                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        detail="OSS上传失败"
+                    )
+                file_size = len(head)
+                sha256 = hashlib.sha256(head).hexdigest()
+            else:
+                oss_path, file_size, sha256 = await self._multipart_upload(
+                    upload_file, head, oss_path, user_id, resume_key
                 )
             
             # 生成访问URL
@@ -65,8 +196,9 @@ class OSSService:
                 "oss_path": oss_path,
                 "file_url": file_url,
                 "original_filename": upload_file.filename,
-                "file_size": len(content),
-                "mime_type": upload_file.content_type
+                "file_size": file_size,
+                "mime_type": upload_file.content_type,
+                "sha256": sha256
             }
             
         except HTTPException:
@@ -83,6 +215,143 @@ class OSSService:
                 detail=f"上传失败: {str(e)}"
             )
     
+    @staticmethod
+    async def _iter_parts(upload_file: UploadFile, head: bytes) -> AsyncIterator[bytes]:
+        """把已读入的开头部分和剩余的上传流切成 OSS_PART_SIZE 大小的分片"""
+        part_size = settings.OSS_PART_SIZE
+        buffer = head
+        while True:
+            while len(buffer) >= part_size:
+                yield buffer[:part_size]
+                buffer = buffer[part_size:]
+            chunk = await upload_file.read(part_size - len(buffer))
+            if not chunk:
+                break
+            buffer += chunk
+        if buffer:
+            yield buffer
+    
+    def _resume_store_key(self, user_id: int, resume_key: str) -> str:
+        return hashlib.sha256(f"{user_id}:{resume_key}".encode("utf-8")).hexdigest()
+    
+    async def _load_checkpoint(self, store_key: str) -> Optional[dict]:
+        """读取断点记录并向 OSS 查询已上传的分片；记录过期或分片上传已不存在时返回 None"""
+        checkpoint = await self._run(self._resume_store.get, store_key)
+        if not checkpoint:
+            return None
+        if (
+            checkpoint.get("part_size") != settings.OSS_PART_SIZE
+            or checkpoint.get("created_at", 0) + settings.OSS_RESUME_TTL < time.time()
+        ):
+            await self._abort_quietly(checkpoint["key"], checkpoint["upload_id"])
+            await self._run(self._resume_store.delete, store_key)
+            return None
+        
+        def list_parts() -> Dict[int, PartInfo]:
+            return {
+                part.part_number: part
+                for part in oss2.PartIterator(self.bucket, checkpoint["key"], checkpoint["upload_id"])
+            }
+        
+        try:
+            checkpoint["parts"] = await self._run(list_parts)
+        except oss2.exceptions.NoSuchUpload:
+            await self._run(self._resume_store.delete, store_key)
+            return None
+        return checkpoint
+    
+    def _upload_part(self, key: str, upload_id: str, part_number: int, data: bytes,
+                     existing: Optional[PartInfo]) -> PartInfo:
+        """上传一个分片（在线程池中执行）；OSS 上已有内容相同的分片时直接复用"""
+        if existing is not None and existing.size == len(data):
+            # 分片的 ETag 是内容的 MD5
+            if existing.etag.strip('"').lower() == hashlib.md5(data).hexdigest():
+                return PartInfo(part_number, existing.etag, size=len(data))
+        result = self.bucket.upload_part(key, upload_id, part_number, data)
+        return PartInfo(part_number, result.etag, size=len(data), part_crc=result.crc)
+    
+    async def _abort_quietly(self, key: str, upload_id: str) -> None:
+        try:
+            await self._run(self.bucket.abort_multipart_upload, key, upload_id)
+        except oss2.exceptions.OssError as e:
+            print(f"OSS取消分片上传失败: {str(e)}")
+    
+    async def _multipart_upload(
+        self,
+        upload_file: UploadFile,
+        head: bytes,
+        oss_path: str,
+        user_id: int,
+        resume_key: Optional[str]
+    ):
+        """
+        分片上传：按顺序读取分片、计算大小和 SHA-256，分片在线程池中并发上传
+        
+        Returns:
+            (OSS路径, 文件大小, SHA-256)
+        """
+        store_key = self._resume_store_key(user_id, resume_key) if resume_key else None
+        checkpoint = await self._load_checkpoint(store_key) if store_key else None
+        if checkpoint is not None:
+            oss_path = checkpoint["key"]
+            upload_id = checkpoint["upload_id"]
+            uploaded = checkpoint["parts"]
+        else:
+            upload_id = (await self._run(self.bucket.init_multipart_upload, oss_path)).upload_id
+            uploaded = {}
+            if store_key:
+                await self._run(self._resume_store.put, store_key, {
+                    "key": oss_path,
+                    "upload_id": upload_id,
+                    "part_size": settings.OSS_PART_SIZE,
+                    "created_at": time.time()
+                })
+        
+        hasher = hashlib.sha256()
+        size = 0
+        tasks = []
+        
+        try:
+            part_number = 0
+            async for data in self._iter_parts(upload_file, head):
+                part_number += 1
+                size += len(data)
+                if size > settings.MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"文件大小超过限制 ({settings.MAX_FILE_SIZE} bytes)"
+                    )
+                hasher.update(data)
+                # 在途分片数达到上限时等待，读取速度跟随上传速度
+                await self._part_slots.acquire()
+                task = asyncio.ensure_future(self._run(
+                    self._upload_part, oss_path, upload_id, part_number, data, uploaded.get(part_number)
+                ))
+                task.add_done_callback(lambda _: self._part_slots.release())
+                tasks.append(task)
+                # 尽早发现失败的分片，不再继续读取
+                failed = next((t for t in tasks if t.done() and t.exception()), None)
+                if failed is not None:
+                    failed.result()
+            parts = await asyncio.gather(*tasks)
+            if uploaded:
+                print(f"OSS分片续传: {oss_path} 共 {len(parts)} 个分片，已存在 {len(uploaded)} 个")
+            await self._run(self.bucket.complete_multipart_upload, oss_path, upload_id, list(parts))
+        except BaseException as e:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # 文件过大或没有续传标识时放弃这次分片上传；否则保留已上传的分片等待客户端重试
+            if store_key is None or isinstance(e, HTTPException):
+                await self._abort_quietly(oss_path, upload_id)
+                if store_key:
+                    await self._run(self._resume_store.delete, store_key)
+            raise
+        
+        if store_key:
+            await self._run(self._resume_store.delete, store_key)
+        return oss_path, size, hasher.hexdigest()
+    
     def delete_file(self, oss_path: str) -> bool:
         """
         从OSS删除文件
@@ -95,24 +364,42 @@ class OSSService:
         """
         try:
             self.bucket.delete_object(oss_path)
+            self._url_cache.invalidate(oss_path)
             return True
         except oss2.exceptions.OssError as e:
             print(f"OSS删除失败: {str(e)}")
             return False
     
-    def get_file_url(self, oss_path: str, expires: int = 3600) -> str:
+    async def delete_file_async(self, oss_path: str) -> bool:
+        """在上传线程池中删除 OSS 文件，不阻塞事件循环"""
+        return await self._run(self.delete_file, oss_path)
+    
+    async def object_exists(self, oss_path: str) -> bool:
+        """OSS 上是否存在该对象"""
+        return await self._run(self.bucket.object_exists, oss_path)
+    
+    def get_file_url(self, oss_path: str, expires: Optional[int] = None) -> str:
         """
         获取文件的签名URL（用于私有bucket）
         
+        使用默认有效期时，过期时间对齐到 OSS_URL_ALIGN 秒，同一时间窗口内复用缓存的 URL。
+        
         Args:
             oss_path: OSS上的文件路径
-            expires: URL过期时间（秒），默认1小时
+            expires: URL过期时间（秒），默认 OSS_URL_EXPIRES；指定其他值时不使用缓存
             
         Returns:
             str: 签名URL
         """
         try:
-            url = self.bucket.sign_url('GET', oss_path, expires)
+            if expires is not None and expires != settings.OSS_URL_EXPIRES:
+                return self.bucket.sign_url('GET', oss_path, expires)
+            
+            expires_at = self._url_cache.expires_at()
+            url = self._url_cache.get(oss_path, expires_at)
+            if url is None:
+                url = self._sign_url_at(oss_path, expires_at)
+                self._url_cache.put(oss_path, expires_at, url)
             return url
         except oss2.exceptions.OssError as e:
             raise HTTPException(
@@ -120,5 +407,77 @@ class OSSService:
                 detail=f"获取URL失败: {str(e)}"
             )
 
+    def _sign_url_at(self, oss_path: str, expires_at: int) -> str:
+        """签出在 expires_at 时刻过期的 URL（oss2 按当前秒数加有效期计算过期时间，签名期间跨秒时重签）"""
+        while True:
+            now = int(time.time())
+            url = self.bucket.sign_url('GET', oss_path, expires_at - now)
+            if int(time.time()) == now:
+                return url
+    
+    def signed_url_max_age(self) -> int:
+        """默认有效期的签名 URL 还会被复用的秒数，可作为重定向响应的缓存时间"""
+        return self._url_cache.max_age()
+
+    async def get_range(self, oss_path: str, start: int, end: int) -> Tuple[bytes, Optional[int]]:
+        """
+        读取对象的 [start, end] 字节范围
+        
+        Returns:
+            (数据, 对象总大小)；服务端忽略 Range 返回整个对象时总大小即数据长度，
+            start 超出对象末尾时返回空数据
+        """
+        response = await self._get_http_client().get(
+            self.get_file_url(oss_path),
+            headers={"Range": f"bytes={start}-{end}"}
+        )
+        if response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE:
+            return b"", start
+        response.raise_for_status()
+        if response.status_code == status.HTTP_206_PARTIAL_CONTENT:
+            total = response.headers.get("content-range", "").rpartition("/")[2]
+            return response.content, int(total) if total.isdigit() else None
+        # 整个对象：只取请求的范围
+        return response.content[start:end + 1], len(response.content)
+    
+    async def read_text_prefix(self, oss_path: str, max_chars: int, max_lines: int) -> Tuple[str, bool]:
+        """
+        按 Range 读取 UTF-8 文本的开头部分
+        
+        首次读取 PREVIEW_RANGE_SIZE 字节，行数和字数都没达到上限时加倍续读，
+        直到超过 max_lines 行、超过 max_chars 字或读到文件末尾。
+        
+        Returns:
+            (文本, 是否读到文件末尾)
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        text = ""
+        offset = 0
+        size = settings.PREVIEW_RANGE_SIZE
+        while True:
+            data, total = await self.get_range(oss_path, offset, offset + size - 1)
+            offset += len(data)
+            eof = not data or total is None or offset >= total
+            text += decoder.decode(data, final=eof)
+            if eof:
+                return text, True
+            if len(text) > max_chars or text.count("\n") > max_lines:
+                return text, False
+            size *= 2
+    
+    async def download_to(self, oss_path: str, fileobj) -> int:
+        """
+        把对象流式写入文件对象（如 SpooledTemporaryFile），返回字节数
+
+        按 DOWNLOAD_CHUNK_SIZE 大块写入，写入在线程中进行（文件对象可能已转存到磁盘）。
+        """
+        size = 0
+        async with self._get_http_client().stream("GET", self.get_file_url(oss_path)) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(settings.DOWNLOAD_CHUNK_SIZE):
+                await asyncio.to_thread(fileobj.write, chunk)
+                size += len(chunk)
+        return size
+
 # 创建全局OSS服务实例
 oss_service = OSSService()
@@ -0,0 +1,153 @@
+"""
+大纲增量解析
+模型流式输出的 Markdown 大纲按行解析：每读完一行标题就产出一个节点事件，
+普通行作为当前节点的说明文字产出追加事件，前端无需等待生成结束即可渲染大纲树。
+解析结果按请求参数缓存，相同参数再次请求时直接回放节点，不再请求上游和重新解析。
+"""
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+
+# Markdown ATX 标题：最多 3 个前导空格，1~6 个 #，可带结尾的 #
+HEADING_RE = re.compile(r"^ {0,3}(#{1,6})[ \t]+(.*?)(?:[ \t]+#+)?[ \t]*$")
+# 代码块围栏（模型有时把整份大纲包在 ```markdown 里）
+FENCE_RE = re.compile(r"^ {0,3}(```|~~~)")
+
+# 第一个标题之前的文字挂在虚拟根节点下
+ROOT_ID = 0
+
+# (事件类型, 数据)：("node", {id, parent, level, title}) 或 ("text", {id, text})
+OutlineEvent = Tuple[str, Dict]
+
+
+class ParsedOutline:
+    """解析完成的大纲：原始 Markdown + 扁平节点列表（按出现顺序，parent 指向父节点）"""
+
+    __slots__ = ("markdown", "nodes", "preamble")
+
+    def __init__(self, markdown: str, nodes: List[Dict], preamble: List[str]):
+        self.markdown = markdown
+        self.nodes = nodes
+        self.preamble = preamble
+
+    def events(self) -> Iterator[OutlineEvent]:
+        """按增量解析时的顺序重新产出全部事件"""
+        for line in self.preamble:
+            yield "text", {"id": ROOT_ID, "text": line}
+        for node in self.nodes:
+            yield "node", {k: node[k] for k in ("id", "parent", "level", "title")}
+            for line in node["text"]:
+                yield "text", {"id": node["id"], "text": line}
+
+
+class OutlineParser:
+    """按行增量解析 Markdown 标题，feed 返回本次新完成的行产生的事件"""
+
+    def __init__(self):
+        self._buffer = ""
+        self._parts: List[str] = []
+        # 标题栈：[(级别, 节点 ID)]，用于确定新标题的父节点
+        self._stack: List[Tuple[int, int]] = []
+        self.nodes: List[Dict] = []
+        self.preamble: List[str] = []
+
+    def feed(self, chunk: str) -> List[OutlineEvent]:
+        self._parts.append(chunk)
+        self._buffer += chunk
+        if "\n" not in self._buffer:
+            return []
+        *lines, self._buffer = self._buffer.split("\n")
+        events = []
+        for line in lines:
+            event = self._parse_line(line)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def close(self) -> List[OutlineEvent]:
+        """处理最后一行（没有换行结尾）"""
+        line, self._buffer = self._buffer, ""
+        event = self._parse_line(line) if line else None
+        return [event] if event is not None else []
+
+    def result(self) -> ParsedOutline:
+        return ParsedOutline("".join(self._parts), self.nodes, self.preamble)
+
+    def _parse_line(self, line: str) -> Optional[OutlineEvent]:
+        line = line.rstrip("\r")
+        if not line.strip() or FENCE_RE.match(line):
+            return None
+
+        match = HEADING_RE.match(line)
+        if match and match.group(2):
+            level = len(match.group(1))
+            while self._stack and self._stack[-1][0] >= level:
+                self._stack.pop()
+            node = {
+                "id": len(self.nodes) + 1,
+                "parent": self._stack[-1][1] if self._stack else ROOT_ID,
+                "level": level,
+                "title": match.group(2).strip(),
+                "text": []
+            }
+            self.nodes.append(node)
+            self._stack.append((level, node["id"]))
+            return "node", {k: node[k] for k in ("id", "parent", "level", "title")}
+
+        text = line.rstrip()
+        if self.nodes:
+            self.nodes[-1]["text"].append(text)
+            return "text", {"id": self.nodes[-1]["id"], "text": text}
+        self.preamble.append(text)
+        return "text", {"id": ROOT_ID, "text": text}
+
+
+class OutlineCache:
+    """按用户和请求参数缓存解析后的大纲（键由调用方生成），LRU + TTL"""
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (过期时间, 大纲)
+        self._entries: "OrderedDict[str, Tuple[float, ParsedOutline]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[ParsedOutline]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, outline: ParsedOutline) -> None:
+        # 没有解析出任何标题的结果不缓存，避免把异常输出反复回放
+        if self.max_entries <= 0 or not outline.nodes:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = (time.time() + self.ttl, outline)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+# 创建全局大纲缓存
+outline_cache = OutlineCache(
+    max_entries=settings.AI_OUTLINE_CACHE_SIZE,
+    ttl=settings.AI_OUTLINE_CACHE_TTL
+)
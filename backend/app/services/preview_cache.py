@@ -0,0 +1,260 @@
+"""
+文件预览缓存
+缓存提取出的预览文本（最多 PREVIEW_MAX_CHARS 字）和每行的起始位置，按内容键查找（见 preview_key）：
+有内容哈希的文件只按哈希和提取方式区分，引用同一内容的多条记录共用一份预览；
+去重上线前的旧文件按文件 ID 加本地修改时间或记录更新时间区分。
+内存层为 LRU（条目数和字节数双重上限），磁盘层放在 UPLOAD_FOLDER/.preview-cache 下，重启后继续命中。
+内容的最后一个引用被删除时清除对应条目。
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+
+
+class PreviewEntry:
+    """
+    一份预览：文本前缀、行起始位置、文本是否被截断，以及提取时的文件元数据
+
+    partial 表示只按行数读取了开头部分（如 OSS 文本文件的 Range 读取），
+    请求更多行时需要重新读取。
+    """
+
+    __slots__ = ("content", "line_offsets", "truncated", "meta", "partial")
+
+    def __init__(self, content: str, line_offsets: List[int], truncated: bool, meta: Optional[dict] = None,
+                 partial: bool = False):
+        self.content = content
+        self.line_offsets = line_offsets
+        self.truncated = truncated
+        self.meta = meta or {}
+        self.partial = partial
+
+    @classmethod
+    def from_text(cls, text: str, max_chars: int, meta: Optional[dict] = None, partial: bool = False) -> "PreviewEntry":
+        """截取前 max_chars 字并记录每一行的起始位置"""
+        truncated = len(text) > max_chars
+        content = text[:max_chars]
+        offsets = [0]
+        index = content.find("\n")
+        while index != -1 and index + 1 < len(content):
+            offsets.append(index + 1)
+            index = content.find("\n", index + 1)
+        return cls(content, offsets, truncated, meta, partial and not truncated)
+
+    def covers(self, max_lines: int) -> bool:
+        """缓存的文本是否足以显示前 max_lines 行"""
+        return not self.partial or max_lines < len(self.line_offsets)
+
+    def head(self, max_lines: int) -> Tuple[str, bool]:
+        """前 max_lines 行及后面是否还有更多行"""
+        if max_lines < len(self.line_offsets):
+            return self.content[:self.line_offsets[max_lines]], True
+        return self.content, False
+
+    @property
+    def size(self) -> int:
+        return len(self.content) * 2 + len(self.line_offsets) * 8
+
+    def to_dict(self) -> dict:
+        return {
+            "content": self.content,
+            "line_offsets": self.line_offsets,
+            "truncated": self.truncated,
+            "meta": self.meta,
+            "partial": self.partial
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PreviewEntry":
+        return cls(data["content"], data["line_offsets"], data["truncated"], data.get("meta"), data.get("partial", False))
+
+
+class PreviewCache:
+    """预览缓存：内存 LRU + 可选磁盘层"""
+
+    # 每写入多少次磁盘条目清理一次超量文件
+    DISK_PRUNE_INTERVAL = 100
+
+    def __init__(self, max_entries: int, max_bytes: int, disk_dir: Optional[str] = None, disk_max_entries: int = 2000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir or None
+        self.disk_max_entries = disk_max_entries
+
+        # 内容键 -> 预览
+        self._entries: "OrderedDict[str, PreviewEntry]" = OrderedDict()
+        self._bytes = 0
+        self._disk_writes = 0
+        # 同步接口在线程池中执行，内存层的读写需要加锁
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def _digest(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{self._digest(key)}.json")
+
+    def get(self, key: str) -> Optional[PreviewEntry]:
+        """依次查询内存层和磁盘层，磁盘命中的条目放回内存层"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry
+
+        if self.disk_dir:
+            entry = self._load_from_disk(key)
+            if entry is not None:
+                self.disk_hits += 1
+                self._put_memory(key, entry)
+                return entry
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, entry: PreviewEntry) -> None:
+        self._put_memory(key, entry)
+        if self.disk_dir:
+            self._save_to_disk(key, entry)
+
+    def invalidate(self, key: str) -> None:
+        """删除一个内容键的缓存条目（内存和磁盘）"""
+        with self._lock:
+            self._remove(key)
+        if self.disk_dir:
+            self._unlink(self._disk_path(key))
+
+    # ---------- 内存层 ----------
+
+    def _put_memory(self, key: str, entry: PreviewEntry) -> None:
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        """移除内存条目（调用方持有锁）"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    # ---------- 磁盘层 ----------
+
+    def _load_from_disk(self, key: str) -> Optional[PreviewEntry]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            self._unlink(path)
+            return None
+        if data.get("key") != key:
+            return None
+        try:
+            return PreviewEntry.from_dict(data)
+        except (KeyError, TypeError):
+            self._unlink(path)
+            return None
+
+    def _save_to_disk(self, key: str, entry: PreviewEntry) -> None:
+        """原子写入磁盘条目（先写临时文件再替换）"""
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"key": key, **entry.to_dict()}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"预览缓存写入磁盘失败: {str(e)}")
+            self._unlink(tmp_path)
+            return
+
+        self._disk_writes += 1
+        if self._disk_writes % self.DISK_PRUNE_INTERVAL == 0:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """文件数超限时删除最旧的条目"""
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        if len(files) > self.disk_max_entries:
+            files.sort()
+            for _, path in files[:len(files) - self.disk_max_entries]:
+                self._unlink(path)
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        total = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / total, 4) if total else 0.0
+        }
+
+
+def content_preview_key(content_hash: str, kind: str) -> str:
+    """有内容哈希的文件的缓存键，同一内容的所有记录共用"""
+    return f"sha256:{content_hash}:{kind}"
+
+
+def preview_key(file, kind: str) -> str:
+    """
+    文件预览的缓存键，kind 为提取方式（text/docx）
+
+    有内容哈希时只由哈希决定；旧文件按文件 ID 加版本（本地用修改时间和大小，OSS 用记录更新时间）。
+    """
+    if file.content_hash:
+        return content_preview_key(file.content_hash, kind)
+    if not file.is_oss:
+        try:
+            stat = os.stat(file.file_path)
+            return f"file:{file.id}:mtime:{stat.st_mtime_ns}:{stat.st_size}:{kind}"
+        except OSError:
+            pass
+    updated = file.updated_at or file.created_at
+    return f"file:{file.id}:updated:{updated.isoformat() if updated else ''}:{file.file_size}:{kind}"
+
+
+# 创建全局预览缓存
+preview_cache = PreviewCache(
+    max_entries=settings.PREVIEW_CACHE_MAX_ENTRIES,
+    max_bytes=settings.PREVIEW_CACHE_MAX_BYTES,
+    disk_dir=os.path.join(settings.UPLOAD_FOLDER, ".preview-cache") if settings.PREVIEW_CACHE_DISK_ENABLED else None,
+    disk_max_entries=settings.PREVIEW_CACHE_DISK_MAX_ENTRIES
+)
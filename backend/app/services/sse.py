@@ -0,0 +1,146 @@
+"""
+SSE 帧编码与自适应合并
+上游每个增量往往只有一两个字符，逐个写成 SSE 帧会产生大量小写入。
+这里按时间窗口和字节数把增量合并成较大的帧，并把内容编码成 JSON，
+保证包含换行的内容不会破坏 SSE 帧格式。
+"""
+import json
+import asyncio
+from contextlib import suppress
+from typing import AsyncGenerator, AsyncIterator, Callable, Optional
+
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+
+def format_sse(data: str, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """编码一个 SSE 帧；data 中的换行拆成多行 data 字段"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    for line in data.split("\n"):
+        lines.append(f"data: {line}")
+    return "\n".join(lines) + "\n\n"
+
+
+def encode_content(content: str) -> str:
+    """把文本内容编码为单行 JSON 载荷"""
+    return json.dumps({"content": content}, ensure_ascii=False)
+
+
+def encode_error(message: str) -> str:
+    """错误帧载荷（保持 [ERROR] 前缀兼容旧客户端，去掉换行保证单行）"""
+    return "[ERROR] " + " ".join(message.splitlines())
+
+
+async def coalesce_chunks(
+    source: AsyncIterator[str],
+    max_delay: float,
+    max_bytes: int
+) -> AsyncGenerator[str, None]:
+    """
+    合并文本增量
+
+    第一个增量立即输出（不增加首字延迟），之后的增量缓冲起来，
+    在缓冲的第一个增量到达 max_delay 秒后或累计达到 max_bytes 字节时一起输出。
+    max_delay <= 0 时不做合并。源迭代器出错时先输出已缓冲的内容再抛出异常。
+
+    Args:
+        source: 文本增量的异步迭代器
+        max_delay: 最大附加延迟（秒）
+        max_bytes: 单帧最大字节数（UTF-8）
+    """
+    iterator = source.__aiter__()
+    if max_delay <= 0:
+        async for chunk in iterator:
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    buffer = []
+    size = 0
+    deadline: Optional[float] = None
+    first = True
+    pending: Optional[asyncio.Future] = None
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+
+            if not done:
+                # 时间窗口到期，输出缓冲内容，继续等待同一个 pending
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+                continue
+
+            finished, pending = pending, None
+            try:
+                chunk = finished.result()
+            except StopAsyncIteration:
+                break
+            except Exception:
+                if buffer:
+                    yield "".join(buffer)
+                    buffer = []
+                raise
+
+            if first:
+                first = False
+                yield chunk
+                continue
+
+            buffer.append(chunk)
+            size += len(chunk.encode("utf-8"))
+            if deadline is None:
+                deadline = loop.time() + max_delay
+            if size >= max_bytes:
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        # 提前结束（客户端断开等）时取消正在等待的增量并关闭源迭代器
+        if pending is not None and not pending.done():
+            pending.cancel()
+            with suppress(asyncio.CancelledError, StopAsyncIteration, Exception):
+                await pending
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            with suppress(RuntimeError):
+                await aclose()
+
+
+class CancellableStreamingResponse(StreamingResponse):
+    """
+    客户端断开时立即关闭响应体迭代器的 StreamingResponse
+
+    Starlette 在客户端断开后只取消发送任务，若生成器恰好停在 yield 处，
+    要等到垃圾回收才会被关闭，期间上游调用仍在消耗 token 和连接。
+    这里在响应结束后显式 aclose，使取消沿生成器链一直传到上游请求。
+    """
+
+    def __init__(self, content, on_disconnect: Optional[Callable[[], None]] = None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_disconnect = on_disconnect
+        self.disconnected = False
+
+    async def listen_for_disconnect(self, receive: Receive) -> None:
+        await super().listen_for_disconnect(receive)
+        self.disconnected = True
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                with suppress(RuntimeError):
+                    await aclose()
+            if self.disconnected and self.on_disconnect is not None:
+                self.on_disconnect()
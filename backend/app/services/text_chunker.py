@@ -0,0 +1,116 @@
+"""
+长文本切分
+按标题和段落边界把长文本切成不超过指定长度的片段，
+超长段落再按句子切分，尽量不在句子中间断开。
+"""
+import re
+from typing import List, Tuple
+
+# Markdown 标题行
+HEADING_RE = re.compile(r"^#{1,6}\s")
+
+# 句末位置（中英文标点之后），切分后标点留在前一句
+SENTENCE_END_RE = re.compile(r"(?<=[。！？!?；;…])|(?<=\.)(?=\s)")
+
+# 段落之间的分隔符
+PARAGRAPH_SEP = "\n\n"
+
+
+def split_paragraphs(text: str) -> List[str]:
+    """按空行和标题行切分段落，标题单独成段"""
+    blocks: List[str] = []
+    current: List[str] = []
+
+    for line in text.replace("\r\n", "\n").split("\n"):
+        if not line.strip() or HEADING_RE.match(line):
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            if line.strip():
+                blocks.append(line)
+        else:
+            current.append(line)
+
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def split_sentences(paragraph: str, max_chars: int) -> List[Tuple[str, str]]:
+    """
+    把超长段落按句子切分，单句仍超长时硬切
+
+    Returns:
+        (片段, 与下一片段之间的分隔符) 列表；英文句间的空格作为分隔符保留
+    """
+    pieces: List[Tuple[str, str]] = []
+    current = ""
+
+    for sentence in SENTENCE_END_RE.split(paragraph):
+        if not sentence:
+            continue
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append((current, ""))
+                current = ""
+            pieces.append((sentence[:max_chars], ""))
+            sentence = sentence[max_chars:]
+        if current and len(current) + len(sentence) > max_chars:
+            stripped = sentence.lstrip()
+            pieces.append((current, sentence[:len(sentence) - len(stripped)]))
+            current = stripped
+        else:
+            current += sentence
+
+    if current:
+        pieces.append((current, ""))
+    return pieces
+
+
+def split_text(text: str, max_chars: int) -> List[Tuple[str, str]]:
+    """
+    把长文本切成若干片段
+
+    相邻的短段落合并到同一片段；当前片段已过半时，标题开启新片段，
+    避免标题和下一节正文被分开。
+
+    Args:
+        text: 原文
+        max_chars: 每个片段的最大字符数
+
+    Returns:
+        (片段, 与下一片段之间的分隔符) 列表，按原文顺序排列；
+        用分隔符依次拼接各片段的处理结果即可还原段落结构
+    """
+    chunks: List[Tuple[str, str]] = []
+    current: List[str] = []
+    current_len = 0
+
+    def flush():
+        nonlocal current, current_len
+        if current:
+            chunks.append((PARAGRAPH_SEP.join(current), PARAGRAPH_SEP))
+            current = []
+            current_len = 0
+
+    for block in split_paragraphs(text):
+        if len(block) > max_chars:
+            flush()
+            pieces = split_sentences(block, max_chars)
+            # 段内片段之间保留原有的句间分隔，最后一片之后是段落分隔
+            pieces[-1] = (pieces[-1][0], PARAGRAPH_SEP)
+            chunks.extend(pieces)
+            continue
+
+        added = len(block) + (len(PARAGRAPH_SEP) if current else 0)
+        starts_section = HEADING_RE.match(block) and current_len > max_chars // 2
+        if current and (starts_section or current_len + added > max_chars):
+            flush()
+            added = len(block)
+        current.append(block)
+        current_len += added
+
+    flush()
+    if chunks:
+        chunks[-1] = (chunks[-1][0], "")
+    return chunks
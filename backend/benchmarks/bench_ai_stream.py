@@ -0,0 +1,207 @@
+"""
+AI 接口压测
+按指定并发驱动 /api/ai/stream 和 /api/ai/process，统计首字节时间、
+每个流的输出速率、p50/p95/p99 延迟，以及（提供服务进程 PID 时）每个流消耗的服务端 CPU。
+
+用法:
+    python -m benchmarks.bench_ai_stream --base-url http://127.0.0.1:8000/api \\
+        --username bench --password bench123 --concurrency 20 --requests 200 --server-pid 12345
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+from typing import List, Optional
+
+import httpx
+
+DEFAULT_TEXT = "本报告基于光伏电站的运行数据，对发电效率、设备可用率和运维成本进行了系统分析。"
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近秩法计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def read_process_cpu(pid: int) -> Optional[float]:
+    """读取进程累计 CPU 时间（秒），仅支持 Linux /proc"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime、stime 分别是 stat 的第 14、15 个字段（去掉 pid 和 comm 后下标为 11、12）
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class Sample:
+    """单次请求的测量结果"""
+
+    def __init__(self):
+        self.ok = False
+        self.error: Optional[str] = None
+        self.ttfb = 0.0
+        self.latency = 0.0
+        self.chars = 0
+        self.frames = 0
+
+    @property
+    def chars_per_second(self) -> float:
+        duration = self.latency - self.ttfb
+        return self.chars / duration if duration > 0 else 0.0
+
+
+def parse_sse_payload(data: str) -> str:
+    """提取 SSE data 中的文本内容（兼容纯文本帧和 JSON 帧）"""
+    if data.startswith("{"):
+        try:
+            return json.loads(data).get("content", "")
+        except ValueError:
+            pass
+    return data
+
+
+async def run_stream(client: httpx.AsyncClient, body: dict) -> Sample:
+    sample = Sample()
+    started = time.perf_counter()
+    try:
+        async with client.stream("POST", "/ai/stream", json=body) as response:
+            if response.status_code != 200:
+                sample.error = f"HTTP {response.status_code}"
+                return sample
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = line[6:]
+                if not sample.frames:
+                    sample.ttfb = time.perf_counter() - started
+                if data == "[DONE]":
+                    sample.ok = True
+                    break
+                if data.startswith("[ERROR]"):
+                    sample.error = data
+                    break
+                sample.frames += 1
+                sample.chars += len(parse_sse_payload(data))
+    except httpx.HTTPError as e:
+        sample.error = type(e).__name__
+    sample.latency = time.perf_counter() - started
+    return sample
+
+
+async def run_process(client: httpx.AsyncClient, body: dict) -> Sample:
+    sample = Sample()
+    started = time.perf_counter()
+    try:
+        response = await client.post("/ai/process", json=body)
+        sample.ttfb = sample.latency = time.perf_counter() - started
+        if response.status_code == 200:
+            sample.ok = True
+            sample.chars = len(response.json().get("result", ""))
+            sample.frames = 1
+        else:
+            sample.error = f"HTTP {response.status_code}"
+    except httpx.HTTPError as e:
+        sample.error = type(e).__name__
+        sample.latency = time.perf_counter() - started
+    return sample
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    endpoint: str,
+    body: dict,
+    concurrency: int,
+    total: int,
+    server_pid: Optional[int],
+    same_text: bool = False
+) -> dict:
+    runner = run_stream if endpoint == "stream" else run_process
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int) -> Sample:
+        # 默认给每个请求加上序号，避免被结果缓存和单飞合并
+        request_body = body if same_text else {**body, "text": f"{body['text']} #{index}"}
+        async with semaphore:
+            return await runner(client, request_body)
+
+    cpu_before = read_process_cpu(server_pid) if server_pid else None
+    started = time.perf_counter()
+    samples = await asyncio.gather(*[one(i) for i in range(total)])
+    elapsed = time.perf_counter() - started
+    cpu_after = read_process_cpu(server_pid) if server_pid else None
+
+    ok = [s for s in samples if s.ok]
+    errors = {}
+    for s in samples:
+        if not s.ok:
+            errors[s.error or "unknown"] = errors.get(s.error or "unknown", 0) + 1
+
+    ttfb = [s.ttfb for s in ok]
+    latency = [s.latency for s in ok]
+    rates = [s.chars_per_second for s in ok if s.chars_per_second > 0]
+    report = {
+        "endpoint": f"/ai/{endpoint}",
+        "requests": total,
+        "concurrency": concurrency,
+        "ok": len(ok),
+        "errors": errors,
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "ttfb_ms": {f"p{p}": round(percentile(ttfb, p) * 1000, 1) for p in (50, 95, 99)},
+        "latency_ms": {f"p{p}": round(percentile(latency, p) * 1000, 1) for p in (50, 95, 99)},
+        "chars_per_second_mean": round(sum(rates) / len(rates), 1) if rates else 0.0,
+        "frames_per_request_mean": round(sum(s.frames for s in ok) / len(ok), 1) if ok else 0.0
+    }
+    if cpu_before is not None and cpu_after is not None:
+        report["server_cpu_ms_per_request"] = round((cpu_after - cpu_before) * 1000 / total, 2)
+    return report
+
+
+async def login(base_url: str, username: str, password: str) -> str:
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        response = await client.post("/auth/login", data={"username": username, "password": password})
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+
+async def main_async(args) -> None:
+    token = args.token or await login(args.base_url, args.username, args.password)
+    body = {"text": args.text, "action": args.action}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.base_url,
+        headers={"Authorization": f"Bearer {token}"},
+        limits=limits,
+        timeout=args.timeout
+    ) as client:
+        for endpoint in args.endpoints:
+            report = await run_scenario(
+                client, endpoint, body, args.concurrency, args.requests, args.server_pid, args.same_text
+            )
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI 流式接口压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000/api")
+    parser.add_argument("--token", help="JWT 访问令牌（不提供时使用用户名密码登录）")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench123")
+    parser.add_argument("--endpoints", nargs="+", choices=["stream", "process"], default=["stream", "process"])
+    parser.add_argument("--action", default="expand")
+    parser.add_argument("--text", default=DEFAULT_TEXT)
+    parser.add_argument("--same-text", action="store_true", help="所有请求使用相同文本（测试缓存和单飞合并）")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--server-pid", type=int, help="后端进程 PID，用于统计服务端 CPU")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+本地文件下载压测
+按指定并发反复下载同一个本地文件，统计吞吐量、延迟、每个请求传输的字节数，
+以及（提供服务进程 PID 时）每个请求和每 GB 消耗的服务端 CPU。
+
+场景:
+    full        普通完整下载
+    revalidate  带上次响应的 ETag 发送 If-None-Match（支持条件请求时应返回 304）
+    resume      Range 请求后半个文件（模拟断点续传，支持时返回 206）
+    multirange  同一请求取文件开头和中间两段各 64KB（multipart/byteranges）
+
+用法:
+    python -m benchmarks.bench_download --file-id 42 --username bench --password bench123 \\
+        --concurrency 8 --requests 40 --server-pid $(pgrep -of "uvicorn app.main:app")
+"""
+import json
+import time
+import asyncio
+import argparse
+from typing import Dict, Optional
+
+import httpx
+
+from benchmarks.bench_ai_stream import login, percentile, read_process_cpu
+
+SCENARIOS = ["full", "revalidate", "resume", "multirange"]
+
+
+class Sample:
+    """单次下载的测量结果"""
+
+    def __init__(self):
+        self.ok = False
+        self.error: Optional[str] = None
+        self.status = 0
+        self.latency = 0.0
+        self.bytes = 0
+
+
+async def fetch(client: httpx.AsyncClient, url: str, headers: Dict[str, str]) -> Sample:
+    sample = Sample()
+    started = time.perf_counter()
+    try:
+        async with client.stream("GET", url, headers=headers) as response:
+            sample.status = response.status_code
+            async for chunk in response.aiter_raw():
+                sample.bytes += len(chunk)
+        sample.ok = response.status_code in (200, 206, 304)
+        if not sample.ok:
+            sample.error = f"HTTP {response.status_code}"
+    except httpx.HTTPError as e:
+        sample.error = type(e).__name__
+    sample.latency = time.perf_counter() - started
+    return sample
+
+
+async def probe(client: httpx.AsyncClient, url: str) -> httpx.Headers:
+    """取一次响应头（文件大小和 ETag）"""
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        return response.headers
+
+
+def scenario_headers(scenario: str, size: int, etag: Optional[str]) -> Dict[str, str]:
+    if scenario == "revalidate":
+        return {"If-None-Match": etag} if etag else {}
+    if scenario == "resume":
+        return {"Range": f"bytes={size // 2}-"}
+    if scenario == "multirange":
+        middle = size // 2
+        return {"Range": f"bytes=0-65535,{middle}-{middle + 65535}"}
+    return {}
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    url: str,
+    scenario: str,
+    headers: Dict[str, str],
+    concurrency: int,
+    total: int,
+    server_pid: Optional[int]
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> Sample:
+        async with semaphore:
+            return await fetch(client, url, headers)
+
+    cpu_before = read_process_cpu(server_pid) if server_pid else None
+    started = time.perf_counter()
+    samples = await asyncio.gather(*[one() for _ in range(total)])
+    elapsed = time.perf_counter() - started
+    cpu_after = read_process_cpu(server_pid) if server_pid else None
+
+    ok = [s for s in samples if s.ok]
+    errors = {}
+    statuses = {}
+    for s in samples:
+        statuses[str(s.status)] = statuses.get(str(s.status), 0) + 1
+        if not s.ok:
+            errors[s.error or "unknown"] = errors.get(s.error or "unknown", 0) + 1
+
+    transferred = sum(s.bytes for s in ok)
+    latency = [s.latency for s in ok]
+    report = {
+        "scenario": scenario,
+        "requests": total,
+        "concurrency": concurrency,
+        "ok": len(ok),
+        "statuses": statuses,
+        "errors": errors,
+        "bytes_per_request": round(transferred / len(ok)) if ok else 0,
+        "throughput_mb_s": round(transferred / (1 << 20) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {f"p{p}": round(percentile(latency, p) * 1000, 1) for p in (50, 95, 99)}
+    }
+    if cpu_before is not None and cpu_after is not None:
+        cpu = cpu_after - cpu_before
+        report["server_cpu_ms_per_request"] = round(cpu * 1000 / total, 2)
+        if transferred:
+            report["server_cpu_s_per_gb"] = round(cpu / (transferred / (1 << 30)), 3)
+    return report
+
+
+async def main_async(args) -> None:
+    token = args.token or await login(args.base_url, args.username, args.password)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    url = f"/files/{args.file_id}/download"
+    async with httpx.AsyncClient(
+        base_url=args.base_url,
+        headers={"Authorization": f"Bearer {token}"},
+        limits=limits,
+        timeout=args.timeout
+    ) as client:
+        first = await probe(client, url)
+        size = int(first["content-length"])
+        etag = first.get("etag")
+        for scenario in args.scenarios:
+            report = await run_scenario(
+                client, url, scenario, scenario_headers(scenario, size, etag),
+                args.concurrency, args.requests, args.server_pid
+            )
+            report["file_size"] = size
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地文件下载压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000/api")
+    parser.add_argument("--token", help="JWT 访问令牌（不提供时使用用户名密码登录）")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench123")
+    parser.add_argument("--file-id", type=int, required=True, help="要下载的本地文件 ID")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--server-pid", type=int, help="后端进程 PID，用于统计服务端 CPU")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+本地 DeepSeek 模拟服务
+模拟 OpenAI 兼容的 /v1/chat/completions 流式接口，用于在不消耗真实 token 的情况下
+测试和压测 AI 流式链路。
+
+用法:
+    python -m benchmarks.mock_deepseek --port 9000 --token-rate 50 --first-token-delay 0.3
+
+然后在后端 .env 中设置:
+    DEEPSEEK_API_BASE=http://127.0.0.1:9000/v1
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 生成内容时循环使用的文本
+SAMPLE_TEXT = (
+    "本报告基于光伏电站的运行数据，对发电效率、设备可用率和运维成本进行了系统分析。"
+    "The analysis covers seasonal variation, inverter losses and degradation trends. "
+    "结果表明，通过优化清洗周期和逆变器调度，年发电量可提升约百分之三。"
+)
+
+# 运行参数（由命令行参数覆盖）
+CONFIG = {
+    "token_rate": 50.0,          # 每秒输出的 token 数
+    "first_token_delay": 0.3,    # 首 token 延迟（秒）
+    "chunk_tokens": 1,           # 每个 SSE 帧包含的 token 数
+    "completion_tokens": 200,    # 每次回复的 token 数（不超过请求的 max_tokens）
+    "error_rate": 0.0,           # 直接返回错误状态码的概率
+    "error_status": 500,         # 注入错误时的状态码
+    "mid_stream_error_rate": 0.0, # 输出中途断开的概率
+    "slow_rate": 0.0,            # 首 token 额外变慢的概率（模拟长尾延迟）
+    "slow_delay": 3.0            # 变慢时额外增加的首 token 延迟（秒）
+}
+
+app = FastAPI(title="DeepSeek Mock")
+
+
+def _token(index: int) -> str:
+    """按字符切分示例文本作为 token"""
+    return SAMPLE_TEXT[index % len(SAMPLE_TEXT)]
+
+
+def _chunk(
+    completion_id: str,
+    created: int,
+    content: Optional[str],
+    finish_reason: Optional[str] = None,
+    usage: Optional[dict] = None
+) -> str:
+    delta = {"content": content} if content is not None else {}
+    data = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": "deepseek-chat",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }
+    if usage is not None:
+        # stream_options.include_usage 时最后一帧 choices 为空，只带 usage
+        data["choices"] = []
+        data["usage"] = usage
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# 前缀缓存的粒度（DeepSeek 以 64 token 为单位缓存前缀，这里以字符近似 token）
+CACHE_UNIT = 64
+# 已缓存的前缀摘要
+_prefix_cache = set()
+
+
+def _prompt_text(body: dict) -> str:
+    return "".join(f"<{m.get('role')}>{m.get('content', '')}" for m in body.get("messages", []))
+
+
+def _prompt_tokens(body: dict) -> int:
+    return len(_prompt_text(body))
+
+
+def _usage(body: dict, completion_tokens: int) -> dict:
+    """模拟前缀缓存：之前请求过的最长前缀（按 CACHE_UNIT 对齐）计为命中"""
+    prompt = _prompt_text(body)
+    hit = 0
+    for end in range(CACHE_UNIT, len(prompt) + 1, CACHE_UNIT):
+        if hash(prompt[:end]) not in _prefix_cache:
+            break
+        hit = end
+    if len(_prefix_cache) > 100000:
+        _prefix_cache.clear()
+    for end in range(hit + CACHE_UNIT, len(prompt) + 1, CACHE_UNIT):
+        _prefix_cache.add(hash(prompt[:end]))
+    return {
+        "prompt_tokens": len(prompt),
+        "completion_tokens": completion_tokens,
+        "total_tokens": len(prompt) + completion_tokens,
+        "prompt_cache_hit_tokens": hit,
+        "prompt_cache_miss_tokens": len(prompt) - hit
+    }
+
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "deepseek-chat", "object": "model"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+
+    if random.random() < CONFIG["error_rate"]:
+        return JSONResponse(
+            status_code=CONFIG["error_status"],
+            content={"error": {"message": "injected error", "type": "mock_error"}}
+        )
+
+    total = min(CONFIG["completion_tokens"], int(body.get("max_tokens") or CONFIG["completion_tokens"]))
+    completion_id = f"mock-{random.getrandbits(48):x}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await asyncio.sleep(CONFIG["first_token_delay"] + total / CONFIG["token_rate"])
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": "deepseek-chat",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(_token(i) for i in range(total))},
+                "finish_reason": "stop"
+            }],
+            "usage": _usage(body, total)
+        }
+
+    fail_at = random.randint(1, max(1, total - 1)) if random.random() < CONFIG["mid_stream_error_rate"] else None
+    first_token_delay = CONFIG["first_token_delay"]
+    if random.random() < CONFIG["slow_rate"]:
+        first_token_delay += CONFIG["slow_delay"]
+
+    async def generate():
+        await asyncio.sleep(first_token_delay)
+        step = max(1, CONFIG["chunk_tokens"])
+        interval = step / CONFIG["token_rate"]
+        started = time.monotonic()
+        for index in range(0, total, step):
+            if fail_at is not None and index >= fail_at:
+                raise RuntimeError("injected mid-stream failure")
+            # 按绝对时间调度，避免 sleep 误差累积
+            delay = started + (index // step) * interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            content = "".join(_token(i) for i in range(index, min(index + step, total)))
+            yield _chunk(completion_id, created, content)
+        yield _chunk(completion_id, created, None, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield _chunk(completion_id, created, None, usage=_usage(body, total))
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DeepSeek 流式接口模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--token-rate", type=float, default=CONFIG["token_rate"], help="每秒输出的 token 数")
+    parser.add_argument("--first-token-delay", type=float, default=CONFIG["first_token_delay"], help="首 token 延迟（秒）")
+    parser.add_argument("--chunk-tokens", type=int, default=CONFIG["chunk_tokens"], help="每个 SSE 帧包含的 token 数")
+    parser.add_argument("--completion-tokens", type=int, default=CONFIG["completion_tokens"], help="每次回复的 token 数")
+    parser.add_argument("--error-rate", type=float, default=CONFIG["error_rate"], help="直接返回错误的概率")
+    parser.add_argument("--error-status", type=int, default=CONFIG["error_status"], help="注入错误的状态码")
+    parser.add_argument("--mid-stream-error-rate", type=float, default=CONFIG["mid_stream_error_rate"], help="输出中途断开的概率")
+    parser.add_argument("--slow-rate", type=float, default=CONFIG["slow_rate"], help="首 token 额外变慢的概率")
+    parser.add_argument("--slow-delay", type=float, default=CONFIG["slow_delay"], help="变慢时额外的首 token 延迟（秒）")
+    args = parser.parse_args()
+
+    CONFIG.update(
+        token_rate=args.token_rate,
+        first_token_delay=args.first_token_delay,
+        chunk_tokens=args.chunk_tokens,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        mid_stream_error_rate=args.mid_stream_error_rate,
+        slow_rate=args.slow_rate,
+        slow_delay=args.slow_delay
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
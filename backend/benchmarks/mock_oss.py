@@ -0,0 +1,252 @@
+"""
+本地 OSS 模拟服务
+实现 oss2 用到的对象和分片上传接口（PutObject、InitiateMultipartUpload、UploadPart、ListParts、
+CompleteMultipartUpload、AbortMultipartUpload、GetObject（支持 Range）、HeadObject、DeleteObject），
+数据保存在内存中，不校验签名。用于在没有真实 bucket 的情况下测试上传、续传和预览链路。
+
+用法:
+    python -m benchmarks.mock_oss --port 9100 --latency-per-mb 0.2 --fail-part 3
+
+然后在后端 .env 中设置:
+    OSS_ENDPOINT=http://127.0.0.1:9100
+    OSS_BUCKET_NAME=test-bucket
+"""
+import time
+import uuid
+import asyncio
+import hashlib
+import argparse
+from typing import Dict, Optional
+from xml.etree import ElementTree
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from oss2.utils import Crc64
+
+# 运行参数（由命令行参数覆盖）
+CONFIG = {
+    "latency_per_mb": 0.0,   # 每 MB 上传数据的额外耗时（秒），模拟到 OSS 的带宽
+    "fail_part": 0           # 每个分片上传中该编号的分片第一次上传返回 500（0 表示不注入）
+}
+
+app = FastAPI(title="OSS Mock")
+
+# (bucket, key) -> 对象内容
+objects: Dict[tuple, bytes] = {}
+# upload_id -> {"bucket", "key", "parts": {编号: 数据}, "failed": set()}
+uploads: Dict[str, dict] = {}
+
+stats = {
+    "put_objects": 0,
+    "parts_uploaded": 0,
+    "parts_inflight": 0,
+    "max_parts_inflight": 0,
+    "range_gets": 0,
+    "bytes_served": 0
+}
+
+
+def _etag(data: bytes) -> str:
+    return '"' + hashlib.md5(data).hexdigest().upper() + '"'
+
+
+def _crc(data: bytes) -> str:
+    crc = Crc64(0)
+    crc.update(data)
+    return str(crc.crc)
+
+
+def _headers(data: bytes) -> dict:
+    return {
+        "ETag": _etag(data),
+        "x-oss-hash-crc64ecma": _crc(data),
+        "x-oss-request-id": uuid.uuid4().hex
+    }
+
+
+def _error(status_code: int, code: str, message: str) -> Response:
+    body = (
+        f"<?xml version=\"1.0\" encoding=\"UTF-8\"?><Error><Code>{code}</Code>"
+        f"<Message>{message}</Message><RequestId>{uuid.uuid4().hex}</RequestId></Error>"
+    )
+    return Response(body, status_code=status_code, media_type="application/xml",
+                    headers={"x-oss-request-id": uuid.uuid4().hex})
+
+
+def _xml(body: str) -> Response:
+    return Response('<?xml version="1.0" encoding="UTF-8"?>' + body, media_type="application/xml",
+                    headers={"x-oss-request-id": uuid.uuid4().hex})
+
+
+async def _simulate_transfer(size: int) -> None:
+    if CONFIG["latency_per_mb"] > 0:
+        await asyncio.sleep(size / (1 << 20) * CONFIG["latency_per_mb"])
+
+
+def _parse_range(header: Optional[str], size: int) -> Optional[tuple]:
+    """解析单个 bytes=start-end 范围，无效时返回 None（按整个对象返回）"""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[6:].partition("-")
+    if not start:
+        if not end.isdigit():
+            return None
+        length = min(int(end), size)
+        return size - length, size - 1
+    if not start.isdigit() or int(start) >= size:
+        return None
+    last = int(end) if end.isdigit() else size - 1
+    return int(start), min(last, size - 1)
+
+
+@app.get("/_mock/stats")
+async def get_stats():
+    return {**stats, "objects": len(objects), "pending_uploads": len(uploads)}
+
+
+@app.put("/{bucket}/{key:path}")
+async def put(bucket: str, key: str, request: Request):
+    params = request.query_params
+    data = await request.body()
+
+    if "uploadId" in params:
+        upload = uploads.get(params["uploadId"])
+        if upload is None:
+            return _error(404, "NoSuchUpload", "The specified upload does not exist.")
+        number = int(params["partNumber"])
+        if number == CONFIG["fail_part"] and number not in upload["failed"]:
+            upload["failed"].add(number)
+            return _error(500, "InternalError", "injected part failure")
+        stats["parts_inflight"] += 1
+        stats["max_parts_inflight"] = max(stats["max_parts_inflight"], stats["parts_inflight"])
+        try:
+            await _simulate_transfer(len(data))
+        finally:
+            stats["parts_inflight"] -= 1
+        upload["parts"][number] = (data, time.time())
+        stats["parts_uploaded"] += 1
+        return Response(status_code=200, headers=_headers(data))
+
+    await _simulate_transfer(len(data))
+    objects[(bucket, key)] = data
+    stats["put_objects"] += 1
+    return Response(status_code=200, headers=_headers(data))
+
+
+@app.post("/{bucket}/{key:path}")
+async def post(bucket: str, key: str, request: Request):
+    params = request.query_params
+
+    if "uploads" in params:
+        upload_id = uuid.uuid4().hex.upper()
+        uploads[upload_id] = {"bucket": bucket, "key": key, "parts": {}, "failed": set()}
+        return _xml(
+            f"<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+            f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+        )
+
+    if "uploadId" in params:
+        upload = uploads.get(params["uploadId"])
+        if upload is None:
+            return _error(404, "NoSuchUpload", "The specified upload does not exist.")
+        root = ElementTree.fromstring(await request.body())
+        pieces = []
+        for part in root.findall("Part"):
+            number = int(part.find("PartNumber").text)
+            if number not in upload["parts"]:
+                return _error(400, "InvalidPart", f"part {number} not uploaded")
+            pieces.append(upload["parts"][number][0])
+        data = b"".join(pieces)
+        objects[(bucket, key)] = data
+        del uploads[params["uploadId"]]
+        headers = _headers(data)
+        return Response(
+            '<?xml version="1.0" encoding="UTF-8"?><CompleteMultipartUploadResult>'
+            f"<Bucket>{bucket}</Bucket><Key>{key}</Key><ETag>{headers['ETag']}</ETag>"
+            "</CompleteMultipartUploadResult>",
+            media_type="application/xml",
+            headers=headers
+        )
+
+    return _error(400, "InvalidArgument", "unsupported POST")
+
+
+@app.get("/{bucket}/{key:path}")
+async def get(bucket: str, key: str, request: Request):
+    params = request.query_params
+
+    if "uploadId" in params:
+        upload = uploads.get(params["uploadId"])
+        if upload is None:
+            return _error(404, "NoSuchUpload", "The specified upload does not exist.")
+        parts = "".join(
+            f"<Part><PartNumber>{number}</PartNumber>"
+            f"<LastModified>{time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(mtime))}</LastModified>"
+            f"<ETag>{_etag(data)}</ETag><Size>{len(data)}</Size></Part>"
+            for number, (data, mtime) in sorted(upload["parts"].items())
+        )
+        return _xml(
+            f"<ListPartsResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+            f"<UploadId>{params['uploadId']}</UploadId><NextPartNumberMarker></NextPartNumberMarker>"
+            f"<MaxParts>1000</MaxParts><IsTruncated>false</IsTruncated>{parts}</ListPartsResult>"
+        )
+
+    data = objects.get((bucket, key))
+    if data is None:
+        return _error(404, "NoSuchKey", "The specified key does not exist.")
+
+    byte_range = _parse_range(request.headers.get("range"), len(data))
+    if byte_range is not None:
+        start, end = byte_range
+        stats["range_gets"] += 1
+        stats["bytes_served"] += end - start + 1
+        return Response(
+            data[start:end + 1],
+            status_code=206,
+            headers={
+                "Content-Range": f"bytes {start}-{end}/{len(data)}",
+                "ETag": _etag(data),
+                "Accept-Ranges": "bytes"
+            },
+            media_type="application/octet-stream"
+        )
+    stats["bytes_served"] += len(data)
+    return Response(data, headers={**_headers(data), "Accept-Ranges": "bytes"},
+                    media_type="application/octet-stream")
+
+
+@app.head("/{bucket}/{key:path}")
+async def head(bucket: str, key: str):
+    data = objects.get((bucket, key))
+    if data is None:
+        return Response(status_code=404)
+    return Response(status_code=200, headers={**_headers(data), "Content-Length": str(len(data))})
+
+
+@app.delete("/{bucket}/{key:path}")
+async def delete(bucket: str, key: str, request: Request):
+    upload_id = request.query_params.get("uploadId")
+    if upload_id is not None:
+        if uploads.pop(upload_id, None) is None:
+            return _error(404, "NoSuchUpload", "The specified upload does not exist.")
+        return Response(status_code=204)
+    objects.pop((bucket, key), None)
+    return Response(status_code=204)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OSS 模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-per-mb", type=float, default=CONFIG["latency_per_mb"])
+    parser.add_argument("--fail-part", type=int, default=CONFIG["fail_part"])
+    args = parser.parse_args()
+
+    CONFIG["latency_per_mb"] = args.latency_per_mb
+    CONFIG["fail_part"] = args.fail_part
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""add_ai_usage_table
+
+Revision ID: a1c3e5f7b9d2
+Revises: 9fd3e8d1bc1e
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c3e5f7b9d2'
+down_revision = '9fd3e8d1bc1e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # AI 用量汇总表（按用户、操作和统计周期）
+    op.create_table(
+        'ai_usage',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('action', sa.String(length=32), nullable=False),
+        sa.Column('calls', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('prompt_tokens', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('completion_tokens', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('cache_hit_tokens', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('period_start', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('period_end', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ai_usage_id'), 'ai_usage', ['id'], unique=False)
+    op.create_index('ix_ai_usage_user_period', 'ai_usage', ['user_id', 'period_start'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_ai_usage_user_period', table_name='ai_usage')
+    op.drop_index(op.f('ix_ai_usage_id'), table_name='ai_usage')
+    op.drop_table('ai_usage')
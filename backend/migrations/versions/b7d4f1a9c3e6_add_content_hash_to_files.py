@@ -0,0 +1,27 @@
+"""add_content_hash_to_files
+
+Revision ID: b7d4f1a9c3e6
+Revises: a1c3e5f7b9d2
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d4f1a9c3e6'
+down_revision = 'a1c3e5f7b9d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 文件内容 SHA-256，用于内容寻址去重和引用计数
+    op.add_column('files', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_files_content_hash'), 'files', ['content_hash'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_files_content_hash'), table_name='files')
+    op.drop_column('files', 'content_hash')
@@ -0,0 +1,7 @@
+"""
+测试公共配置：把 backend 目录加入导入路径，便于直接 import app
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
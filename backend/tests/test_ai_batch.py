@@ -0,0 +1,73 @@
+"""
+批量处理的准入控制：整批只消耗一次限流令牌，各项只占并发槽位
+"""
+import asyncio
+
+from app.services import ai_service
+from app.services.ai_limiter import AdmissionController
+from app.services.ai_usage import usage_user
+
+
+def make_controller() -> AdmissionController:
+    # 与默认配置一致的单用户限制：突发 10、每秒 1 个令牌、并发 3；排队超时设得很短
+    return AdmissionController(
+        max_concurrent=100,
+        max_per_user=3,
+        max_queue=100,
+        queue_timeout=0.05,
+        user_rate=1,
+        user_burst=10
+    )
+
+
+def test_batch_of_30_items_fully_succeeds(monkeypatch):
+    controller = make_controller()
+    monkeypatch.setattr(ai_service, "ai_admission", controller)
+
+    running = 0
+    peak = 0
+
+    async def fake_call_ai(text, action, custom_prompt=None, context_key=None):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return text.upper()
+
+    monkeypatch.setattr(ai_service, "call_ai", fake_call_ai)
+
+    async def run():
+        usage_user.set(7)
+        permit = await controller.acquire(7)
+        items = [{"id": str(i), "text": f"item{i}", "action": "polish"} for i in range(30)]
+        try:
+            return [outcome async for outcome in ai_service.process_batch(items, 4)]
+        finally:
+            permit.release()
+
+    outcomes = asyncio.run(run())
+
+    assert len(outcomes) == 30
+    assert all(outcome["success"] for outcome in outcomes), outcomes
+    assert sorted(outcome["result"] for outcome in outcomes) == sorted(f"ITEM{i}" for i in range(30))
+    # 不超过单用户并发上限，且只消耗了准入时的一个令牌
+    assert peak <= 3
+    assert controller.rejected_rate == 0 and controller.rejected_timeout == 0
+    assert controller.active == 0
+
+
+def test_batch_without_admission_context_only_uses_parallelism(monkeypatch):
+    monkeypatch.setattr(ai_service, "ai_admission", make_controller())
+
+    async def fake_call_ai(text, action, custom_prompt=None, context_key=None):
+        return text
+
+    monkeypatch.setattr(ai_service, "call_ai", fake_call_ai)
+
+    async def run():
+        items = [{"id": str(i), "text": f"t{i}", "action": "polish"} for i in range(5)]
+        return [outcome async for outcome in ai_service.process_batch(items, 2)]
+
+    outcomes = asyncio.run(run())
+    assert [o["success"] for o in outcomes] == [True] * 5
@@ -0,0 +1,92 @@
+"""
+AI 结果缓存：缓存键规范化、LRU/TTL 内存层和磁盘层
+"""
+import asyncio
+import os
+import time
+
+from app.services.ai_cache import AIResultCache, iter_replay_chunks, make_cache_key, normalize_text
+
+
+def test_normalize_text():
+    assert normalize_text("  a \t b\r\n  c  ") == "a b\nc"
+    assert normalize_text("é") == "é"
+    assert normalize_text("") == ""
+
+
+def test_cache_key_ignores_whitespace_but_not_parameters():
+    key = make_cache_key("polish", "你好  世界", None, "m", 0.7)
+    assert key == make_cache_key("polish", " 你好 世界\r\n", "", "m", 0.7)
+    assert key != make_cache_key("translate", "你好 世界", None, "m", 0.7)
+    assert key != make_cache_key("polish", "你好 世界", "更正式", "m", 0.7)
+    assert key != make_cache_key("polish", "你好 世界", None, "m", 0.2)
+
+
+def test_replay_chunks():
+    assert list(iter_replay_chunks("abcdefg", 3)) == ["abc", "def", "g"]
+    assert list(iter_replay_chunks("", 3)) == []
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = AIResultCache(max_entries=2, max_bytes=10, ttl=60)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None and cache.get("a") == "1"
+
+    cache.put("d", "x" * 9)
+    assert cache.stats()["bytes"] <= 10
+    assert cache.get("d") == "x" * 9
+    # 单个超过容量的结果不缓存
+    cache.put("e", "y" * 11)
+    assert cache.get("e") is None
+
+
+def test_expired_entries_are_dropped():
+    cache = AIResultCache(max_entries=10, max_bytes=100, ttl=60)
+    cache.put("a", "1", expires_at=time.time() - 1)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lookup_counts_and_disk_layer(tmp_path):
+    cache = AIResultCache(max_entries=10, max_bytes=1000, ttl=60, disk_dir=str(tmp_path))
+
+    async def run():
+        assert await cache.lookup("ab12") is None
+        await cache.store("ab12", "结果")
+        assert await cache.lookup("ab12") == "结果"
+        # 清空内存层后从磁盘层命中，并回填内存层
+        cache.clear()
+        assert await cache.lookup("ab12") == "结果"
+        assert cache.get("ab12") == "结果"
+
+    asyncio.run(run())
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+    assert os.path.exists(tmp_path / "ab" / "ab12.json")
+
+
+def test_corrupt_or_expired_disk_entries_are_removed(tmp_path):
+    cache = AIResultCache(max_entries=10, max_bytes=1000, ttl=60, disk_dir=str(tmp_path))
+    cache.save_to_disk("cd34", "old", time.time() - 1)
+    assert cache.load_from_disk("cd34") is None
+    assert not os.path.exists(tmp_path / "cd" / "cd34.json")
+
+    path = tmp_path / "ef" / "ef56.json"
+    path.parent.mkdir()
+    path.write_text("{broken", encoding="utf-8")
+    assert cache.load_from_disk("ef56") is None
+    assert not path.exists()
+
+
+def test_prune_disk_keeps_newest_entries(tmp_path):
+    cache = AIResultCache(max_entries=10, max_bytes=1000, ttl=60, disk_dir=str(tmp_path), disk_max_entries=2)
+    now = time.time()
+    for i, key in enumerate(["aa01", "aa02", "aa03"]):
+        cache.save_to_disk(key, key, now + 60)
+        os.utime(cache._disk_path(key), (now - 10 + i, now - 10 + i))
+    cache.prune_disk()
+    remaining = sorted(os.listdir(tmp_path / "aa"))
+    assert remaining == ["aa02.json", "aa03.json"]
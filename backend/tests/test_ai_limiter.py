@@ -0,0 +1,214 @@
+"""
+AI 准入控制：令牌桶、并发上限、排队超时、FIFO 唤醒和取消
+"""
+import asyncio
+
+import pytest
+
+from app.services import ai_limiter
+from app.services.ai_limiter import AdmissionController, AdmissionRejected, TokenBucket
+
+
+def make_controller(**overrides) -> AdmissionController:
+    options = dict(
+        max_concurrent=2,
+        max_per_user=2,
+        max_queue=2,
+        queue_timeout=0.05,
+        user_rate=1000,
+        user_burst=1000
+    )
+    options.update(overrides)
+    return AdmissionController(**options)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+# ---------- 令牌桶 ----------
+
+def test_token_bucket_burst_and_refill(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ai_limiter.time, "monotonic", clock)
+    bucket = TokenBucket(rate=2, capacity=3)
+
+    assert [bucket.try_acquire()[0] for _ in range(3)] == [True, True, True]
+    ok, retry_after = bucket.try_acquire()
+    assert not ok and retry_after == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert bucket.try_acquire() == (True, 0.0)
+    assert not bucket.is_full()
+
+    # 补充不超过容量
+    clock.now += 60
+    assert bucket.is_full() and bucket.tokens == 3
+
+
+def test_zero_rate_bucket_suggests_a_minute():
+    bucket = TokenBucket(rate=0, capacity=1)
+    assert bucket.try_acquire()[0]
+    assert bucket.try_acquire() == (False, 60.0)
+
+
+def test_rate_limited_request_is_rejected():
+    controller = make_controller(user_rate=0.5, user_burst=1)
+
+    async def run():
+        permit = await controller.acquire(1)
+        permit.release()
+        with pytest.raises(AdmissionRejected) as info:
+            await controller.acquire(1)
+        return info.value
+
+    error = asyncio.run(run())
+    assert error.retry_after == 2
+    assert controller.rejected_rate == 1
+    # 其他用户有自己的令牌桶
+    assert asyncio.run(controller.acquire(2)) is not None
+
+
+def test_retry_after_is_rounded_up_to_whole_seconds():
+    assert AdmissionRejected("x", 0.01).retry_after == 1
+    assert AdmissionRejected("x", 2.1).retry_after == 3
+
+
+# ---------- 并发与排队 ----------
+
+def test_queue_timeout_rejects_and_leaves_queue():
+    controller = make_controller(max_concurrent=1)
+
+    async def run():
+        permit = await controller.acquire(1)
+        with pytest.raises(AdmissionRejected) as info:
+            await controller.acquire(2)
+        permit.release()
+        return info.value
+
+    error = asyncio.run(run())
+    assert "排队超时" in error.detail
+    assert controller.rejected_timeout == 1
+    assert controller.stats()["queue_depth"] == 0
+    assert controller.active == 0
+
+
+def test_full_queue_rejects_immediately():
+    controller = make_controller(max_concurrent=1, max_queue=1, queue_timeout=1)
+
+    async def run():
+        permit = await controller.acquire(1)
+        waiter = asyncio.ensure_future(controller.acquire(2))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire(3)
+        permit.release()
+        (await waiter).release()
+
+    asyncio.run(run())
+    assert controller.rejected_queue_full == 1
+    assert controller.admitted == 2
+    assert controller.active == 0
+
+
+def test_waiters_are_woken_in_fifo_order_skipping_busy_users():
+    controller = make_controller(max_concurrent=2, max_per_user=1, max_queue=10, queue_timeout=1)
+    order = []
+
+    async def run():
+        first = await controller.acquire(1)
+        second = await controller.acquire(2)
+
+        async def wait(user_id):
+            permit = await controller.acquire(user_id)
+            order.append(user_id)
+            return permit
+
+        # 用户 1 已达单用户上限，释放用户 2 的槽位时应跳过排在前面的用户 1
+        tasks = [asyncio.ensure_future(wait(uid)) for uid in (1, 3, 4)]
+        await asyncio.sleep(0)
+        second.release()
+        await asyncio.sleep(0.01)
+        assert order == [3]
+
+        first.release()
+        await asyncio.sleep(0.01)
+        assert order == [3, 1]
+
+        permits = [await task for task in tasks[:2]]
+        for permit in permits:
+            permit.release()
+        (await tasks[2]).release()
+
+    asyncio.run(run())
+    assert order == [3, 1, 4]
+    assert controller.active == 0
+    assert controller.wait_count == 3
+
+
+def test_cancelled_waiter_leaves_queue_without_leaking_slot():
+    controller = make_controller(max_concurrent=1, queue_timeout=1)
+
+    async def run():
+        permit = await controller.acquire(1)
+        waiter = asyncio.ensure_future(controller.acquire(2))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert controller.stats()["queue_depth"] == 0
+        permit.release()
+
+        # 已分配槽位后才被取消：要么归还槽位并抛出 CancelledError，要么照常返回许可
+        permit = await controller.acquire(1)
+        waiter = asyncio.ensure_future(controller.acquire(2))
+        await asyncio.sleep(0)
+        permit.release()
+        waiter.cancel()
+        try:
+            (await waiter).release()
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+    assert controller.active == 0
+    assert controller.stats()["active_users"] == 0
+
+
+def test_release_is_idempotent():
+    controller = make_controller()
+
+    async def run():
+        async with await controller.acquire(1) as permit:
+            assert controller.active == 1
+        permit.release()
+
+    asyncio.run(run())
+    assert controller.active == 0
+
+
+def test_extra_slots_do_not_jump_the_queue():
+    controller = make_controller(max_concurrent=2, max_per_user=2, queue_timeout=1)
+
+    async def run():
+        permit = await controller.acquire(1)
+        extra = controller.try_acquire_extra(1)
+        assert extra is not None and controller.active == 2
+        assert controller.try_acquire_extra(1) is None
+
+        waiter = asyncio.ensure_future(controller.acquire(2))
+        await asyncio.sleep(0)
+        extra.release()
+        # 槽位交给排队者，不再借出
+        assert controller.try_acquire_extra(1) is None
+        (await waiter).release()
+        permit.release()
+
+    asyncio.run(run())
+    assert controller.active == 0
+    # 借用槽位不消耗限流令牌
+    assert controller._buckets[1].tokens >= 998
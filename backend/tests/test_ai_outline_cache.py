@@ -0,0 +1,34 @@
+"""
+结构化大纲缓存按用户隔离
+"""
+import asyncio
+
+from app.services import ai_service
+from app.services.outline_parser import OutlineCache
+
+
+def test_outline_cache_is_scoped_per_user(monkeypatch):
+    calls = []
+
+    async def fake_stream(text, action, custom_prompt=None, context_key=None):
+        calls.append(custom_prompt)
+        for piece in ["# 标题", "\n## 小节\n", "说明\n"]:
+            yield piece
+
+    monkeypatch.setattr(ai_service, "stream_ai_response", fake_stream)
+    monkeypatch.setattr(ai_service, "outline_cache", OutlineCache(max_entries=10, ttl=60))
+
+    async def collect(user_id):
+        return [event async for event in ai_service.stream_outline('{"topic": "t"}', user_id)]
+
+    async def run():
+        first = await collect(1)
+        replay = await collect(1)
+        other = await collect(2)
+        return first, replay, other
+
+    first, replay, other = asyncio.run(run())
+    assert first == replay == other
+    # 同一用户第二次直接回放，另一个用户重新生成
+    assert len(calls) == 2
+    assert [kind for kind, _ in first] == ["node", "node", "text"]
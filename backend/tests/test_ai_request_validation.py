@@ -0,0 +1,35 @@
+"""
+AI 请求模型按操作校验文本长度
+"""
+import pytest
+from pydantic import ValidationError
+
+from app.api.endpoints.ai import AIRequest, AIMultiRequest, AIBatchItem
+from app.core.config import settings
+from app.services.ai_service import MAX_TEXT_LENGTH
+
+
+def test_long_text_allowed_for_chunked_actions():
+    AIRequest(text="字" * (MAX_TEXT_LENGTH + 1), action="polish")
+
+
+@pytest.mark.parametrize("action", ["explain", "continue", "outline"])
+def test_long_text_rejected_for_other_actions(action):
+    with pytest.raises(ValidationError):
+        AIRequest(text="字" * (MAX_TEXT_LENGTH + 1), action=action)
+
+
+def test_ask_is_not_length_limited_below_field_maximum():
+    AIRequest(text="字" * settings.AI_LONG_TEXT_MAX_CHARS, action="ask")
+
+
+def test_multi_checks_every_action():
+    text = "字" * (MAX_TEXT_LENGTH + 1)
+    AIMultiRequest(text=text, actions=["polish", "condense"])
+    with pytest.raises(ValidationError):
+        AIMultiRequest(text=text, actions=["polish", "explain"])
+
+
+def test_batch_item_checks_its_action():
+    with pytest.raises(ValidationError):
+        AIBatchItem(id="1", text="字" * (MAX_TEXT_LENGTH + 1), action="explain")
@@ -0,0 +1,178 @@
+"""
+AI 上游路由：失败重试、对冲请求、熔断和端点配置
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.services.ai_router import (
+    UpstreamEndpoint, UpstreamError, UpstreamRouter, is_retryable, load_endpoints, percentile
+)
+
+
+def make_router(names=("a", "b"), **options) -> UpstreamRouter:
+    options.setdefault("hedge_enabled", False)
+    router = UpstreamRouter([UpstreamEndpoint(n, f"http://{n}", "key", "model") for n in names], **options)
+    router.EXPLORE_RATIO = 0
+    return router
+
+
+def fake_upstream(behaviour: dict, opened: list, closed: list):
+    """behaviour: 端点名 -> (首字延迟, 片段列表或异常)"""
+    def open_stream(endpoint):
+        delay, result = behaviour[endpoint.name]
+        opened.append(endpoint.name)
+
+        async def generate():
+            try:
+                await asyncio.sleep(delay)
+                if isinstance(result, Exception):
+                    raise result
+                for chunk in result:
+                    yield chunk
+            finally:
+                closed.append(endpoint.name)
+        return generate()
+    return open_stream
+
+
+def run_stream(router, open_stream) -> str:
+    async def run():
+        return "".join([chunk async for chunk in router.stream(open_stream)])
+    return asyncio.run(run())
+
+
+def test_is_retryable():
+    assert is_retryable(httpx.ConnectError("refused"))
+    assert is_retryable(UpstreamError("busy", 429))
+    assert is_retryable(UpstreamError("down", 503))
+    assert not is_retryable(UpstreamError("bad request", 400))
+    assert not is_retryable(ValueError())
+    assert not is_retryable(None)
+
+
+def test_percentile():
+    assert percentile([5, 1, 3, 2, 4], 50) == 3
+    assert percentile(range(1, 101), 95) == 95
+    assert percentile([7], 99) == 7
+
+
+def test_retryable_failure_moves_to_next_endpoint():
+    router = make_router()
+    opened, closed = [], []
+    behaviour = {"a": (0, httpx.ConnectError("refused")), "b": (0, ["he", "llo"])}
+    assert run_stream(router, fake_upstream(behaviour, opened, closed)) == "hello"
+    assert opened == ["a", "b"]
+    a, b = router.endpoints
+    assert a.failures == 1 and a.error_rate > 0 and a.consecutive_failures == 1
+    assert b.ewma_ttft is not None and b.error_rate == 0
+    assert a.inflight == 0 and b.inflight == 0
+
+
+def test_non_retryable_error_is_raised_without_retry():
+    router = make_router()
+    opened, closed = [], []
+    behaviour = {"a": (0, UpstreamError("bad", 400)), "b": (0, ["x"])}
+    with pytest.raises(UpstreamError):
+        run_stream(router, fake_upstream(behaviour, opened, closed))
+    assert opened == ["a"]
+    # 调用方的错误不计入端点健康度
+    assert router.endpoints[0].failures == 0
+
+
+def test_attempts_are_bounded():
+    router = make_router(names=("a", "b", "c"), max_attempts=2)
+    error = httpx.ConnectError("refused")
+    behaviour = {name: (0, error) for name in "abc"}
+    opened = []
+    with pytest.raises(httpx.ConnectError):
+        run_stream(router, fake_upstream(behaviour, opened, []))
+    assert len(opened) == 2
+
+
+def test_hedge_wins_and_slow_attempt_is_cancelled():
+    router = make_router(hedge_enabled=True, hedge_default_delay=0.02)
+    opened, closed = [], []
+    behaviour = {"a": (5, ["slow"]), "b": (0, ["fast"])}
+    started = time.perf_counter()
+    assert run_stream(router, fake_upstream(behaviour, opened, closed)) == "fast"
+    assert time.perf_counter() - started < 1
+    assert opened == ["a", "b"]
+    assert sorted(closed) == ["a", "b"]
+    assert router.hedges == 1 and router.hedge_wins == 1
+    # 被取消的请求不计为失败
+    assert router.endpoints[0].failures == 0 and router.endpoints[0].inflight == 0
+
+
+def test_no_hedge_when_first_token_is_fast():
+    router = make_router(hedge_enabled=True, hedge_default_delay=1)
+    opened = []
+    behaviour = {"a": (0, ["ok"]), "b": (0, ["unused"])}
+    assert run_stream(router, fake_upstream(behaviour, opened, [])) == "ok"
+    assert opened == ["a"] and router.hedges == 0
+
+
+def test_hedge_delay_uses_percentile_within_bounds():
+    router = make_router(hedge_min_samples=3, hedge_default_delay=3, hedge_min_delay=0.2, hedge_max_delay=10)
+    endpoint = router.endpoints[0]
+    assert router.hedge_delay(endpoint) == 3
+    endpoint.samples.extend([0.01, 0.02, 0.03])
+    assert router.hedge_delay(endpoint) == 0.2
+    endpoint.samples.extend([50, 60, 70])
+    assert router.hedge_delay(endpoint) == 10
+    endpoint.samples.clear()
+    endpoint.samples.extend([1, 2, 3])
+    assert router.hedge_delay(endpoint) == 3
+
+
+def test_circuit_opens_after_consecutive_failures_and_recovers():
+    router = make_router(failure_threshold=2, open_seconds=60)
+    a, b = router.endpoints
+    for _ in range(2):
+        a.inflight += 1
+        router._record_outcome(a, "error", UpstreamError("down", 500))
+    assert a.open_until > time.time()
+    assert router.pick(set()) is b
+
+    # 全部熔断时，首个请求仍选择最早恢复的端点
+    b.open_until = a.open_until + 10
+    assert router.pick(set()) is None
+    assert router.pick(set(), fallback=True) is a
+
+    # 熔断到期后进入半开状态，只放行一个探测请求
+    a.open_until = time.time() - 1
+    assert router.pick({"b"}) is a and a.probing
+    assert router.pick({"b"}) is None
+    a.inflight += 1
+    router._record_outcome(a, "success")
+    assert a.open_until == 0 and not a.probing and a.consecutive_failures == 0
+
+
+def test_failed_probe_reopens_circuit():
+    router = make_router(failure_threshold=5, open_seconds=60)
+    a = router.endpoints[0]
+    a.open_until = time.time() - 1
+    assert router.pick({"b"}) is a
+    a.inflight += 1
+    router._record_outcome(a, "error", httpx.ReadTimeout("timeout"))
+    assert a.open_until > time.time() and not a.probing
+
+
+def test_load_endpoints():
+    default = load_endpoints("", "http://base", "k", "m")
+    assert [(e.name, e.base_url, e.api_key, e.model) for e in default] == [("default", "http://base", "k", "m")]
+
+    endpoints = load_endpoints(
+        '[{"name": "primary", "base_url": "http://one/"}, {"api_key": "k2", "model": "m2"}]',
+        "http://base", "k", "m"
+    )
+    assert [(e.name, e.base_url, e.api_key, e.model) for e in endpoints] == [
+        ("primary", "http://one", "k", "m"),
+        ("upstream-2", "http://base", "k2", "m2")
+    ]
+    with pytest.raises(ValueError):
+        load_endpoints("not json", "http://base", "k", "m")
+    with pytest.raises(ValueError):
+        UpstreamRouter([])
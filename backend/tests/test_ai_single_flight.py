@@ -0,0 +1,75 @@
+"""
+单飞合并：订阅者共享上游调用、全部离开时取消、后加入者按各自用户计量
+"""
+import asyncio
+
+from app.services import ai_usage
+from app.services.ai_service import SingleFlight
+from app.services.ai_usage import UsageMeter, record_usage, usage_user
+
+
+def slow_factory(calls: list, pieces=("a", "b", "c"), usage=None, action="polish"):
+    def factory():
+        calls.append(1)
+
+        async def generate():
+            for piece in pieces:
+                await asyncio.sleep(0.01)
+                yield piece
+            if usage is not None:
+                record_usage(action, usage)
+        return generate()
+    return factory
+
+
+def test_concurrent_subscribers_share_one_call():
+    async def run():
+        flight, calls = SingleFlight(), []
+
+        async def consume():
+            return "".join([p async for p in flight.stream("k", slow_factory(calls))])
+
+        results = await asyncio.gather(consume(), consume(), consume())
+        return results, calls, flight
+
+    results, calls, flight = asyncio.run(run())
+    assert results == ["abc"] * 3
+    assert calls == [1]
+    assert flight.leaders == 1 and flight.joiners == 2 and flight.inflight() == 0
+
+
+def test_last_subscriber_leaving_cancels_and_reports_abandon():
+    async def run():
+        flight, abandoned = SingleFlight(), []
+        stream = flight.stream("k", slow_factory([], pieces=["x"] * 50), on_abandon=abandoned.append)
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0)
+        return flight, abandoned
+
+    flight, abandoned = asyncio.run(run())
+    assert len(abandoned) == 1 and abandoned[0] < 50
+    assert flight.inflight() == 0
+
+
+def test_joined_request_is_metered_for_its_own_user(monkeypatch):
+    meter = UsageMeter(flush_interval=60)
+    monkeypatch.setattr(ai_usage, "usage_meter", meter)
+    monkeypatch.setattr(ai_usage.settings, "AI_USAGE_ENABLED", True)
+    usage = {"prompt_tokens": 10, "completion_tokens": 5}
+
+    async def run():
+        flight, calls = SingleFlight(), []
+        factory = slow_factory(calls, usage=usage)
+
+        async def consume(user_id):
+            usage_user.set(user_id)
+            shared = lambda usages: ai_usage.record_shared_usage("polish", usages)
+            return "".join([p async for p in flight.stream("k", factory, on_joined=shared)])
+
+        await asyncio.gather(consume(1), consume(2))
+        return calls
+
+    assert asyncio.run(run()) == [1]
+    assert meter.pending_for(1) == {"polish": [1, 10, 5, 0]}
+    assert meter.pending_for(2) == {"polish": [1, 10, 5, 0]}
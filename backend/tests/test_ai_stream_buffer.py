@@ -0,0 +1,125 @@
+"""
+可续传流注册表：延迟启动、无读者超时、断开取消和数量上限
+"""
+import asyncio
+
+import pytest
+
+from app.services.ai_stream_buffer import StreamRegistry, StreamExpired, StreamCapacityExceeded
+
+
+def make_registry(max_streams: int = 10, attach_timeout: float = 0.05) -> StreamRegistry:
+    return StreamRegistry(max_streams=max_streams, max_frames=100, ttl=60, resume_grace=0.05, attach_timeout=attach_timeout)
+
+
+def counting_factory(calls: list, frames=("a", "b", "c"), delay: float = 0.0):
+    def factory():
+        calls.append(1)
+
+        async def generate():
+            for frame in frames:
+                if delay:
+                    await asyncio.sleep(delay)
+                yield frame
+        return generate()
+    return factory
+
+
+def test_generation_starts_on_first_reader():
+    async def run():
+        registry = make_registry()
+        calls, finished = [], []
+        stream = registry.start(1, counting_factory(calls), on_finish=lambda: finished.append(1))
+        await asyncio.sleep(0.01)
+        assert calls == [] and stream.task is None
+        frames = [content async for _, content in registry.follow(stream)]
+        return calls, finished, frames
+
+    calls, finished, frames = asyncio.run(run())
+    assert calls == [1]
+    assert finished == [1]
+    assert frames == ["a", "b", "c"]
+
+
+def test_stream_without_reader_is_discarded_without_calling_upstream():
+    async def run():
+        registry = make_registry(attach_timeout=0.02)
+        calls, finished = [], []
+        stream = registry.start(1, counting_factory(calls), on_finish=lambda: finished.append(1))
+        await asyncio.sleep(0.05)
+        with pytest.raises(StreamExpired):
+            async for _ in registry.follow(stream):
+                pass
+        return calls, finished
+
+    calls, finished = asyncio.run(run())
+    assert calls == []
+    assert finished == [1]
+
+
+def test_non_resumable_stream_is_cancelled_when_reader_leaves():
+    async def run():
+        registry = make_registry()
+        finished = []
+        stream = registry.start(1, counting_factory([], frames=["x"] * 50, delay=0.01), on_finish=lambda: finished.append(1))
+        frames = registry.follow(stream)
+        await frames.__anext__()
+        await frames.aclose()
+        await asyncio.sleep(0.02)
+        return stream, finished
+
+    stream, finished = asyncio.run(run())
+    assert stream.done and finished == [1]
+    assert stream.last_seq < 50
+
+
+def test_resumable_stream_survives_reconnect_within_grace():
+    async def run():
+        registry = make_registry()
+        stream = registry.start(1, counting_factory([], frames=["x"] * 5, delay=0.005), resumable=True)
+        frames = registry.follow(stream)
+        seq, _ = await frames.__anext__()
+        await frames.aclose()
+        await asyncio.sleep(0.01)
+        resumed, after = registry.resolve(stream.event_id(seq), 1)
+        return [s async for s, _ in registry.follow(resumed, after)]
+
+    assert asyncio.run(run()) == [2, 3, 4, 5]
+
+
+def test_live_streams_are_capped():
+    async def run():
+        registry = make_registry(max_streams=2, attach_timeout=5)
+        slow = counting_factory([], frames=["x"] * 100, delay=0.01)
+        readers = []
+        for _ in range(2):
+            stream = registry.start(1, slow)
+            frames = registry.follow(stream)
+            await frames.__anext__()
+            readers.append(frames)
+        with pytest.raises(StreamCapacityExceeded):
+            registry.start(1, slow)
+        for frames in readers:
+            await frames.aclose()
+        # 读者都已离开的流可以被淘汰，给新流腾出位置
+        registry.start(1, slow)
+        for stream in list(registry._streams.values()):
+            registry.cancel(stream)
+
+    asyncio.run(run())
+
+
+def test_finished_streams_are_evicted_first():
+    async def run():
+        registry = make_registry(max_streams=2)
+        first = registry.start(1, counting_factory([]))
+        assert [c async for _, c in registry.follow(first)] == ["a", "b", "c"]
+        second = registry.start(1, counting_factory([]))
+        third = registry.start(1, counting_factory([]))
+        ids = set(registry._streams)
+        for stream in (second, third):
+            registry.cancel(stream)
+        return first, ids
+
+    first, ids = asyncio.run(run())
+    assert first.id not in ids and len(ids) == 2
@@ -0,0 +1,81 @@
+"""
+问答参考内容检索：分词、BM25 排序、token 预算和索引缓存
+"""
+from app.services import context_retriever
+from app.services.context_retriever import (
+    OMITTED_SEP, BM25Index, ContextIndexCache, estimate_tokens, select_context, tokenize
+)
+
+
+def test_tokenize_mixes_cjk_bigrams_and_words():
+    assert tokenize("数据库 Index-Tuning v2.0") == ["数据", "据库", "index-tuning", "v2.0"]
+    assert tokenize("猫") == ["猫"]
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("中" * 10) == 7
+    assert estimate_tokens("a" * 10) == 4
+
+
+PASSAGES = [
+    "苹果是一种常见的水果，富含维生素。",
+    "数据库索引可以加快查询速度，但会增加写入开销。",
+    "今天天气晴朗，适合出门散步。",
+    "为数据库建立索引时要考虑查询模式。"
+]
+
+
+def build_index() -> BM25Index:
+    index = BM25Index(passage_chars=30)
+    index.build("\n\n".join(PASSAGES))
+    return index
+
+
+def test_search_returns_relevant_passages_in_document_order():
+    index = build_index()
+    assert len(index.passages) == 4
+    scores = index.scores("数据库索引")
+    assert scores[0] == 0 and scores[2] == 0
+    assert scores[1] > 0 and scores[3] > 0
+    assert index.search("数据库索引", top_k=2, token_budget=1000) == [PASSAGES[1], PASSAGES[3]]
+    assert index.search("数据库索引", top_k=1, token_budget=1000) in ([PASSAGES[1]], [PASSAGES[3]])
+    assert index.search("火星", top_k=3, token_budget=1000) == []
+
+
+def test_search_respects_token_budget():
+    index = build_index()
+    budget = index.passages[1].tokens
+    assert len(index.search("数据库索引", top_k=2, token_budget=budget)) == 1
+
+
+def test_rebuild_only_tokenizes_changed_passages():
+    index = build_index()
+    changed = "\n\n".join(PASSAGES[:3] + ["全新的段落内容。"])
+    assert index.build(changed) == 1
+    assert index.build(changed) == 0
+
+
+def test_index_cache_hits_and_rebuilds():
+    cache = ContextIndexCache(max_entries=1, passage_chars=30)
+    text = "\n\n".join(PASSAGES)
+    first = cache.get_index("draft:1", text)
+    assert cache.get_index("draft:1", text) is first
+    cache.get_index("draft:1", text + "\n\n新增段落。")
+    cache.get_index("draft:2", text)
+    assert cache.stats() == {"entries": 1, "hits": 1, "builds": 2, "rebuilds": 1}
+
+
+def test_select_context(monkeypatch):
+    monkeypatch.setattr(context_retriever, "context_index_cache", ContextIndexCache(8, 30))
+    monkeypatch.setattr(context_retriever.settings, "AI_ASK_TOP_K", 2)
+    text = "\n\n".join(PASSAGES)
+
+    # 预算内原样返回
+    monkeypatch.setattr(context_retriever.settings, "AI_ASK_CONTEXT_TOKENS", 10000)
+    assert select_context("数据库", text) == text
+
+    monkeypatch.setattr(context_retriever.settings, "AI_ASK_CONTEXT_TOKENS", 40)
+    assert select_context("数据库索引", text) == PASSAGES[1] + OMITTED_SEP + PASSAGES[3]
+    # 没有相关片段时取开头预算内的部分
+    assert select_context("火星", text).startswith(PASSAGES[0])
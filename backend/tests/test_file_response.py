@@ -0,0 +1,158 @@
+"""
+本地文件下载：Range 解析、条件请求和 If-Range
+"""
+import asyncio
+import hashlib
+
+from starlette.datastructures import Headers
+
+from app.core.file_response import MAX_RANGES, RangeFileResponse, parse_range_header
+
+
+# ---------- Range 解析 ----------
+
+def test_single_and_open_ended_ranges():
+    assert parse_range_header("bytes=0-99", 1000) == [(0, 99)]
+    assert parse_range_header("bytes=900-", 1000) == [(900, 999)]
+    assert parse_range_header("bytes=990-2000", 1000) == [(990, 999)]
+
+
+def test_suffix_ranges():
+    assert parse_range_header("bytes=-100", 1000) == [(900, 999)]
+    # 后缀长度超过文件大小时返回整个文件
+    assert parse_range_header("bytes=-5000", 1000) == [(0, 999)]
+    # 长度为 0 的后缀范围不可满足
+    assert parse_range_header("bytes=-0", 1000) == []
+
+
+def test_overlapping_and_adjacent_ranges_are_merged():
+    assert parse_range_header("bytes=50-99,0-49,200-299,250-400", 1000) == [(0, 99), (200, 400)]
+    assert parse_range_header("bytes=0-0, 1-1 ,,", 1000) == [(0, 1)]
+
+
+def test_ranges_beyond_eof_are_unsatisfiable():
+    assert parse_range_header("bytes=1000-", 1000) == []
+    assert parse_range_header("bytes=1000-1999,5000-", 1000) == []
+    # 部分超出时只保留可满足的范围
+    assert parse_range_header("bytes=1000-,0-9", 1000) == [(0, 9)]
+
+
+def test_invalid_headers_are_ignored():
+    for value in ("items=0-9", "bytes=", "bytes=abc", "bytes=5", "bytes=9-5", "bytes=-x", "bytes=1-x"):
+        assert parse_range_header(value, 1000) is None, value
+    assert parse_range_header("bytes=0-9", 0) is None
+
+
+def test_too_many_ranges_fall_back_to_full_file():
+    spec = ",".join(f"{i * 10}-{i * 10 + 1}" for i in range(MAX_RANGES))
+    assert len(parse_range_header(f"bytes={spec}", 10000)) == MAX_RANGES
+    spec += f",{MAX_RANGES * 10}-{MAX_RANGES * 10 + 1}"
+    assert parse_range_header(f"bytes={spec}", 10000) is None
+    # 合并后不超过上限的仍然按范围返回
+    many = ",".join(f"{i}-{i}" for i in range(MAX_RANGES * 2))
+    assert parse_range_header(f"bytes={many}", 10000) == [(0, MAX_RANGES * 2 - 1)]
+
+
+# ---------- 条件请求 ----------
+
+CONTENT = bytes(range(256)) * 40
+
+
+def make_response(tmp_path, content_hash=True) -> RangeFileResponse:
+    path = tmp_path / "data.bin"
+    path.write_bytes(CONTENT)
+    digest = hashlib.sha256(CONTENT).hexdigest() if content_hash else None
+    return RangeFileResponse(str(path), "data.bin", content_hash=digest)
+
+
+def test_if_none_match(tmp_path):
+    response = make_response(tmp_path)
+    etag = response.etag
+    assert response._not_modified(Headers({"if-none-match": etag}))
+    assert response._not_modified(Headers({"if-none-match": f'"other", W/{etag}'}))
+    assert response._not_modified(Headers({"if-none-match": "*"}))
+    assert not response._not_modified(Headers({"if-none-match": '"other"'}))
+    # If-None-Match 存在时忽略 If-Modified-Since
+    headers = Headers({"if-none-match": '"other"', "if-modified-since": response.last_modified})
+    assert not response._not_modified(headers)
+
+
+def test_if_modified_since(tmp_path):
+    response = make_response(tmp_path)
+    assert response._not_modified(Headers({"if-modified-since": response.last_modified}))
+    assert not response._not_modified(Headers({"if-modified-since": "Thu, 01 Jan 1970 00:00:00 GMT"}))
+    assert not response._not_modified(Headers({"if-modified-since": "not a date"}))
+    assert not response._not_modified(Headers({}))
+
+
+def test_if_range(tmp_path):
+    response = make_response(tmp_path)
+    assert response._if_range_matches(response.etag)
+    assert response._if_range_matches(response.last_modified)
+    assert not response._if_range_matches('"other"')
+    assert not response._if_range_matches("W/" + response.etag)
+
+    # 弱 ETag 不能用于 If-Range
+    weak = make_response(tmp_path, content_hash=False)
+    assert weak.etag.startswith("W/")
+    assert not weak._if_range_matches(weak.etag)
+    assert not weak._if_range_matches(weak.etag[2:])
+
+
+# ---------- 完整响应 ----------
+
+def request(response: RangeFileResponse, headers: dict, method: str = "GET"):
+    scope = {
+        "type": "http",
+        "method": method,
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]
+    }
+    messages = []
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(response(scope, receive, send))
+    start = messages[0]
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return start["status"], Headers(raw=start["headers"]), body
+
+
+def test_single_range_response(tmp_path):
+    status, headers, body = request(make_response(tmp_path), {"Range": "bytes=100-199"})
+    assert status == 206
+    assert headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+    assert headers["content-length"] == "100"
+    assert body == CONTENT[100:200]
+
+
+def test_multiple_ranges_response(tmp_path):
+    status, headers, body = request(make_response(tmp_path), {"Range": "bytes=0-9,-10"})
+    assert status == 206
+    assert headers["content-type"].startswith("multipart/byteranges; boundary=")
+    assert int(headers["content-length"]) == len(body)
+    assert CONTENT[:10] in body and CONTENT[-10:] in body
+    assert body.count(b"Content-Range: bytes ") == 2
+
+
+def test_unsatisfiable_and_mismatched_if_range(tmp_path):
+    response = make_response(tmp_path)
+    status, headers, body = request(response, {"Range": f"bytes={len(CONTENT)}-"})
+    assert status == 416
+    assert headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+    status, _, body = request(make_response(tmp_path), {"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert status == 200 and body == CONTENT
+
+
+def test_not_modified_and_head(tmp_path):
+    response = make_response(tmp_path)
+    status, _, body = request(response, {"If-None-Match": response.etag})
+    assert status == 304 and body == b""
+
+    status, headers, body = request(make_response(tmp_path), {}, method="HEAD")
+    assert status == 200 and body == b""
+    assert headers["content-length"] == str(len(CONTENT))
@@ -0,0 +1,85 @@
+"""
+大纲增量解析：跨片段的行拼接、层级关系、回放和缓存
+"""
+import time
+
+from app.services.outline_parser import ROOT_ID, OutlineCache, OutlineParser
+
+MARKDOWN = (
+    "```markdown\n"
+    "下面是大纲：\n"
+    "# 总论\n"
+    "概述\n"
+    "## 背景 ##\n"
+    "### 细节\n"
+    "## 目标\n"
+    "\n"
+    "#没有空格不是标题\n"
+    "# 结论\r\n"
+    "```"
+)
+
+
+def parse(chunks):
+    parser = OutlineParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    events.extend(parser.close())
+    return parser, events
+
+
+def test_nodes_and_parents():
+    parser, events = parse([MARKDOWN])
+    nodes = [data for kind, data in events if kind == "node"]
+    assert [(n["id"], n["parent"], n["level"], n["title"]) for n in nodes] == [
+        (1, ROOT_ID, 1, "总论"),
+        (2, 1, 2, "背景"),
+        (3, 2, 3, "细节"),
+        (4, 1, 2, "目标"),
+        (5, ROOT_ID, 1, "结论")
+    ]
+    assert parser.preamble == ["下面是大纲："]
+    assert parser.nodes[0]["text"] == ["概述"]
+    assert parser.nodes[3]["text"] == ["#没有空格不是标题"]
+
+
+def test_events_are_independent_of_chunk_boundaries():
+    _, whole = parse([MARKDOWN])
+    # 逐字符输入，行在任意位置被切开
+    _, by_char = parse(list(MARKDOWN))
+    assert by_char == whole
+
+
+def test_feed_emits_only_completed_lines():
+    parser = OutlineParser()
+    assert parser.feed("# 标") == []
+    assert parser.feed("题") == []
+    assert parser.feed("\n正文") == [("node", {"id": 1, "parent": ROOT_ID, "level": 1, "title": "标题"})]
+    assert parser.close() == [("text", {"id": 1, "text": "正文"})]
+    assert parser.close() == []
+
+
+def test_result_replays_same_events():
+    parser, events = parse([MARKDOWN[:20], MARKDOWN[20:]])
+    outline = parser.result()
+    assert outline.markdown == MARKDOWN
+    assert list(outline.events()) == events
+
+
+def test_outline_cache_lru_ttl_and_empty_results():
+    cache = OutlineCache(max_entries=2, ttl=60)
+    outline = parse([MARKDOWN])[0].result()
+    cache.put("a", outline)
+    cache.put("b", outline)
+    assert cache.get("a") is outline
+    cache.put("c", outline)
+    assert cache.get("b") is None and cache.get("a") is outline
+
+    # 没有标题的结果不缓存
+    cache.put("d", parse(["只有正文"])[0].result())
+    assert cache.get("d") is None
+
+    cache._entries["a"] = (time.time() - 1, outline)
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 2
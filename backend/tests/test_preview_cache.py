@@ -0,0 +1,52 @@
+"""
+预览缓存：按内容键共用、行偏移截取、磁盘层
+"""
+from types import SimpleNamespace
+
+from app.services.preview_cache import PreviewCache, PreviewEntry, preview_key
+
+
+def make_file(file_id: int, content_hash=None, is_oss=True, file_path="", file_size=10):
+    return SimpleNamespace(
+        id=file_id, content_hash=content_hash, is_oss=is_oss, file_path=file_path,
+        file_size=file_size, updated_at=None, created_at=None
+    )
+
+
+def test_files_with_same_hash_share_one_key():
+    first, second = make_file(1, "ab" * 32), make_file(2, "ab" * 32)
+    assert preview_key(first, "text") == preview_key(second, "text")
+    assert preview_key(first, "text") != preview_key(first, "docx")
+
+
+def test_legacy_files_are_keyed_per_file():
+    assert preview_key(make_file(1), "text") != preview_key(make_file(2), "text")
+
+
+def test_entry_head_and_covers():
+    entry = PreviewEntry.from_text("a\nb\nc\n", 100, partial=True)
+    assert entry.head(2) == ("a\nb\n", True)
+    assert entry.head(5) == ("a\nb\nc\n", False)
+    assert entry.covers(2) and not entry.covers(3)
+    truncated = PreviewEntry.from_text("x" * 20, 10, partial=True)
+    assert truncated.truncated and not truncated.partial
+
+
+def test_memory_lru_respects_entry_limit():
+    cache = PreviewCache(max_entries=2, max_bytes=1 << 20)
+    for key in ("a", "b", "c"):
+        cache.put(key, PreviewEntry.from_text(key, 100))
+    assert cache.get("a") is None
+    assert cache.get("c").content == "c"
+
+
+def test_disk_layer_survives_restart_and_invalidate(tmp_path):
+    key = preview_key(make_file(1, "cd" * 32), "text")
+    PreviewCache(10, 1 << 20, disk_dir=str(tmp_path)).put(key, PreviewEntry.from_text("hello\n", 100))
+
+    restarted = PreviewCache(10, 1 << 20, disk_dir=str(tmp_path))
+    assert restarted.get(key).content == "hello\n"
+    assert restarted.disk_hits == 1
+
+    restarted.invalidate(key)
+    assert PreviewCache(10, 1 << 20, disk_dir=str(tmp_path)).get(key) is None
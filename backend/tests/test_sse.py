@@ -0,0 +1,90 @@
+"""
+SSE 帧编码、增量合并和取消传递
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.services.sse import coalesce_chunks, encode_content, encode_error, format_sse
+
+
+async def timed_source(items, delay: float, closed: list = None):
+    try:
+        for item in items:
+            await asyncio.sleep(delay)
+            yield item
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+
+async def collect(source):
+    return [chunk async for chunk in source]
+
+
+def test_format_sse_splits_lines():
+    assert format_sse("a\nb", event="node", event_id="3") == "id: 3\nevent: node\ndata: a\ndata: b\n\n"
+    assert format_sse("x") == "data: x\n\n"
+
+
+def test_encoded_payloads_stay_on_one_line():
+    payload = encode_content("第一行\n第二行")
+    assert "\n" not in payload
+    assert json.loads(payload) == {"content": "第一行\n第二行"}
+    assert encode_error("bad\nthing") == "[ERROR] bad thing"
+
+
+def test_first_chunk_is_immediate_and_rest_are_merged():
+    items = [str(i) for i in range(10)]
+    frames = asyncio.run(collect(coalesce_chunks(timed_source(items, 0.001), max_delay=1, max_bytes=1000)))
+    assert frames[0] == "0"
+    assert "".join(frames) == "0123456789"
+    assert len(frames) == 2
+
+
+def test_frames_are_flushed_at_byte_limit():
+    items = ["ab"] * 6
+    frames = asyncio.run(collect(coalesce_chunks(timed_source(items, 0), max_delay=10, max_bytes=4)))
+    assert frames == ["ab", "abab", "abab", "ab"]
+
+
+def test_frames_are_flushed_when_window_expires():
+    items = ["a", "b", "c", "d"]
+    frames = asyncio.run(collect(coalesce_chunks(timed_source(items, 0.03), max_delay=0.01, max_bytes=1000)))
+    assert frames == items
+
+
+def test_zero_delay_passes_chunks_through():
+    items = ["a", "b", "c"]
+    assert asyncio.run(collect(coalesce_chunks(timed_source(items, 0), max_delay=0, max_bytes=1))) == items
+
+
+def test_buffered_content_is_flushed_before_error():
+    async def failing():
+        yield "a"
+        yield "b"
+        yield "c"
+        raise RuntimeError("upstream")
+
+    frames = []
+
+    async def run():
+        async for frame in coalesce_chunks(failing(), max_delay=10, max_bytes=1000):
+            frames.append(frame)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+    assert frames == ["a", "bc"]
+
+
+def test_closing_early_cancels_pending_chunk_and_closes_source():
+    closed = []
+
+    async def run():
+        stream = coalesce_chunks(timed_source(["a"] * 100, 0.05, closed), max_delay=0.01, max_bytes=1000)
+        assert await stream.__anext__() == "a"
+        await stream.aclose()
+
+    asyncio.run(run())
+    assert closed == [True]
@@ -0,0 +1,45 @@
+"""
+长文本切分：段落合并、标题分节、超长段落按句切分
+"""
+from app.services.text_chunker import PARAGRAPH_SEP, split_paragraphs, split_sentences, split_text
+
+
+def rebuild(chunks):
+    return "".join(chunk + sep for chunk, sep in chunks)
+
+
+def test_split_paragraphs_keeps_headings_separate():
+    text = "# 标题\n第一行\n第二行\n\n\n第二段\n## 小节\n正文"
+    assert split_paragraphs(text) == ["# 标题", "第一行\n第二行", "第二段", "## 小节", "正文"]
+
+
+def test_short_paragraphs_are_merged():
+    text = "甲" * 10 + "\n\n" + "乙" * 10 + "\n\n" + "丙" * 10
+    chunks = split_text(text, 30)
+    assert chunks == [("甲" * 10 + PARAGRAPH_SEP + "乙" * 10, PARAGRAPH_SEP), ("丙" * 10, "")]
+    assert rebuild(chunks) == text
+
+
+def test_heading_starts_new_chunk_when_current_is_half_full():
+    text = "正" * 60 + "\n\n# 下一节\n\n" + "文" * 10
+    chunks = split_text(text, 100)
+    assert [chunk for chunk, _ in chunks] == ["正" * 60, "# 下一节" + PARAGRAPH_SEP + "文" * 10]
+
+
+def test_long_paragraph_is_split_at_sentence_ends():
+    paragraph = "这是第一句。" * 5 + "This is English. Another one! 还有一句？"
+    chunks = split_text(paragraph + "\n\n结尾", 20)
+    assert all(len(chunk) <= 20 for chunk, _ in chunks)
+    assert rebuild(chunks) == paragraph + PARAGRAPH_SEP + "结尾"
+    # 英文句间空格作为分隔符保留，不留在片段开头
+    assert not any(chunk.startswith(" ") for chunk, _ in chunks)
+
+
+def test_single_sentence_longer_than_limit_is_hard_split():
+    pieces = split_sentences("字" * 25, 10)
+    assert pieces == [("字" * 10, ""), ("字" * 10, ""), ("字" * 5, "")]
+
+
+def test_empty_text():
+    assert split_text("", 100) == []
+    assert split_text("\n\n  \n", 100) == []
@@ -6,6 +6,10 @@ export interface AIRequest {
   text: string
   action: AIAction
   custom_prompt?: string
+  draft_id?: number        // 问答模式：text 为空时以该草稿全文为参考内容
+  coalesce_ms?: number     // 流式输出时增量合并的最大等待毫秒数，0 表示不合并
+  coalesce_bytes?: number  // 流式输出时单帧最大字节数
+  resumable?: boolean      // 断线后是否允许续传；streamAI 默认开启，服务端默认关闭
 }
 
 export interface AIResponse {
@@ -14,6 +18,18 @@ export interface AIResponse {
   action: string
 }
 
+export interface AIBatchItem extends AIRequest {
+  id: string
+}
+
+export interface AIBatchResult {
+  id: string
+  action: string
+  success: boolean
+  result?: string
+  error?: string
+}
+
 export interface AIActionInfo {
   id: AIAction
   name: string
@@ -33,9 +49,13 @@ export const processAI = (data: AIRequest) => {
   })
 }
 
+// 流式输出断线后的最大续传次数
+const STREAM_RESUME_RETRIES = 3
+
 /**
  * 流式 AI 处理
  * 返回一个可以读取流式响应的函数
+ * 连接中断时携带 Last-Event-ID 从断点续传（服务端继续生成并缓冲输出，不会重新调用模型）
  */
 export const streamAI = async (
   data: AIRequest,
@@ -45,9 +65,110 @@ export const streamAI = async (
 ) => {
   const token = localStorage.getItem('token')
   const baseUrl = import.meta.env.VITE_API_BASE_URL || '/api'
+  let streamId = ''
+  let lastEventId = ''
   
+  // 读取一次 SSE 响应；返回 true 表示流已结束（完成或出错）
+  const readStream = async (response: Response): Promise<boolean> => {
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`)
+    }
+    streamId = response.headers.get('X-Stream-Id') || streamId
+
+    const reader = response.body?.getReader()
+    if (!reader) {
+      throw new Error('无法读取响应流')
+    }
+
+    const decoder = new TextDecoder()
+    let buffer = ''
+    let eventId = ''
+    
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) return false
+      
+      // 一个 SSE 帧可能跨多次读取，保留最后一行不完整的内容
+      buffer += decoder.decode(value, { stream: true })
+      const lines = buffer.split('\n')
+      buffer = lines.pop() || ''
+      
+      for (const line of lines) {
+        if (line.startsWith('id: ')) {
+          eventId = line.slice(4)
+        } else if (line.startsWith('data: ')) {
+          const data = line.slice(6)
+          if (data === '[DONE]') {
+            onDone()
+            return true
+          }
+          if (data.startsWith('[ERROR]')) {
+            onError(data.slice(8))
+            return true
+          }
+          // 内容帧为 JSON：{"content": "..."}，可以包含换行
+          onChunk(JSON.parse(data).content)
+          if (eventId) lastEventId = eventId
+        }
+      }
+    }
+  }
+
+  const headers = {
+    'Content-Type': 'application/json',
+    'Authorization': `Bearer ${token}`
+  }
+  let lastError: unknown = null
+
+  for (let attempt = 0; attempt <= STREAM_RESUME_RETRIES; attempt++) {
+    try {
+      const response = attempt === 0 || !streamId
+        ? await fetch(`${baseUrl}/ai/stream`, {
+            method: 'POST',
+            headers,
+            // 本函数会断线重连，默认请求服务端保留生成以便续传
+            body: JSON.stringify({ resumable: true, ...data })
+          })
+        : await fetch(`${baseUrl}/ai/stream/${streamId}`, {
+            headers: lastEventId ? { ...headers, 'Last-Event-ID': lastEventId } : headers
+          })
+      if (await readStream(response)) return
+      lastError = new Error('连接中断')
+    } catch (error) {
+      lastError = error
+      // 还没拿到流 ID 或服务端拒绝续传（如 410）时不再重试
+      if (!streamId || (error instanceof Error && error.message.startsWith('HTTP error'))) break
+    }
+  }
+
+  onError(lastError instanceof Error ? lastError.message : '请求失败')
+}
+
+export interface AIMultiRequest {
+  text: string
+  actions: AIAction[]
+  custom_prompt?: string
+  coalesce_ms?: number
+  coalesce_bytes?: number
+}
+
+/**
+ * 多操作流式对比
+ * 同一段文本的多个操作在一个 SSE 连接上并发生成，按操作分别回调片段、完成和错误
+ */
+export const streamMultiAI = async (
+  data: AIMultiRequest,
+  onChunk: (action: AIAction, chunk: string) => void,
+  onActionDone: (action: AIAction) => void,
+  onActionError: (action: AIAction, error: string) => void,
+  onDone: () => void,
+  onError: (error: string) => void
+) => {
+  const token = localStorage.getItem('token')
+  const baseUrl = import.meta.env.VITE_API_BASE_URL || '/api'
+
   try {
-    const response = await fetch(`${baseUrl}/ai/stream`, {
+    const response = await fetch(`${baseUrl}/ai/stream/multi`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -66,30 +187,188 @@ export const streamAI = async (
     }
 
     const decoder = new TextDecoder()
-    
+    let buffer = ''
+    let event = ''
+
     while (true) {
       const { done, value } = await reader.read()
       if (done) break
-      
-      const text = decoder.decode(value, { stream: true })
-      const lines = text.split('\n')
-      
+
+      buffer += decoder.decode(value, { stream: true })
+      const lines = buffer.split('\n')
+      buffer = lines.pop() || ''
+
       for (const line of lines) {
-        if (line.startsWith('data: ')) {
-          const data = line.slice(6)
-          if (data === '[DONE]') {
+        if (line.startsWith('event: ')) {
+          event = line.slice(7)
+        } else if (line.startsWith('data: ')) {
+          const payload = line.slice(6)
+          if (payload === '[DONE]') {
             onDone()
             return
           }
-          if (data.startsWith('[ERROR]')) {
-            onError(data.slice(8))
+          // 每帧为 JSON，action 标明所属操作
+          const frame = JSON.parse(payload)
+          if (event === 'error') {
+            onActionError(frame.action, frame.message)
+          } else if (event === 'done') {
+            onActionDone(frame.action)
+          } else {
+            onChunk(frame.action, frame.content)
+          }
+          event = ''
+        }
+      }
+    }
+
+    onDone()
+  } catch (error) {
+    onError(error instanceof Error ? error.message : '请求失败')
+  }
+}
+
+export interface AIOutlineRequest {
+  topic: string
+  report_type?: string
+  audience?: string
+  additional_requirements?: string
+  refresh?: boolean
+}
+
+export interface OutlineNode {
+  id: number
+  parent: number
+  level: number
+  title: string
+}
+
+/**
+ * 结构化大纲流
+ * 服务端逐行解析模型输出的 Markdown 大纲：每读完一个标题回调 onNode，说明文字回调 onText（id 为 0 表示第一个标题之前的内容）
+ */
+export const streamOutline = async (
+  data: AIOutlineRequest,
+  onNode: (node: OutlineNode) => void,
+  onText: (id: number, text: string) => void,
+  onDone: () => void,
+  onError: (error: string) => void
+) => {
+  const token = localStorage.getItem('token')
+  const baseUrl = import.meta.env.VITE_API_BASE_URL || '/api'
+
+  try {
+    const response = await fetch(`${baseUrl}/ai/stream/outline`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Authorization': `Bearer ${token}`
+      },
+      body: JSON.stringify(data)
+    })
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`)
+    }
+
+    const reader = response.body?.getReader()
+    if (!reader) {
+      throw new Error('无法读取响应流')
+    }
+
+    const decoder = new TextDecoder()
+    let buffer = ''
+    let event = ''
+
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+
+      buffer += decoder.decode(value, { stream: true })
+      const lines = buffer.split('\n')
+      buffer = lines.pop() || ''
+
+      for (const line of lines) {
+        if (line.startsWith('event: ')) {
+          event = line.slice(7)
+        } else if (line.startsWith('data: ')) {
+          const payload = line.slice(6)
+          if (payload === '[DONE]') {
+            onDone()
             return
           }
-          onChunk(data)
+          const frame = JSON.parse(payload)
+          if (event === 'error') {
+            onError(frame.message)
+            return
+          } else if (event === 'node') {
+            onNode(frame)
+          } else {
+            onText(frame.id, frame.text)
+          }
+          event = ''
         }
       }
     }
-    
+
+    onDone()
+  } catch (error) {
+    onError(error instanceof Error ? error.message : '请求失败')
+  }
+}
+
+/**
+ * 批量 AI 处理
+ * 服务端并发处理各项，每完成一项回调一次（NDJSON 流）
+ */
+export const batchAI = async (
+  items: AIBatchItem[],
+  onResult: (result: AIBatchResult) => void,
+  onDone: () => void,
+  onError: (error: string) => void
+) => {
+  const token = localStorage.getItem('token')
+  const baseUrl = import.meta.env.VITE_API_BASE_URL || '/api'
+
+  try {
+    const response = await fetch(`${baseUrl}/ai/batch`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Authorization': `Bearer ${token}`
+      },
+      body: JSON.stringify({ items })
+    })
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`)
+    }
+
+    const reader = response.body?.getReader()
+    if (!reader) {
+      throw new Error('无法读取响应流')
+    }
+
+    const decoder = new TextDecoder()
+    let buffer = ''
+
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+
+      buffer += decoder.decode(value, { stream: true })
+      const lines = buffer.split('\n')
+      buffer = lines.pop() || ''
+
+      for (const line of lines) {
+        if (line.trim()) {
+          onResult(JSON.parse(line))
+        }
+      }
+    }
+
+    if (buffer.trim()) {
+      onResult(JSON.parse(buffer))
+    }
     onDone()
   } catch (error) {
     onError(error instanceof Error ? error.message : '请求失败')
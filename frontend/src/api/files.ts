@@ -16,19 +16,34 @@ export const uploadFile = (file: File, fileType: FileType) => {
   })
 }
 
+// OSS 上传中断（网络错误或服务端 5xx）后的重试次数，重试时服务端跳过已上传的分片
+const OSS_UPLOAD_RETRIES = 2
+
 /**
  * 上传文件到阿里云OSS
+ * 大文件在服务端分片上传；resume_key 标识同一个文件，中断后重试可以续传
  */
-export const uploadFileToOSS = (file: File, fileType: FileType) => {
-  const formData = new FormData()
-  formData.append('file', file)
+export const uploadFileToOSS = async (file: File, fileType: FileType) => {
+  const resumeKey = `${file.name}:${file.size}:${file.lastModified}`
 
-  return request<FileInfo>({
-    url: '/files/upload-oss',
-    method: 'post',
-    params: { file_type: fileType },
-    data: formData,
-  })
+  for (let attempt = 0; ; attempt++) {
+    const formData = new FormData()
+    formData.append('file', file)
+    try {
+      return await request<FileInfo>({
+        url: '/files/upload-oss',
+        method: 'post',
+        params: { file_type: fileType, resume_key: resumeKey },
+        data: formData,
+        // 大文件上传耗时取决于文件大小，不使用默认的 15 秒超时
+        timeout: 0,
+      })
+    } catch (error: any) {
+      const status = error?.response?.status
+      const retryable = !status || status >= 500
+      if (!retryable || attempt >= OSS_UPLOAD_RETRIES) throw error
+    }
+  }
 }
 
 /**
@@ -40,6 +40,7 @@ export interface FileInfo {
   is_oss: boolean
   oss_path: string | null
   oss_url: string | null
+  content_hash?: string | null
   created_at: string
   updated_at: string
 }
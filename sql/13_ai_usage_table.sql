@@ -0,0 +1,26 @@
+-- ============================================
+-- AIReportLab IMS AI 用量表
+-- 文件: 13_ai_usage_table.sql
+-- 描述: 按用户、操作和统计周期汇总的 AI token 用量（后端定时批量写入）
+-- ============================================
+
+USE `aireportlab_db`;
+
+DROP TABLE IF EXISTS `ai_usage`;
+CREATE TABLE `ai_usage` (
+    `id` INT NOT NULL AUTO_INCREMENT,
+    `user_id` INT DEFAULT NULL COMMENT '用户ID（脚本等无用户的调用为空）',
+    `action` VARCHAR(32) NOT NULL COMMENT '操作类型',
+    `calls` INT NOT NULL DEFAULT 0 COMMENT '上游调用次数',
+    `prompt_tokens` INT NOT NULL DEFAULT 0 COMMENT '输入 token 数',
+    `completion_tokens` INT NOT NULL DEFAULT 0 COMMENT '输出 token 数',
+    `cache_hit_tokens` INT NOT NULL DEFAULT 0 COMMENT '命中前缀缓存的输入 token 数',
+    `period_start` DATETIME NOT NULL COMMENT '统计周期开始时间',
+    `period_end` DATETIME NOT NULL COMMENT '统计周期结束时间',
+    `created_at` DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '写入时间',
+    PRIMARY KEY (`id`),
+    KEY `ix_ai_usage_user_period` (`user_id`, `period_start`),
+    CONSTRAINT `fk_ai_usage_user_id` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='AI 用量表';
+
+SELECT 'AI 用量表创建成功！' AS message;
@@ -0,0 +1,13 @@
+-- ============================================
+-- AIReportLab IMS 文件内容哈希
+-- 文件: 14_files_content_hash.sql
+-- 描述: 为文件表增加内容 SHA-256，相同内容的文件共用一份存储（按哈希统计引用）
+-- ============================================
+
+USE `aireportlab_db`;
+
+ALTER TABLE `files`
+    ADD COLUMN `content_hash` VARCHAR(64) DEFAULT NULL COMMENT '文件内容 SHA-256（为空表示去重上线前上传的文件）' AFTER `oss_url`,
+    ADD KEY `ix_files_content_hash` (`content_hash`);
+
+SELECT '文件内容哈希字段添加成功！' AS message;